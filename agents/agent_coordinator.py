@@ -1,18 +1,23 @@
 from agents import AgentManager
+from agents.agent_manager import WORLD_DATA_DIR, WORLD_MEMORY_BUDGET
+from worlds import WorldRegistry
 # from server import SocketCoordinator
 
 class AgentCoordinator:
     def __init__(self):
         self.agents = []
         self.socket_agent_map = {}
+        # Every agent maps into the same worlds so that they can use each other's scans
+        self.world_registry = WorldRegistry(WORLD_DATA_DIR, WORLD_MEMORY_BUDGET)
 
     def add_agent(self, socket_manager):
-        agent = AgentManager(socket_manager)
+        agent = AgentManager(socket_manager, self.world_registry)
         self.agents.append(agent)
         self.socket_agent_map[socket_manager] = agent
     
     def remove_agent(self, socket_manager):
         agent = self.socket_agent_map[socket_manager]
         self.agents.remove(agent)
+        self.world_registry.unregister_agent(agent.id)
         del self.socket_agent_map[socket_manager]
         print("Removed agent", socket_manager.address)
\ No newline at end of file
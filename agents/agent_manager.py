@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 import asyncio
-from typing import Any, List, Union
+import os
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from server import TopicSocketManager
 from models import CommandSet, SetResponse, SetStatus, CommandReq
@@ -9,17 +10,49 @@ from agents.commands import Command, command_class_map, InitializeCommand
 from models.failures import CommandException, FailureID
 
 from tasks import PokeHoleTask, SpeakTestTask, PokeHoleTaskV2, ScanTestTask, SolveMazeTask, PathPlanTask, ScanAndPathfindTask
-from worlds import SubWorld
+from worlds import SubWorld, WorldRegistry, AgentFrame, world_to_shared, export_npz_async
 from models.__agent_models import StateLocation, AgentState
 from models.__world_models import BlockData
 
+WORLD_DATA_DIR = "world_data"
+WORLD_EXPORT_DIR = "world_exports"
+WORLD_SNAPSHOT_INTERVAL = 60  # Seconds between compacting the world's mutation log into a snapshot
+WORLD_MEMORY_BUDGET = 512 << 20  # Bytes of voxels each world keeps in memory before spilling chunks to disk
+# How the agent reports its start facing as a world orientation {x, z}
+ORIENTATION_FACINGS: Dict[Tuple[int, int], str] = {(1, 0): "east", (-1, 0): "west", (0, -1): "north", (0, 1): "south"}
+
+def parse_start_position(value: Any) -> Tuple[int, int, int]:
+    """
+    Reads the START_POSITION handshake field, which the agent sends as {x, y, z} when it knows where it is or as the "x y z" an operator typed in
+    """
+    if isinstance(value, dict):
+        return int(value["x"]), int(value["y"]), int(value["z"])
+    parts = str(value).replace(",", " ").split()
+    if len(parts) != 3:
+        raise ValueError(f"Expected a start position as x y z, got {value!r}")
+    x, y, z = (int(part) for part in parts)
+    return x, y, z
+
+def parse_start_facing(value: Any) -> str:
+    """
+    Reads the START_FACING handshake field, which the agent sends as an orientation {x, z} or as the cardinal direction an operator typed in
+    """
+    if isinstance(value, dict):
+        orientation = (int(value.get("x", 0)), int(value.get("z", 0)))
+        if orientation not in ORIENTATION_FACINGS:
+            raise ValueError(f"Expected a start facing along one horizontal axis, got {value!r}")
+        return ORIENTATION_FACINGS[orientation]
+    return str(value).strip().lower()
+
 class AgentManager:
-    def __init__(self, socket_manager: TopicSocketManager):
+    def __init__(self, socket_manager: TopicSocketManager, world_registry: WorldRegistry, start_frame: Optional[AgentFrame] = None):
         print('New agent')
         self.socket_manager = socket_manager
+        self.world_registry = world_registry
         self.initialized = False
         self.id = None
         self.label = None
+        self.start_frame = start_frame  # Where the agent started in the shared frame. The handshake fills this in unless it was given
         asyncio.ensure_future(self.initialize())
 
     async def initialize(self):
@@ -29,36 +62,42 @@ class AgentManager:
         await asyncio.sleep(0.1)
         command = InitializeCommand(self)
         res: InitializeResData = await self.send_command(command)
+        start_position, start_facing = None, None
         for field in res.initializedFields:
             print(field)
             if field.fieldId == FieldID.ID:
                 self.id = field.value
             elif field.fieldId == FieldID.LABEL:
                 self.label = field.value
+            elif field.fieldId == FieldID.START_POSITION:
+                start_position = parse_start_position(field.value)
+            elif field.fieldId == FieldID.START_FACING:
+                start_facing = parse_start_facing(field.value)
         print(f'Initialized agent {self.id} with label {self.label}')
-        
+        if self.start_frame is None:
+            if start_position is None or start_facing is None:
+                raise ValueError(f"Agent {self.id} did not report where it started and no start frame was given")
+            self.start_frame = AgentFrame.from_world(*start_position, facing=start_facing)
+            print(f'Agent {self.id} started at {start_position} facing {start_facing}')
+
         # TODO: Remove this test task
-        test_world = SubWorld()
+        frame = self.start_frame
+        self.world_registry.register_agent(self.id, frame)
+        test_world = self.world_registry.get_agent_world(self.id)
 
         # test_task = PokeHoleTask(self, 10)
         # test_task = PokeHoleTaskV2(self, 120, notify=True)
         # test_task = SpeakTestTask(self)
         # test_task = ScanTestTask(self, 1)
         # test_task = SolveMazeTask(self, test_world, sight_radius=8, goal_block="minecraft:gold_block", scan_every=None)
-        x_start = -234
-        y_start = 75
-        z_start = -326
-
         x_1, y_1, z_1 = -228, 13, -310
 
-        def to_goal(x, y, z, inverse=False):
-            return AgentState(location=StateLocation(
-                forward=x - x_start * (-1 if inverse else 1),
-                up=y - y_start * (-1 if inverse else 1),
-                side=(z - z_start) * (1 if inverse else -1)
-            ))
+        def to_goal(x, y, z):
+            forward, side, up = world_to_shared(x, y, z)
+            return AgentState(location=StateLocation(forward=forward, side=side, up=up))
 
-        test_task = ScanAndPathfindTask(self, test_world, goal=to_goal(x_1, y_1, z_1, inverse=False))
+        test_task = ScanAndPathfindTask(self, test_world, goal=to_goal(x_1, y_1, z_1), frame=frame)
+        snapshot_loop = asyncio.ensure_future(self.snapshot_world(test_world))
 
         # for x in range(0, 10):
         #     for z in range(0, 10):
@@ -76,8 +115,20 @@ class AgentManager:
         # goal_state = AgentState(location=StateLocation(forward=0, up=0, side=2))
         # test_task = PathPlanTask(self, test_world, goal_state)
 
-        await test_task.run()
-        test_world.show()
+        try:
+            await test_task.run()
+        finally:
+            snapshot_loop.cancel()
+            await test_world.flush_async()
+        await export_npz_async(test_world, os.path.join(WORLD_EXPORT_DIR, f"{self.id}.npz"))
+
+    async def snapshot_world(self, world: SubWorld):
+        """
+        Every change to the world is logged as it happens, but we periodically snapshot it so that the log stays short and replay stays fast
+        """
+        while True:
+            await asyncio.sleep(WORLD_SNAPSHOT_INTERVAL)
+            await world.flush_async()
 
     def command_to_req(self, command: Command) -> CommandReq:
         data = command.format_data()
@@ -15,6 +15,7 @@ from .drop import DropCommand
 from .scan import ScanCommand
 from .write_file import WriteFileCommand
 from .get_state import GetStateCommand
+from .analyze_chunk import AnalyzeChunkCommand
 
 from models.commands import CommandID
 command_class_map = {
@@ -33,4 +34,5 @@ command_class_map = {
     ScanCommand: CommandID.SCAN,
     WriteFileCommand: CommandID.WRITE_FILE,
     GetStateCommand: CommandID.GET_STATE,
+    AnalyzeChunkCommand: CommandID.ANALYZE_CHUNK,
 }
\ No newline at end of file
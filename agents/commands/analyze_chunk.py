@@ -0,0 +1,26 @@
+from typing import List, TYPE_CHECKING
+
+from .__command import Command
+from requirements import AgentRequirementID
+from models.commands import AnalyzeChunkReqData, AnalyzeChunkResData
+
+if TYPE_CHECKING:
+    from agents import AgentManager
+
+class AnalyzeChunkCommand(Command[AnalyzeChunkReqData, AnalyzeChunkResData]):
+    def __init__(
+        self, agent_manager: 'AgentManager',
+    ):
+        super().__init__(agent_manager)
+
+    def format_data(self) -> AnalyzeChunkReqData:
+        return AnalyzeChunkReqData()
+
+    def get_agent_requirements(self) -> List[AgentRequirementID]:
+        return [AgentRequirementID.CAN_SCAN]
+
+    def get_fuel_requirement(self) -> int:
+        return 0
+
+    def get_time_requirement(self) -> int:
+        return 1
@@ -14,7 +14,9 @@ class InitializeCommand(Command[InitializeReqData, InitializeResData]):
         return InitializeReqData(
             requiredFields=[
                 FieldRequirement(fieldId=FieldID.ID, fieldName="ID", fieldDescription="The ID of the agent"),
-                FieldRequirement(fieldId=FieldID.LABEL, fieldName="Label", fieldDescription="The label of the agent")
+                FieldRequirement(fieldId=FieldID.LABEL, fieldName="Label", fieldDescription="The label of the agent"),
+                FieldRequirement(fieldId=FieldID.START_POSITION, fieldName="Start Position", fieldDescription="The world coordinates the agent started at, as x y z"),
+                FieldRequirement(fieldId=FieldID.START_FACING, fieldName="Start Facing", fieldDescription="The direction the agent faced when it started: east, west, north or south"),
             ]
         )
 
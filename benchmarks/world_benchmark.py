@@ -0,0 +1,293 @@
+"""
+Benchmarks how SubWorld scales with the number of voxels it holds.
+
+Synthetic scenes (caves, mazes and open terrain) are cut into scan cubes shaped like real ScanResData payloads and ingested into a fresh world.
+For every scene and size we record ingest throughput, memory per voxel and point query latency, and write everything as JSON so storage changes can be compared over time.
+
+Run from the repository root:
+    python -m benchmarks.world_benchmark --sizes 1e4 1e5 1e6 1e7 --output benchmark_results/world.json
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from models.__agent_models import StateLocation
+from models.__world_models import BlockData
+from models.commands import ScanResData
+from worlds import SubWorld
+
+SCAN_RADIUS = 8  # The default radius of ScanCommand
+SCAN_SIZE = 2 * SCAN_RADIUS + 1
+NAMES = ["minecraft:air", "minecraft:stone", "minecraft:dirt", "minecraft:grass_block", "minecraft:coal_ore", "minecraft:iron_ore"]
+DEFAULT_SIZES = [1e4, 1e5, 1e6, 1e7]
+DEFAULT_QUERIES = 20000
+SET_BLOCKS_MAX_VOXELS = 100000  # set_blocks builds a model per voxel so it is only run on the smaller sizes
+
+def _scene_shape(num_voxels: int) -> Tuple[int, int, int]:
+    """
+    Picks a cube made of whole scans with roughly num_voxels voxels
+    """
+    scans_per_axis = max(1, round((num_voxels ** (1 / 3)) / SCAN_SIZE))
+    return (scans_per_axis * SCAN_SIZE,) * 3
+
+def _smooth(field: np.ndarray, width: int) -> np.ndarray:
+    """
+    Box blurs a field along every axis using cumulative sums
+    """
+    for axis in range(field.ndim):
+        padded = np.concatenate([np.take(field, range(width), axis=axis), field], axis=axis)
+        summed = np.cumsum(padded, axis=axis)
+        field = (np.take(summed, range(width, summed.shape[axis]), axis=axis) - np.take(summed, range(summed.shape[axis] - width), axis=axis)) / width
+    return field
+
+def generate_caves(shape: Tuple[int, int, int], rng: np.random.Generator) -> np.ndarray:
+    noise = _smooth(_smooth(rng.random(shape, dtype=np.float32), 5), 5)
+    scene = np.where(noise < np.quantile(noise, 0.4), 0, 1).astype(np.uint8)
+    ores = (scene == 1) & (rng.random(shape) < 0.02)
+    scene[ores] = rng.integers(4, 6, ores.sum())
+    return scene
+
+def generate_maze(shape: Tuple[int, int, int], rng: np.random.Generator) -> np.ndarray:
+    """
+    A perfect maze carved into stone on the bottom few layers with open air above it
+    """
+    forward, side, up = shape
+    cells_forward, cells_side = (forward - 1) // 2, (side - 1) // 2
+    walls = np.ones((forward, side), dtype=bool)
+    visited = np.zeros((cells_forward, cells_side), dtype=bool)
+    stack = [(0, 0)]
+    visited[0, 0] = True
+    walls[1, 1] = False
+    while len(stack) > 0:
+        f, s = stack[-1]
+        options = [(f + df, s + ds) for df, ds in ((1, 0), (-1, 0), (0, 1), (0, -1)) if 0 <= f + df < cells_forward and 0 <= s + ds < cells_side and not visited[f + df, s + ds]]
+        if len(options) == 0:
+            stack.pop()
+            continue
+        nf, ns = options[rng.integers(len(options))]
+        visited[nf, ns] = True
+        walls[2 * nf + 1, 2 * ns + 1] = False
+        walls[f + nf + 1, s + ns + 1] = False
+        stack.append((nf, ns))
+    scene = np.zeros(shape, dtype=np.uint8)
+    scene[:, :, 0] = 1
+    scene[:, :, 1:4] = walls[:, :, None]
+    return scene
+
+def generate_terrain(shape: Tuple[int, int, int], rng: np.random.Generator) -> np.ndarray:
+    forward, side, up = shape
+    f, s = np.meshgrid(np.arange(forward), np.arange(side), indexing="ij")
+    height = up / 2
+    for _ in range(4):
+        frequency, phase = rng.uniform(0.01, 0.1, 2), rng.uniform(0, 2 * np.pi, 2)
+        height = height + up / 16 * np.sin(f * frequency[0] + phase[0]) * np.cos(s * frequency[1] + phase[1])
+    height = height.astype(np.int64)[:, :, None]
+    levels = np.arange(up)[None, None, :]
+    scene = np.zeros(shape, dtype=np.uint8)
+    scene[levels < height - 3] = 1
+    scene[(levels >= height - 3) & (levels < height)] = 2
+    scene[levels == height] = 3
+    return scene
+
+SCENARIOS: Dict[str, Callable[[Tuple[int, int, int], np.random.Generator], np.ndarray]] = {
+    "caves": generate_caves,
+    "maze": generate_maze,
+    "terrain": generate_terrain,
+}
+
+def iter_scans(scene: np.ndarray) -> Iterator[ScanResData]:
+    """
+    Cuts a scene into scan cubes and yields them as ScanResData payloads holding only the solid blocks, like the scanner sends them
+    """
+    names = np.array(NAMES)
+    for f in range(0, scene.shape[0], SCAN_SIZE):
+        for s in range(0, scene.shape[1], SCAN_SIZE):
+            for u in range(0, scene.shape[2], SCAN_SIZE):
+                cube = scene[f:f + SCAN_SIZE, s:s + SCAN_SIZE, u:u + SCAN_SIZE]
+                solid = np.argwhere(cube != 0)
+                blocks = [(forward, side, up, name) for (forward, side, up), name in zip((solid + (f, s, u)).tolist(), names[cube[tuple(solid.T)]].tolist())]
+                center = (f + SCAN_RADIUS, s + SCAN_RADIUS, u + SCAN_RADIUS)
+                # construct skips the per block validation, which is measured separately
+                yield ScanResData.construct(blocks=blocks, radius=SCAN_RADIUS, center=center)
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Peak rather than current, but the best we have
+
+def _store_bytes(world: SubWorld) -> int:
+    """
+    Bytes actually held by loaded chunks. Uniform chunks are broadcasts of a single value so they only hold one item.
+    """
+    return sum(chunk.itemsize if chunk.strides == (0, 0, 0) else chunk.nbytes for chunk in world._store._chunks.values())
+
+def _ingest(scene: np.ndarray) -> Tuple[SubWorld, float, int]:
+    world = SubWorld()
+    elapsed = 0.0
+    num_scans = 0
+    for scan in iter_scans(scene):
+        start = time.perf_counter()
+        world.ingest_scan(scan)
+        elapsed += time.perf_counter() - start
+        num_scans += 1
+    return world, elapsed, num_scans
+
+def bench_ingest(scene: np.ndarray, trace_memory: bool) -> Tuple[SubWorld, Dict[str, Any]]:
+    num_voxels = scene.size
+    gc.collect()
+    rss_before = _rss_bytes()
+    world, elapsed, num_scans = _ingest(scene)
+    result = {
+        "scans": num_scans,
+        "seconds": elapsed,
+        "voxels_per_second": num_voxels / elapsed,
+        "rss_bytes_per_voxel": (_rss_bytes() - rss_before) / num_voxels,
+        "store_bytes_per_voxel": _store_bytes(world) / num_voxels,
+        "occupancy_bytes_per_voxel": world.occupancy.nbytes / num_voxels,
+    }
+    if trace_memory:
+        # A second, untimed pass since tracing allocations slows ingest down considerably
+        del world
+        gc.collect()
+        tracemalloc.start()
+        world, _, _ = _ingest(scene)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["traced_bytes_per_voxel"] = current / num_voxels
+        result["traced_peak_bytes_per_voxel"] = peak / num_voxels
+    return world, result
+
+def bench_parse(scene: np.ndarray, max_voxels: int) -> Dict[str, Any]:
+    """
+    Times validating raw scan payloads into ScanResData the way the socket layer does
+    """
+    payloads = []
+    num_voxels = 0
+    for scan in iter_scans(scene):
+        payloads.append({"blocks": [list(block) for block in scan.blocks], "radius": scan.radius, "center": list(scan.center)})
+        num_voxels += SCAN_SIZE ** 3
+        if num_voxels >= max_voxels:
+            break
+    start = time.perf_counter()
+    for payload in payloads:
+        ScanResData.parse_obj(payload)
+    elapsed = time.perf_counter() - start
+    return {"voxels": num_voxels, "seconds": elapsed, "voxels_per_second": num_voxels / elapsed}
+
+def bench_set_blocks(scene: np.ndarray) -> Dict[str, Any]:
+    """
+    Times the model based set_blocks path with every voxel of the scene, air included
+    """
+    blocks = {name: BlockData(name=name) for name in NAMES}
+    coords = np.argwhere(np.ones(scene.shape, dtype=bool))
+    entries = [
+        (StateLocation(forward=f, side=s, up=u), blocks[NAMES[name]])
+        for (f, s, u), name in zip(coords.tolist(), scene.reshape(-1).tolist())
+    ]
+    world = SubWorld()
+    start = time.perf_counter()
+    world.set_blocks(entries)
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "voxels_per_second": scene.size / elapsed}
+
+def _time_per_call(function: Callable[[Any], Any], arguments: List[Any]) -> float:
+    start = time.perf_counter_ns()
+    for argument in arguments:
+        function(argument)
+    return (time.perf_counter_ns() - start) / len(arguments)
+
+def bench_queries(world: SubWorld, shape: Tuple[int, int, int], num_queries: int, rng: np.random.Generator) -> Dict[str, Any]:
+    """
+    Point queries are spread over the scene plus a margin around it so that some of them hit unknown space
+    """
+    margin = SCAN_SIZE
+    coords = np.column_stack([rng.integers(-margin, size + margin, num_queries) for size in shape])
+    locations = SubWorld.coords_to_locations(coords)
+    batch_start = time.perf_counter_ns()
+    world.is_occupied_batch(coords)
+    batch_ns = (time.perf_counter_ns() - batch_start) / num_queries
+    return {
+        "queries": num_queries,
+        "is_occupied_ns": _time_per_call(world.is_occupied, locations),
+        "get_block_ns": _time_per_call(world.get_block, locations),
+        "in_world_ns": _time_per_call(world.in_world, locations),
+        "is_occupied_batch_ns_per_voxel": batch_ns,
+    }
+
+def _metadata() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+    }
+
+def run(scenarios: List[str], sizes: List[int], num_queries: int, seed: int, trace_memory: bool) -> Dict[str, Any]:
+    results = []
+    for scenario in scenarios:
+        for size in sizes:
+            rng = np.random.default_rng(seed)
+            shape = _scene_shape(size)
+            scene = SCENARIOS[scenario](shape, rng)
+            print(f"{scenario}: {scene.size} voxels in {shape}", file=sys.stderr)
+            world, ingest = bench_ingest(scene, trace_memory)
+            result = {
+                "scenario": scenario,
+                "requested_voxels": size,
+                "voxels": int(scene.size),
+                "solid_fraction": float((scene != 0).mean()),
+                "shape": list(shape),
+                "ingest_scan": ingest,
+                "parse_scan": bench_parse(scene, SET_BLOCKS_MAX_VOXELS),
+                "queries": bench_queries(world, shape, num_queries, rng),
+            }
+            if scene.size <= SET_BLOCKS_MAX_VOXELS:
+                result["set_blocks"] = bench_set_blocks(scene)
+            results.append(result)
+            print(
+                f"\tingest {ingest['voxels_per_second']:.3g} voxels/s, {ingest['rss_bytes_per_voxel']:.3g} rss bytes/voxel, "
+                f"is_occupied {result['queries']['is_occupied_ns']:.0f} ns",
+                file=sys.stderr
+            )
+            del world
+    return {"meta": _metadata(), "results": results}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS.keys()), default=list(SCENARIOS.keys()))
+    parser.add_argument("--sizes", nargs="+", type=float, default=DEFAULT_SIZES, help="Approximate number of voxels in each scene")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Number of point queries to time per method")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Skip the traced ingest pass, which roughly doubles the run time")
+    parser.add_argument("--output", default=None, help="Where to write the JSON results. Defaults to stdout.")
+    args = parser.parse_args()
+
+    report = run(args.scenarios, [int(size) for size in args.sizes], args.queries, args.seed, not args.no_tracemalloc)
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
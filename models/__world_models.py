@@ -27,6 +27,10 @@ class BlockData(BaseModel):
     tags: Optional[Dict[str, bool]]
     state: Any
 
+    class Config:
+        # Worlds share a single BlockData instance between every voxel of the same type
+        allow_mutation = False
+
     @root_validator(pre=True)
     def check_occupied(cls, values):
         values['occupied'] = values['name'] != 'minecraft:air'
@@ -25,6 +25,7 @@ class CommandID(Enum):
     BREAK_BLOCK = "breakBlock"
     GET_INVENTORY = "getInventory"
     GET_STATE = "getState"
+    ANALYZE_CHUNK = "analyzeChunk"
 
 class Direction(Enum):
     """
@@ -16,6 +16,7 @@ from .break_block import *
 from .get_inventory import *
 from .drop import *
 from .get_state import *
+from .analyze_chunk import *
 
 from typing import Dict
 command_res_class_map: Dict[CommandID, BaseModel] = {
@@ -35,4 +36,5 @@ command_res_class_map: Dict[CommandID, BaseModel] = {
     CommandID.GET_INVENTORY.value: GetInventoryResData,
     CommandID.DROP.value: DropResData,
     CommandID.GET_STATE.value: GetStateResData,
+    CommandID.ANALYZE_CHUNK.value: AnalyzeChunkResData,
 }
\ No newline at end of file
@@ -0,0 +1,16 @@
+from pydantic import BaseModel, validator
+from typing import Dict, Tuple
+
+class AnalyzeChunkReqData(BaseModel):
+    pass
+
+class AnalyzeChunkResData(BaseModel):
+    counts: Dict[str, int]  # How many of each block are in the chunk, leaving out air
+    location: Tuple[int, int, int]  # (forward, side, up) of the agent when it analyzed the chunk
+
+    @validator('counts', pre=True)
+    def empty_counts(cls, v):
+        # An empty lua table is sent as an empty list
+        if isinstance(v, list) and len(v) == 0:
+            return {}
+        return v
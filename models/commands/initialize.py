@@ -9,6 +9,8 @@ class FieldID(Enum):
     """
     ID = "id"
     LABEL = "label"
+    START_POSITION = "startPosition"  # The minecraft world coordinates the agent started at, as {x, y, z} or "x y z"
+    START_FACING = "startFacing"  # The direction the agent faced when it started, as {x, z} with one of them +-1 or a cardinal direction such as "east"
 
 class FieldRequirement(BaseModel):
     # Sent with the request for initialization
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, root_validator
-from typing import Dict, List, Tuple
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Tuple
 from models.__agent_models import StateLocation
 from models.__world_models import BlockData, LuaList
 
@@ -7,16 +7,15 @@ class ScanReqData(BaseModel):
     radius: int
 
 class ScanResData(BaseModel):
+    # Kept as the raw [forward, side, up, blockName] entries the scanner sends, since building an object per block costs more than ingesting the scan
     blocks: LuaList[Tuple[int, int, int, str]]
-    blockMap: Dict[StateLocation, BlockData]
+    # The scanned cube is every location within radius of center on each axis. Anything inside of it that is not in blocks is air.
+    radius: Optional[int] = None
+    center: Optional[Tuple[int, int, int]] = None
 
-    @root_validator(pre=True)
-    def reformat(cls, values):
-        # We actually get the data as an array [ [forward, side, up, blockName], ... ] and we need to convert it to a dictionary
-        blockMap = {}
-        for forward, side, up, name in values['blocks']:
-            # print(f"Reformatting {forward}, {side}, {up}, {name}")
-            position = StateLocation(side=side, up=up, forward=forward)
-            blockMap[position] = BlockData(name=name)
-        values['blockMap'] = blockMap
-        return values
\ No newline at end of file
+    @property
+    def blockMap(self) -> Dict[StateLocation, BlockData]:
+        """
+        Builds a dictionary from location to block out of blocks. It is built on every access, so anything that walks a whole scan should use blocks instead.
+        """
+        return {StateLocation(forward=forward, side=side, up=up): BlockData(name=name) for forward, side, up, name in self.blocks}
@@ -1,2 +1,3 @@
 # from .socket_manager import SocketCoordinator, TopicSocketManager
-from .socket_manager_v2 import TopicSocketManager, MultiThreadTopicSocketManager
\ No newline at end of file
+from .socket_manager_v2 import TopicSocketManager, MultiThreadTopicSocketManager
+from .tile_server import TileService, TileRequestHandler, serve_tiles
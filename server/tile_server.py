@@ -0,0 +1,216 @@
+"""
+A read only HTTP service that lets viewers and tools outside of the process look at the worlds agents have mapped.
+
+    GET /worlds                              The open dimensions and their versions
+    GET /worlds/{dimension}                  Version, bounds and chunk count of a world
+    GET /worlds/{dimension}/palette          The block of every palette id, with null for the unknown ids
+    GET /worlds/{dimension}/chunks?since=v   Keys of the chunks that changed after version v, or every chunk without since
+    GET /worlds/{dimension}/tiles/{x}/{y}/{z}  One chunk encoded with worlds.encode_tile
+
+Everything is served from a snapshot of each world that is republished on the event loop at most once per publish interval, so requests never see a half applied scan.
+Tiles carry an ETag made of the chunk's version so clients can revalidate with If-None-Match, and encoded tiles are cached until their chunk changes.
+"""
+
+import asyncio
+import functools
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from uuid import uuid4
+
+from worlds import SubWorld, WorldRegistry, encode_tile
+from worlds.__chunk_store import CHUNK_SIZE, ChunkKey
+
+TILE_CONTENT_TYPE = "application/octet-stream"
+LOOP_TIMEOUT = 10.0
+
+_TILE_PATH = re.compile(r"^/worlds/([^/]+)/tiles/(-?\d+)/(-?\d+)/(-?\d+)$")
+_WORLD_PATH = re.compile(r"^/worlds/([^/]+)(/palette|/chunks)?$")
+
+class TileService:
+    """
+    Publishes snapshots of the worlds in a WorldRegistry and encodes their chunks as tiles.
+    Snapshots are taken and read on the event loop that owns the worlds. HTTP threads only read immutable metadata of a published snapshot and the tile cache, so revalidations and cache hits never wait on the loop.
+    """
+    def __init__(self, world_registry: WorldRegistry, loop: asyncio.AbstractEventLoop, publish_interval: float = 1.0, max_cached_tiles: int = 4096):
+        self.world_registry = world_registry
+        self.loop = loop
+        self.publish_interval = publish_interval
+        self.max_cached_tiles = max_cached_tiles
+        self.epoch = uuid4().hex[:8]  # Chunk versions restart with the process so they are only unique together with the epoch
+        self._snapshots: Dict[str, SubWorld] = {}
+        self._cache: 'OrderedDict[Tuple[str, ChunkKey], Tuple[str, bytes]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def publish(self):
+        """
+        Snapshots every world that changed since it was last published. Must be called on the event loop.
+        """
+        for dimension in self.world_registry.dimensions():
+            world = self.world_registry.get_world(dimension)
+            published = self._snapshots.get(dimension)
+            if published is None or published.version != world.version:
+                self._snapshots[dimension] = world.snapshot()
+
+    async def publish_loop(self):
+        while True:
+            started = time.monotonic()
+            self.publish()
+            await asyncio.sleep(max(0.0, self.publish_interval - (time.monotonic() - started)))
+
+    def _call_on_loop(self, function: Callable[..., Any], *args) -> Any:
+        async def call():
+            return function(*args)
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result(LOOP_TIMEOUT)
+
+    def get_snapshot(self, dimension: str) -> Optional[SubWorld]:
+        return self._snapshots.get(dimension)
+
+    def tile_etag(self, snapshot: SubWorld, key: ChunkKey) -> str:
+        return f'"{self.epoch}-{snapshot.chunk_version(key)}"'
+
+    def get_tile(self, dimension: str, key: ChunkKey) -> Optional[Tuple[str, bytes]]:
+        """
+        Returns the ETag and encoded tile of a chunk in the published snapshot, or None if there is no such world or chunk
+        """
+        snapshot = self.get_snapshot(dimension)
+        if snapshot is None:
+            return None
+        etag = self.tile_etag(snapshot, key)
+        cache_key = (dimension, key)
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None and cached[0] == etag:
+                self._cache.move_to_end(cache_key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        tile = self._call_on_loop(encode_tile, snapshot, key)
+        if tile is None:
+            return None
+        with self._lock:
+            self._cache[cache_key] = (etag, tile)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.max_cached_tiles:
+                self._cache.popitem(last=False)
+        return etag, tile
+
+    def describe_worlds(self) -> Dict[str, Any]:
+        return {"epoch": self.epoch, "worlds": {dimension: {"version": snapshot.version} for dimension, snapshot in list(self._snapshots.items())}}
+
+    def describe_world(self, dimension: str) -> Optional[Dict[str, Any]]:
+        snapshot = self.get_snapshot(dimension)
+        if snapshot is None:
+            return None
+        def describe():
+            bounds = snapshot._store.bounds()
+            return {
+                "version": snapshot.version,
+                "chunk_size": CHUNK_SIZE,
+                "num_chunks": len(snapshot._store.keys()),
+                "bounds": None if bounds is None else [bounds[0].tolist(), bounds[1].tolist()],
+            }
+        return self._call_on_loop(describe)
+
+    def get_palette(self, dimension: str) -> Optional[Dict[str, Any]]:
+        snapshot = self.get_snapshot(dimension)
+        if snapshot is None:
+            return None
+        def palette():
+            blocks = [snapshot.palette.get(block_id) for block_id in range(len(snapshot.palette))]
+            return {"blocks": [None if block is None else block.dict() for block in blocks]}
+        return self._call_on_loop(palette)
+
+    def get_changed_chunks(self, dimension: str, since: Optional[int]) -> Optional[Dict[str, Any]]:
+        snapshot = self.get_snapshot(dimension)
+        if snapshot is None:
+            return None
+        def changed():
+            keys = snapshot._store.keys() if since is None else snapshot.changes_since(since)
+            return {"version": snapshot.version, "chunks": sorted(list(key) for key in keys)}
+        return self._call_on_loop(changed)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "cached": len(self._cache)}
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    def __init__(self, *args, service: TileService, **kwargs):
+        self.service = service
+        super().__init__(*args, **kwargs)
+
+    def _send(self, status: int, body: bytes = b"", content_type: Optional[str] = None, etag: Optional[str] = None):
+        self.send_response(status)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")  # Always revalidate since the chunk may change at any time
+        if content_type is not None:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data: Optional[Dict[str, Any]]):
+        if data is None:
+            self._send(404)
+        else:
+            self._send(200, json.dumps(data).encode(), "application/json")
+
+    def _send_tile(self, dimension: str, key: ChunkKey):
+        snapshot = self.service.get_snapshot(dimension)
+        if snapshot is None:
+            self._send(404)
+            return
+        etag = self.service.tile_etag(snapshot, key)
+        if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            self._send(304, etag=etag)
+            return
+        tile = self.service.get_tile(dimension, key)
+        if tile is None:
+            self._send(404)
+        else:
+            self._send(200, tile[1], TILE_CONTENT_TYPE, tile[0])
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        try:
+            tile_match = _TILE_PATH.match(url.path)
+            world_match = _WORLD_PATH.match(url.path)
+            if tile_match is not None:
+                self._send_tile(tile_match.group(1), tuple(int(value) for value in tile_match.group(2, 3, 4)))
+            elif url.path == "/worlds":
+                self._send_json(self.service.describe_worlds())
+            elif world_match is not None and world_match.group(2) is None:
+                self._send_json(self.service.describe_world(world_match.group(1)))
+            elif world_match is not None and world_match.group(2) == "/palette":
+                self._send_json(self.service.get_palette(world_match.group(1)))
+            elif world_match is not None and world_match.group(2) == "/chunks":
+                since = parse_qs(url.query).get("since")
+                self._send_json(self.service.get_changed_chunks(world_match.group(1), None if since is None else int(since[0])))
+            else:
+                self._send(404)
+        except ValueError:
+            self._send(400)
+        except Exception as e:
+            print("Error when serving", self.path, e)
+            self._send(500)
+
+def serve_tiles(service: TileService, host: str, port: int):
+    """
+    Serves tiles until the process exits. Meant to be the target of a daemon thread.
+    """
+    RequestHandler = functools.partial(TileRequestHandler, service=service)
+    httpd = ThreadingHTTPServer((host, port), RequestHandler)
+    httpd.daemon_threads = True
+
+    print("Starting tile server")
+    httpd.serve_forever()
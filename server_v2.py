@@ -1,6 +1,6 @@
 from simple_websocket_server import WebSocketServer
 from typing import List
-from server import MultiThreadTopicSocketManager
+from server import MultiThreadTopicSocketManager, TileService, serve_tiles
 from agents import AgentCoordinator
 import asyncio
 from http.server import HTTPServer, SimpleHTTPRequestHandler
@@ -18,6 +18,7 @@ if TESTING:
 
 WEBSOCKET_PORT = 8765
 STATIC_PORT = WEBSOCKET_PORT + 1
+TILE_PORT = WEBSOCKET_PORT + 2
 
 agent_coordinator = AgentCoordinator()
 
@@ -59,12 +60,16 @@ def serve_static():
     httpd.serve_forever()
 
 async def main():
-    # Start the socket and static threads
+    # Start the socket, static and tile threads
     asyncio.ensure_future(handle_clients_loop())
+    tile_service = TileService(agent_coordinator.world_registry, asyncio.get_running_loop())
+    asyncio.ensure_future(tile_service.publish_loop())
     socket_thread = threading.Thread(target=start_socket_server, daemon=True)
     static_thread = threading.Thread(target=serve_static, daemon=True)
+    tile_thread = threading.Thread(target=serve_tiles, args=(tile_service, '127.0.0.1', TILE_PORT), daemon=True)
     socket_thread.start()
     static_thread.start()
+    tile_thread.start()
     await asyncio.Future()
 
 asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,15 @@
+-- Counts the blocks in the chunk the turtle is in with the geoScanner
+-- { counts = { [blockName] = count }, location = { forward, side, up } }
+
+local AnalyzeChunk = {}
+
+function AnalyzeChunk:run(data)
+    local ok, counts, location = ScanManager:analyzeChunk()
+    if not ok then
+        error(counts)
+    end
+
+    return { counts = counts, location = location }
+end
+
+return AnalyzeChunk
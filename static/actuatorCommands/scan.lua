@@ -3,12 +3,12 @@ local Scan = {}
 function Scan:run(data)
     local radius = data.radius or 8
     
-    local ok, blockData = ScanManager:scan(radius)
+    local ok, blockData, center = ScanManager:scan(radius)
     if not ok then
         error(blockData)
     end
 
-    return { blocks = blockData }
+    return { blocks = blockData, radius = radius, center = center }
 end
 
 return Scan
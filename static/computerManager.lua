@@ -18,6 +18,10 @@ function ComputerManager:getField(fieldId)
         return os.getComputerID()
     elseif fieldId == "label" then
         return os.getComputerLabel()
+    elseif fieldId == "startPosition" and MovementManager.originalPosition then
+        return MovementManager.originalPosition
+    elseif fieldId == "startFacing" and MovementManager.originalOrientation then
+        return MovementManager.originalOrientation
     else
         -- Otherwise we should take user input to get the field
         print("Please enter the value for " .. fieldId)
@@ -35,21 +35,8 @@ function ScanManager:scan(radius, scannerIndex, waitForScan)
         end
     end
 
-    -- Air blocks are not returned by the scanner, but we want to know they were scanned so we insert them manually
-    -- To do this, first we need to be able to look up if we scanned the block at a given location efficiently
-    local scannedLocations = {}
-    for _, v in pairs(data) do
-        scannedLocations[tostring(v.x) .. "," .. tostring(v.y) .. "," .. tostring(v.z)] = true
-    end
-    for x = -radius, radius do
-        for y = -radius, radius do
-            for z = -radius, radius do
-                if not scannedLocations[tostring(x) .. "," .. tostring(y) .. "," .. tostring(z)] then
-                    table.insert(data, { x = x, y = y, z = z, name = "minecraft:air", tags = {} })
-                end
-            end
-        end
-    end
+    -- Air blocks are not returned by the scanner. Instead of inserting them here we send the scanned cube along with the blocks
+    -- and the server treats everything inside of it that we did not report as air
 
     -- Now, we need to convert the positions relative to the turtle into movement aligned positions
     -- We also want to convert into a map from position to the blockdata to prepare for sending it to the server
@@ -68,7 +55,8 @@ function ScanManager:scan(radius, scannerIndex, waitForScan)
 
     print("Scanned " .. #blocks .. " blocks")
 
-    return true, blocks
+    local centerSide, centerUp, centerForward = MovementManager:fromLocal(0, 0, 0, false)
+    return true, blocks, { centerForward, centerSide, centerUp }
 end
 
 function ScanManager:analyzeChunk(scannerIndex)
@@ -81,7 +69,9 @@ function ScanManager:analyzeChunk(scannerIndex)
     if not data then
         return false, reason
     end
-    return true, data
+    -- The server needs to know where we were to tell which chunk this was
+    local side, up, forward = MovementManager:fromLocal(0, 0, 0, false)
+    return true, data, { forward, side, up }
 end
 
 function ScanManager:scanCost(radius)
@@ -2,28 +2,39 @@
 This task uses a scanner to plan a route to the closest of a set of locations without needing prior knowledge of the world.
 """
 
+import time
 from .__task import Task
 from typing import List, Optional, Union, TYPE_CHECKING
 
 from requirements import AgentRequirementID
-from agents.commands import Command, SayCommand, ScanCommand, MoveCommand, GetStateCommand
-from models.commands import ScanResData, FaceTo, MoveTo
+from agents.commands import Command, SayCommand, ScanCommand, MoveCommand, GetStateCommand, AnalyzeChunkCommand
+from models.commands import ScanResData, AnalyzeChunkResData, FaceTo, MoveTo
 from models import AgentState, StateLocation
-from worlds import SubWorld, PathPlanner
+from worlds import SubWorld, PathPlanner, AgentFrame, SearchBudget, column_key
 from models.failures import CommandException, FailureID
 
 if TYPE_CHECKING:
     from agents import AgentManager
 
+DEFAULT_PLANNING_BUDGET = SearchBudget(max_expansions=200000, max_seconds=2.0, max_states=1000000)
+CHUNK_ANALYSIS_INTERVAL = 300  # Seconds before a chunk column we pass through is analyzed again, since its counts only change as it is mined
+
 class ScanAndPathfindTask(Task):
-    def __init__(self, agent_manager: 'AgentManager', world: SubWorld, goal: Union[List[AgentState], AgentState], sight_radius: int = 4):
+    def __init__(self, agent_manager: 'AgentManager', world: SubWorld, goal: Union[List[AgentState], AgentState], sight_radius: int = 4, frame: Optional[AgentFrame] = None, planning_budget: SearchBudget = DEFAULT_PLANNING_BUDGET):
+        """
+        Goals are in the world's frame. frame converts between the agent's own frame and the world's when the world is shared between agents.
+        planning_budget bounds every call to the planner so that a goal far out in unknown space can not stall the task.
+        """
         super().__init__(agent_manager)
         self.scan = ScanCommand(self.agent_manager, sight_radius)
         self.move = MoveCommand(self.agent_manager)
-        self.commands: List[Command] = [self.scan, self.move]
+        self.analyze = AnalyzeChunkCommand(self.agent_manager)
+        self.commands: List[Command] = [self.scan, self.move, self.analyze]
 
         self.world = world
+        self.frame = frame if frame is not None else AgentFrame()
         self.path_planner = PathPlanner(world)
+        self.planning_budget = planning_budget
         if isinstance(goal, list):
             self.goal_states = goal
         else:
@@ -38,33 +49,54 @@ class ScanAndPathfindTask(Task):
     def get_time_requirement(self) -> int:
         return 100
 
+    async def _analyze_chunk(self, block_data: ScanResData):
+        """
+        Counts the blocks of the chunk column the scan was taken in, unless it was analyzed recently, so that resource tasks know where to dig later
+        """
+        if block_data.center is not None:
+            center = self.frame.to_shared_coords([block_data.center])[0].tolist()
+            analyzed_at = self.world.resources.analyzed_at(column_key(StateLocation(forward=center[0], side=center[1], up=center[2])))
+            if analyzed_at is not None and time.time() - analyzed_at < CHUNK_ANALYSIS_INTERVAL:
+                return
+        analysis: AnalyzeChunkResData = await self.analyze.run()
+        self.world.ingest_chunk_analysis(analysis, self.frame)
+
     async def run(self) -> None:
         async def scan():
             block_data: ScanResData = await self.scan.run()
-            self.world.set_blocks(block_data.blockMap.items())
+            self.world.ingest_scan(block_data, self.frame)
+            await self._analyze_chunk(block_data)
             # self.world.show()
             return block_data
 
         await scan()
-        while True:
-            start_state: AgentState = await GetStateCommand(self.agent_manager).run()
-            path = self.path_planner.find_state_path_to_any(start_state, self.goal_states, assume_occupied=False)
-            if path is None:
-                return False, "No path found"
-            
-            move_commands = []
-            for state in path:
-                move_to = MoveTo(forward=state.location.forward, side=state.location.side, up=state.location.up)
-                face_to = FaceTo(forward=state.orientation.forward, side=state.orientation.side, up=state.orientation.up)
-                move_commands.append(MoveCommand(self.agent_manager, move_to=move_to, face_to=face_to))
+        # The planner keeps its search between iterations and only repairs it around whatever the last scan changed
+        planner = self.path_planner.incremental_planner(self.goal_states, assume_occupied=False)
+        try:
+            while True:
+                start_state: AgentState = self.frame.to_shared_state(await GetStateCommand(self.agent_manager).run())
+                self.world.set_agent_location(self.agent_manager.id, start_state.location)
+                plan = planner.plan(start_state, budget=self.planning_budget)
+                if plan.budget_exceeded:
+                    return False, f"Gave up planning after {plan.expansions} expansions ({plan.status.value})"
+                if not plan.found:
+                    return False, "No path found"
+
+                move_commands = []
+                for state in map(self.frame.from_shared_state, plan.path):
+                    move_to = MoveTo(forward=state.location.forward, side=state.location.side, up=state.location.up)
+                    face_to = FaceTo(forward=state.orientation.forward, side=state.orientation.side, up=state.orientation.up)
+                    move_commands.append(MoveCommand(self.agent_manager, move_to=move_to, face_to=face_to))
 
-            try:
-                await self.agent_manager.send_command_set(move_commands)
-                return True, None
-            except CommandException as e:
-                if e.failure_id == FailureID.MOVEMENT_OBSTRUCTED:
-                    await scan()
-                    continue
-                else:
-                    print(e)
-                    return False, e
\ No newline at end of file
+                try:
+                    await self.agent_manager.send_command_set(move_commands)
+                    return True, None
+                except CommandException as e:
+                    if e.failure_id == FailureID.MOVEMENT_OBSTRUCTED:
+                        await scan()
+                        continue
+                    else:
+                        print(e)
+                        return False, e
+        finally:
+            planner.close()
\ No newline at end of file
@@ -4,6 +4,7 @@ from typing import List, TYPE_CHECKING
 from requirements import AgentRequirementID
 from agents.commands import Command, SayCommand, ScanCommand, MoveCommand
 from models.commands import ScanResData, FaceTo, MoveTo
+from models import StateLocation
 # from models.failures import CommandException, FailureID
 
 if TYPE_CHECKING:
@@ -34,10 +35,10 @@ class ScanTestTask(Task):
 
         async def scan_stone():
             block_data: ScanResData = (await self.agent_manager.send_command_set([say_start, self.scan, say_end]))[1]
-            # Find the position of the minecraft:stone
-            for pos, block in block_data.blockMap.items():
-                # print(pos, block.name)
-                if block.name == "minecraft:stone":
+            # Find the position of the minecraft:stone in this scan alone so that we can check that it shows up in the same place every time
+            for forward, side, up, name in block_data.blocks:
+                if name == "minecraft:stone":
+                    pos = StateLocation(forward=forward, side=side, up=up)
                     print("Found stone at", pos)
                     return pos
 
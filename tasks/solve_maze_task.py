@@ -1,27 +1,31 @@
 from .__task import Task
-from typing import List, Optional, TYPE_CHECKING
+from .scan_and_pathfind_task import DEFAULT_PLANNING_BUDGET
+from typing import Awaitable, Callable, List, Optional, Tuple, TYPE_CHECKING
+import numpy as np
 
 from requirements import AgentRequirementID
 from agents.commands import Command, SayCommand, ScanCommand, MoveCommand, GetStateCommand
 from models.commands import ScanResData, FaceTo, MoveTo
 from models import AgentState, StateLocation
-from worlds import SubWorld, PathPlanner
+from worlds import SubWorld, PathPlanner, AgentFrame, IncrementalPlanner, LocationGoal, export_layer_pngs_async
 from models.failures import CommandException, FailureID
 
 if TYPE_CHECKING:
     from agents import AgentManager
 
 class SolveMazeTask(Task):
-    def __init__(self, agent_manager: 'AgentManager', world: SubWorld, sight_radius: int = 4, goal_block: str = "minecraft:gold_block", scan_every: Optional[int] = None):
+    def __init__(self, agent_manager: 'AgentManager', world: SubWorld, sight_radius: int = 4, goal_block: str = "minecraft:gold_block", scan_every: Optional[int] = None, frame: Optional[AgentFrame] = None, export_dir: Optional[str] = None):
         super().__init__(agent_manager)
         self.scan = ScanCommand(self.agent_manager, sight_radius)
         self.move = MoveCommand(self.agent_manager)
         self.commands: List[Command] = [self.scan, self.move]
 
         self.world = world
+        self.frame = frame if frame is not None else AgentFrame()
         self.path_planner = PathPlanner(world)
         self.goal_block = goal_block
         self.scan_every = scan_every
+        self.export_dir = export_dir  # If set, the explored maze is written here as png layers once we reach the goal
 
     def get_agent_requirements(self) -> List[AgentRequirementID]:
         # We have a list of static command for this one so we can use the helper functions to get the requirements
@@ -47,22 +51,20 @@ class SolveMazeTask(Task):
 
         async def scan():
             block_data: ScanResData = await self.scan.run()
-            self.world.set_blocks(block_data.blockMap.items())
-            # print([pos.__str__() for pos, block in block_data.blockMap.items()])
-            for pos, block in block_data.blockMap.items():
-                # print(block.name)
-                if block.name in alignment_blocks:
-                    print(f"Found alignment block {block.name} at {pos}")
+            self.world.ingest_scan(block_data, self.frame)
+            # The world is shared with every other agent in the dimension, so we only report what this scan saw
+            aligned = [(forward, side, up, name) for forward, side, up, name in block_data.blocks if name in alignment_blocks]
+            if len(aligned) > 0:
+                coords = self.frame.to_shared_coords(np.array([block[:3] for block in aligned]))
+                for (forward, side, up), (_, _, _, name) in zip(coords.tolist(), aligned):
+                    print(f"Found alignment block {name} at {StateLocation(forward=forward, side=side, up=up)}")
             # self.world.show()
             return block_data
         
         block_data = await scan()
 
-        # Find the position of the goal
-        goal_positions = []
-        for pos, block in block_data.blockMap.items():
-            if block.name == self.goal_block:
-                goal_positions.append(pos)
+        # Find the position of the goal. The world is shared, so we only look where this scan saw so that another maze's goal is never picked
+        goal_positions = self.world.find_blocks_in_box(*self._scan_box(block_data), name=self.goal_block)
         if len(goal_positions) == 0:
             print("Could not find goal block")
             await SayCommand(self.agent_manager, "Could not find goal block").run()
@@ -79,17 +81,51 @@ class SolveMazeTask(Task):
         print(f"Goal states: ", goal_states)
 
         reject_out_of_plane = self.path_planner.reject_out_of_plane_factory(goal_states[0])
-        
+        # Every scan only changes a few voxels of the maze so the planner repairs its last search instead of starting over
+        planner = self.path_planner.incremental_planner(LocationGoal(state.location for state in goal_states), assume_occupied=False, reject_neighbors=reject_out_of_plane)
+        try:
+            reached = await self._walk_to_goal(planner, scan)
+        finally:
+            planner.close()
+        if not reached:
+            return
+
+        await SayCommand(self.agent_manager, "Goal Reached").run()
+        if self.export_dir is not None:
+            await export_layer_pngs_async(self.world, self.export_dir)
+
+    def _scan_box(self, block_data: ScanResData) -> Tuple[StateLocation, StateLocation]:
+        """
+        Returns the min and max corners in the shared frame of the cube a scan covered, or of the blocks it saw if it does not say where the cube is
+        """
+        if block_data.radius is not None and block_data.center is not None:
+            center = np.array(block_data.center, dtype=np.int64)
+            corners = np.array([center - block_data.radius, center + block_data.radius])
+        elif len(block_data.blocks) > 0:
+            corners = np.array([block[:3] for block in block_data.blocks], dtype=np.int64)
+        else:
+            corners = np.zeros((1, 3), dtype=np.int64)
+        # The frame only rotates by quarter turns, so the corners of the rotated box are still its extremes
+        corners = self.frame.to_shared_coords(corners)
+        min_corner, max_corner = corners.min(axis=0).tolist(), corners.max(axis=0).tolist()
+        return StateLocation(forward=min_corner[0], side=min_corner[1], up=min_corner[2]), StateLocation(forward=max_corner[0], side=max_corner[1], up=max_corner[2])
+
+    async def _walk_to_goal(self, planner: IncrementalPlanner, scan: Callable[[], Awaitable[ScanResData]]) -> bool:
+        """
+        Plans, moves and rescans until we reach the goal. Returns False if there is no path to it.
+        """
         while True:
             # Find a path to the target, execute it, if we encounter a MOVEMENT_OBSTRUCTED failure, scan and try again
-            start_state: AgentState = await GetStateCommand(self.agent_manager).run()
-            print(f"Starting pathfind iteration... \n\tStart: {start_state} \n\tGoals: {goal_states}")
+            start_state: AgentState = self.frame.to_shared_state(await GetStateCommand(self.agent_manager).run())
+            self.world.set_agent_location(self.agent_manager.id, start_state.location)
+            print(f"Starting pathfind iteration... \n\tStart: {start_state} \n\tGoal: {planner.goal}")
             print(f"\tStart state in world: {self.world.in_world(start_state.location)}, {self.world.get_block(start_state.location)}")
-            path = self.path_planner.find_state_path_to_any(start_state, goal_states, assume_occupied=False, reject_neighbors=reject_out_of_plane)
-            if path is None:
-                print("Could not find path to goal")
+            plan = planner.plan(start_state, budget=DEFAULT_PLANNING_BUDGET)
+            if not plan.found:
+                print(f"Could not find path to goal ({plan.status.value})")
                 await SayCommand(self.agent_manager, "Could not find path to goal").run()
-                return
+                return False
+            path = plan.path
             print(f"\tPath length: {len(path)}")
             will_complete = True
             if self.scan_every is not None:
@@ -97,14 +133,14 @@ class SolveMazeTask(Task):
                     will_complete = False
                 path = path[:self.scan_every]
             move_commands = []
-            for state in path:
+            for state in map(self.frame.from_shared_state, path):
                 move_to = MoveTo(forward=state.location.forward, side=state.location.side, up=state.location.up)
                 face_to = FaceTo(forward=state.orientation.forward, side=state.orientation.side, up=state.orientation.up)
                 move_commands.append(MoveCommand(self.agent_manager, move_to=move_to, face_to=face_to))
             try:
                 await self.agent_manager.send_command_set(move_commands)
                 if will_complete:
-                    break
+                    return True
                 await scan()
             except CommandException as e:
                 if e.failure_id == FailureID.MOVEMENT_OBSTRUCTED:
@@ -115,6 +151,3 @@ class SolveMazeTask(Task):
                 else:
                     print(e)
                     raise e
-        
-        await SayCommand(self.agent_manager, "Goal Reached").run()
-        self.world.show()
@@ -0,0 +1,262 @@
+import os
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .__chunk_store import ChunkKey, ChunkStore, CHUNK_SHIFT, CHUNK_SIZE, group_by_chunk
+from .__palette import BlockPalette
+
+CHUNK_VOLUME = CHUNK_SIZE ** 3
+DENSE_SIZE = CHUNK_VOLUME // 16  # An id with more voxels than this in a chunk is found by scanning the chunk instead of listing them
+SPARSE_SIZE = DENSE_SIZE // 2  # A dense id goes back to a list once it drops to this many voxels, so that an id on the edge does not flip every write
+
+Posting = Optional[np.ndarray]  # Sorted uint16 indices of the voxels in a chunk that hold an id, or None when the chunk is scanned for it
+EMPTY_POSTING = np.zeros(0, dtype=np.uint16)
+
+def _chunk_origin(key: ChunkKey) -> np.ndarray:
+    return np.array(key, dtype=np.int64) << CHUNK_SHIFT
+
+def _local_indices(local: np.ndarray) -> np.ndarray:
+    return ((local[:, 0] << (2 * CHUNK_SHIFT)) | (local[:, 1] << CHUNK_SHIFT) | local[:, 2]).astype(np.uint16)
+
+def _chunk_coords(key: ChunkKey, indices: np.ndarray) -> np.ndarray:
+    indices = indices.astype(np.int64)
+    local = np.column_stack((indices >> (2 * CHUNK_SHIFT), (indices >> CHUNK_SHIFT) & (CHUNK_SIZE - 1), indices & (CHUNK_SIZE - 1)))
+    return local + _chunk_origin(key)
+
+def _box_distance(key: ChunkKey, point: np.ndarray) -> int:
+    """
+    Manhattan distance from a point to the closest voxel of a chunk
+    """
+    low = _chunk_origin(key)
+    return int(np.maximum(np.maximum(low - point, point - (low + CHUNK_SIZE - 1)), 0).sum())
+
+class BlockIndex:
+    """
+    A BlockIndex is an inverted index from palette id to the voxels that hold that id, kept as one small posting list per chunk and id.
+    Only occupied blocks are indexed since air makes up most of the world and is never what we are looking for.
+    Bulk blocks such as stone and dirt would cost far more to list than the chunk itself, so once an id fills more than DENSE_SIZE voxels of a chunk the index only remembers that the chunk has it and scans the chunk from the store when asked.
+    Queries cost time proportional to the number of chunks with a matching block, and box and nearest queries skip chunks that can not contribute.
+    Saving only writes the chunks that changed. A saved index reads every chunk file the first time it is used.
+    When the store evicts a chunk its postings are dropped and every id in it is treated as dense, so only the ids it holds stay in memory.
+    """
+    def __init__(self, palette: BlockPalette, store: Optional[ChunkStore] = None) -> None:
+        self.palette = palette
+        self.store = store  # Scanned for dense ids. The SubWorld that owns the index sets it
+        self._chunks: Dict[ChunkKey, Dict[int, Posting]] = {}
+        self._chunks_with: Dict[int, Set[ChunkKey]] = {}
+        self._unloaded: Dict[ChunkKey, str] = {}  # Chunks that were saved to disk but have not been read since loading
+        self._dirty: Set[ChunkKey] = set()
+        self._shared: Set[ChunkKey] = set()  # Chunks whose posting dicts are shared with a snapshot and must be copied before writing
+
+    def _indexed(self, block_id: int) -> bool:
+        return block_id > BlockPalette.UNKNOWN_OCCUPIED and self.palette.is_occupied(block_id)
+
+    def _ensure_loaded(self):
+        if len(self._unloaded) == 0:
+            return
+        unloaded, self._unloaded = self._unloaded, {}
+        for key, path in unloaded.items():
+            if key in self._chunks:
+                continue
+            with np.load(path) as data:
+                ids, dense, offsets, indices = data["ids"], data["dense"], data["offsets"], data["indices"]
+            postings: Dict[int, Posting] = {}
+            for block_id, is_dense, start, end in zip(ids.tolist(), dense.tolist(), offsets[:-1].tolist(), offsets[1:].tolist()):
+                postings[block_id] = None if is_dense else indices[start:end]
+                self._chunks_with.setdefault(block_id, set()).add(key)
+            self._chunks[key] = postings
+
+    def _writable(self, key: ChunkKey) -> Dict[int, Posting]:
+        self._dirty.add(key)
+        postings = self._chunks.get(key)
+        if postings is None:
+            postings = self._chunks[key] = {}
+        elif key in self._shared:
+            postings = self._chunks[key] = dict(postings)
+            self._shared.discard(key)
+        return postings
+
+    def _scan(self, key: ChunkKey, block_id: int) -> np.ndarray:
+        chunk = self.store.get_chunk(key) if self.store is not None else None
+        if chunk is None:
+            return EMPTY_POSTING
+        return np.flatnonzero(chunk.reshape(-1) == block_id).astype(np.uint16)
+
+    def drop_chunks(self, keys: Iterable[ChunkKey]):
+        """
+        Forgets the postings of chunks that the store evicted. Their ids are answered by scanning the chunk, which reloads it, until writes bring them back under SPARSE_SIZE.
+        """
+        for key in keys:
+            postings = self._chunks.get(key)
+            if postings is None or all(posting is None for posting in postings.values()):
+                continue
+            self._chunks[key] = dict.fromkeys(postings)
+            self._shared.discard(key)
+
+    def _indices(self, key: ChunkKey, block_id: int) -> np.ndarray:
+        posting = self._chunks[key][block_id]
+        return posting if posting is not None else self._scan(key, block_id)
+
+    def snapshot(self, palette: BlockPalette) -> 'BlockIndex':
+        """
+        Returns an index with the same contents that shares every chunk's postings until one side writes to them
+        """
+        self._ensure_loaded()
+        snapshot = BlockIndex(palette)
+        snapshot._chunks = dict(self._chunks)
+        snapshot._chunks_with = {block_id: set(keys) for block_id, keys in self._chunks_with.items()}
+        snapshot._shared = set(self._chunks.keys())
+        self._shared.update(self._chunks.keys())
+        return snapshot
+
+    def update_voxel(self, x: int, y: int, z: int, old_id: int, new_id: int):
+        if old_id == new_id or not (self._indexed(old_id) or self._indexed(new_id)):
+            return
+        self.update(np.array([[x, y, z]], dtype=np.int64), np.array([old_id], dtype=np.uint16), np.array([new_id], dtype=np.uint16))
+
+    def update(self, coords: np.ndarray, old_ids: np.ndarray, new_ids: np.ndarray):
+        """
+        Updates the index after the voxels at coords changed from old_ids to new_ids. The store must already hold the new ids.
+        """
+        changed = old_ids != new_ids
+        if not changed.any():
+            return
+        self._ensure_loaded()
+        coords, old_ids, new_ids = coords[changed], old_ids[changed], new_ids[changed]
+        for key, index, local in group_by_chunk(coords):
+            indices = _local_indices(local)
+            chunk_old, chunk_new = old_ids[index], new_ids[index]
+            touched = [block_id for block_id in np.union1d(chunk_old, chunk_new).tolist() if self._indexed(block_id)]
+            if len(touched) == 0:
+                continue
+            postings = self._writable(key)
+            for block_id in touched:
+                removed, added = indices[chunk_old == block_id], indices[chunk_new == block_id]
+                posting = postings.get(block_id, EMPTY_POSTING)
+                if posting is None:
+                    if len(removed) == 0:
+                        continue
+                    posting = self._scan(key, block_id)
+                    if len(posting) > SPARSE_SIZE:
+                        continue
+                else:
+                    posting = np.union1d(np.setdiff1d(posting, removed, assume_unique=True), added).astype(np.uint16)
+                    if len(posting) > DENSE_SIZE:
+                        posting = None
+                if posting is not None and len(posting) == 0:
+                    postings.pop(block_id, None)
+                    self._chunks_with[block_id].discard(key)
+                else:
+                    postings[block_id] = posting
+                    self._chunks_with.setdefault(block_id, set()).add(key)
+            if len(postings) == 0:
+                del self._chunks[key]
+
+    def count(self, block_ids: Iterable[int]) -> int:
+        self._ensure_loaded()
+        return sum(len(self._indices(key, block_id)) for block_id in block_ids for key in self._chunks_with.get(block_id, ()))
+
+    def _find_in_chunks(self, block_ids: Iterable[int], keep_chunk=None) -> np.ndarray:
+        self._ensure_loaded()
+        coords = [
+            _chunk_coords(key, self._indices(key, block_id))
+            for block_id in block_ids for key in self._chunks_with.get(block_id, ())
+            if keep_chunk is None or keep_chunk(key)
+        ]
+        if len(coords) == 0:
+            return np.zeros((0, 3), dtype=np.int64)
+        return np.concatenate(coords)
+
+    def find(self, block_ids: Iterable[int]) -> np.ndarray:
+        """
+        Returns an (N, 3) array with the location of every block with one of the given ids
+        """
+        return self._find_in_chunks(block_ids)
+
+    def find_in_box(self, block_ids: Iterable[int], min_corner: Tuple[int, int, int], max_corner: Tuple[int, int, int]) -> np.ndarray:
+        """
+        Returns the locations of matching blocks that lie inside of the inclusive box between min_corner and max_corner. Only chunks that overlap the box are read.
+        """
+        min_corner, max_corner = np.asarray(min_corner), np.asarray(max_corner)
+        min_key, max_key = tuple((min_corner >> CHUNK_SHIFT).tolist()), tuple((max_corner >> CHUNK_SHIFT).tolist())
+        coords = self._find_in_chunks(block_ids, lambda key: all(low <= part <= high for low, part, high in zip(min_key, key, max_key)))
+        inside = np.all((coords >= min_corner) & (coords <= max_corner), axis=1)
+        return coords[inside]
+
+    def find_nearest(self, block_ids: Iterable[int], point: Tuple[int, int, int]) -> Optional[np.ndarray]:
+        """
+        Returns the location of the matching block with the smallest manhattan distance to point.
+        Chunks are visited from the closest one out and the search stops at the first chunk that is farther away than the best block so far.
+        """
+        self._ensure_loaded()
+        point = np.asarray(point, dtype=np.int64)
+        candidates: List[Tuple[int, ChunkKey, int]] = sorted(
+            (_box_distance(key, point), key, block_id) for block_id in block_ids for key in self._chunks_with.get(block_id, ())
+        )
+        best, best_distance = None, None
+        for distance, key, block_id in candidates:
+            if best_distance is not None and distance >= best_distance:
+                break
+            coords = _chunk_coords(key, self._indices(key, block_id))
+            if len(coords) == 0:
+                continue
+            distances = np.abs(coords - point).sum(axis=1)
+            closest = int(distances.argmin())
+            if best_distance is None or distances[closest] < best_distance:
+                best, best_distance = coords[closest], int(distances[closest])
+        return best
+
+    def save(self, path: str):
+        """
+        Writes every chunk that changed since the last save to a directory with one .npz file per chunk
+        """
+        self.write_dump(path, self.dump())
+
+    def dump(self) -> Dict[ChunkKey, Dict[int, Posting]]:
+        """
+        Takes the postings of every chunk that changed since the last dump, for write_dump. A chunk with nothing left in it has empty postings.
+        """
+        dump = {key: dict(self._chunks.get(key, {})) for key in self._dirty}
+        self._dirty.clear()
+        return dump
+
+    @staticmethod
+    def write_dump(path: str, dump: Dict[ChunkKey, Dict[int, Posting]]):
+        """
+        Writes what dump returned. Only touches files, so it can run on a worker thread while the index keeps changing.
+        """
+        os.makedirs(path, exist_ok=True)
+        for key, postings in dump.items():
+            file_path = os.path.join(path, f"{key[0]}_{key[1]}_{key[2]}.npz")
+            if len(postings) == 0:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                continue
+            ids = sorted(postings)
+            lists = [postings[block_id] if postings[block_id] is not None else EMPTY_POSTING for block_id in ids]
+            with open(file_path + ".tmp", "wb") as f:
+                np.savez(
+                    f,
+                    ids=np.array(ids, dtype=np.int64),
+                    dense=np.array([postings[block_id] is None for block_id in ids], dtype=bool),
+                    offsets=np.concatenate(([0], np.cumsum([len(indices) for indices in lists]))).astype(np.int64),
+                    indices=np.concatenate(lists).astype(np.uint16),
+                )
+            os.replace(file_path + ".tmp", file_path)
+
+    @classmethod
+    def load(cls, palette: BlockPalette, path: str) -> 'BlockIndex':
+        """
+        Opens a saved index. Chunk files are only read once the index is first used.
+        """
+        index = cls(palette)
+        if os.path.isdir(path):
+            for file_name in os.listdir(path):
+                if not file_name.endswith(".npz"):
+                    continue
+                try:
+                    key = tuple(int(part) for part in file_name[:-len(".npz")].split("_"))
+                except ValueError:
+                    continue
+                index._unloaded[key] = os.path.join(path, file_name)
+        return index
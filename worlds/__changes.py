@@ -0,0 +1,89 @@
+import asyncio
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Set, Tuple
+
+from .__chunk_store import CHUNK_SHIFT, ChunkKey
+
+@dataclass
+class WorldChange:
+    """
+    Everything that changed in a world between two versions.
+    chunks holds the keys of every chunk that was touched and the corners bound every voxel that was touched.
+    """
+    from_version: int
+    to_version: int
+    chunks: Set[ChunkKey] = field(default_factory=set)
+    min_corner: Optional[Tuple[int, int, int]] = None
+    max_corner: Optional[Tuple[int, int, int]] = None
+
+    def merge(self, to_version: int, chunks: Set[ChunkKey], min_corner: Tuple[int, int, int], max_corner: Tuple[int, int, int]):
+        self.to_version = to_version
+        self.chunks.update(chunks)
+        if self.min_corner is None:
+            self.min_corner, self.max_corner = min_corner, max_corner
+        else:
+            self.min_corner = tuple(min(a, b) for a, b in zip(self.min_corner, min_corner))
+            self.max_corner = tuple(max(a, b) for a, b in zip(self.max_corner, max_corner))
+
+def changed_chunks(coords: np.ndarray) -> Set[ChunkKey]:
+    return set(map(tuple, np.unique(coords >> CHUNK_SHIFT, axis=0).tolist()))
+
+class WorldSubscription:
+    """
+    A WorldSubscription collects the changes made to a world and hands them out as coalesced batches.
+    Every change made since the last batch was taken is merged into one WorldChange, so a slow consumer never falls behind by more than one batch.
+    Changes are pushed from the world's write path, which has to run on the same event loop as the consumer.
+    """
+    def __init__(self, version: int, on_close: Callable[['WorldSubscription'], None], coalesce_delay: float = 0.0):
+        """
+        coalesce_delay is how long to wait after the first change before handing out a batch, letting bursts of writes from one scan collapse into a single batch
+        """
+        self.coalesce_delay = coalesce_delay
+        self._version = version
+        self._pending: Optional[WorldChange] = None
+        self._event = asyncio.Event()
+        self._on_close = on_close
+        self.closed = False
+
+    def _notify(self, version: int, chunks: Set[ChunkKey], min_corner: Tuple[int, int, int], max_corner: Tuple[int, int, int]):
+        if self._pending is None:
+            self._pending = WorldChange(self._version, version)
+        self._pending.merge(version, chunks, min_corner, max_corner)
+        self._event.set()
+
+    def poll(self) -> Optional[WorldChange]:
+        """
+        Returns the changes collected so far without waiting, or None if nothing changed
+        """
+        change = self._pending
+        self._pending = None
+        self._event.clear()
+        if change is not None:
+            self._version = change.to_version
+        return change
+
+    async def get(self) -> WorldChange:
+        """
+        Waits for the world to change and returns everything that changed since the last batch
+        """
+        while True:
+            await self._event.wait()
+            if self.coalesce_delay > 0:
+                await asyncio.sleep(self.coalesce_delay)
+            change = self.poll()
+            if change is not None:
+                return change
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> WorldChange:
+        if self.closed:
+            raise StopAsyncIteration
+        return await self.get()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._on_close(self)
@@ -0,0 +1,384 @@
+import numpy as np
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from .__spill import SpillEntry, SpillFile
+
+CHUNK_SHIFT = 4
+CHUNK_SIZE = 1 << CHUNK_SHIFT  # Chunks are CHUNK_SIZE^3 voxels
+CHUNK_MASK = CHUNK_SIZE - 1
+
+SPILL_COMPACT_BYTES = 64 << 20  # Spill files are only rewritten once they hold at least this much garbage
+EVICT_FRACTION = 0.9  # Eviction frees chunks down to this fraction of the budget so it does not run on every load
+
+# Locations can be packed into a single integer by biasing each axis into 21 bits
+PACK_BITS = 21
+PACK_BIAS = 1 << (PACK_BITS - 1)
+PACK_MASK = (1 << PACK_BITS) - 1
+
+ChunkKey = Tuple[int, int, int]
+
+def chunk_key(x: int, y: int, z: int) -> ChunkKey:
+    """
+    Returns the key of the chunk that contains the voxel (x, y, z)
+    """
+    return (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+
+def pack_location(x: int, y: int, z: int) -> int:
+    """
+    Packs a voxel location into a single non-negative integer
+    """
+    return ((x + PACK_BIAS) << (2 * PACK_BITS)) | ((y + PACK_BIAS) << PACK_BITS) | (z + PACK_BIAS)
+
+def unpack_location(key: int) -> Tuple[int, int, int]:
+    return (
+        ((key >> (2 * PACK_BITS)) & PACK_MASK) - PACK_BIAS,
+        ((key >> PACK_BITS) & PACK_MASK) - PACK_BIAS,
+        (key & PACK_MASK) - PACK_BIAS
+    )
+
+def pack_coords(coords: np.ndarray) -> np.ndarray:
+    """
+    Vectorized version of pack_location for an (N, 3) array of coordinates
+    """
+    coords = np.asarray(coords, dtype=np.int64) + PACK_BIAS
+    return (coords[:, 0] << (2 * PACK_BITS)) | (coords[:, 1] << PACK_BITS) | coords[:, 2]
+
+def unpack_coords(keys: np.ndarray) -> np.ndarray:
+    keys = np.asarray(keys, dtype=np.int64)
+    coords = np.empty((len(keys), 3), dtype=np.int64)
+    coords[:, 0] = (keys >> (2 * PACK_BITS)) & PACK_MASK
+    coords[:, 1] = (keys >> PACK_BITS) & PACK_MASK
+    coords[:, 2] = keys & PACK_MASK
+    return coords - PACK_BIAS
+
+def as_coords(coords) -> np.ndarray:
+    """
+    Converts anything array-like into an (N, 3) int64 array of voxel coordinates
+    """
+    coords = np.asarray(coords, dtype=np.int64)
+    if coords.ndim == 1:
+        coords = coords.reshape(-1, 3)
+    if coords.ndim != 2 or coords.shape[1] != 3:
+        raise ValueError(f"Expected coordinates of shape (N, 3), got {coords.shape}")
+    return coords
+
+def dedupe_coords(coords: np.ndarray, *values: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """
+    Removes duplicate coordinates from a batch, keeping the last occurrence of each one so that later writes win
+    """
+    if len(coords) < 2:
+        return (coords, *values)
+    keys = pack_coords(coords)
+    # np.unique returns the first occurrence so we search the reversed batch
+    _, rev_index = np.unique(keys[::-1], return_index=True)
+    if len(rev_index) == len(coords):
+        return (coords, *values)
+    index = np.sort(len(coords) - 1 - rev_index)
+    return (coords[index], *(value[index] for value in values))
+
+def group_by_chunk(coords: np.ndarray) -> Iterator[Tuple[ChunkKey, np.ndarray, np.ndarray]]:
+    """
+    Splits a batch of coordinates into the chunks they fall in.
+    Yields the chunk key, the indices into the batch and the local (N, 3) coordinates within the chunk.
+    """
+    if len(coords) == 0:
+        return
+    keys = coords >> CHUNK_SHIFT
+    local = coords & CHUNK_MASK
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind="stable")
+    splits = np.cumsum(np.bincount(inverse, minlength=len(unique_keys)))[:-1]
+    for key, index in zip(unique_keys, np.split(order, splits)):
+        yield (int(key[0]), int(key[1]), int(key[2])), index, local[index]
+
+
+class ChunkStore:
+    """
+    Stores one small integer per voxel in fixed size chunks of dense numpy arrays.
+    Chunks are allocated lazily the first time a voxel inside of them is written, and a value of 0 always means that nothing is known about the voxel.
+
+    Stores can be snapshotted cheaply. A snapshot shares every chunk array with the store it was taken from and whichever side writes to a shared chunk first copies it.
+
+    Stores can also be given a memory budget. Once more chunks are loaded than fit in it, the least recently used ones are compressed into a spill file and reloaded when they are next touched.
+    Pinned chunks, such as the ones around active agents, are never evicted.
+    Anything built from the chunks can add an eviction listener to drop its own copy of a chunk's data along with the chunk.
+    """
+    path: Optional[str] = None  # Where the store is persisted, if anywhere
+
+    def __init__(self, dtype=np.uint16):
+        self.dtype = np.dtype(dtype)
+        self._chunks: Dict[ChunkKey, np.ndarray] = {}
+        self._shared: Set[ChunkKey] = set()  # Chunks that another store may still be reading
+        # Snapshots of persistent stores read chunks that were not loaded yet from the original store's files
+        self._fallback_store: Optional['ChunkStore'] = None
+        self._fallback_keys: Set[ChunkKey] = set()
+        # Chunks are kept in least to most recently used order once there is a budget
+        self._max_chunks: Optional[int] = None
+        self._pinned: Set[ChunkKey] = set()
+        self._spill: Optional[SpillFile] = None
+        self._spill_dir: Optional[str] = None
+        self._spilled: Dict[ChunkKey, SpillEntry] = {}
+        self._spilled_bytes = 0
+        self._eviction_listeners: List[Callable[[List[ChunkKey]], None]] = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def __contains__(self, key: ChunkKey) -> bool:
+        return key in self._chunks or key in self._spilled or key in self._fallback_keys
+
+    def keys(self) -> Set[ChunkKey]:
+        return self._chunks.keys() | self._spilled.keys() | self._fallback_keys
+
+    def items(self) -> Iterator[Tuple[ChunkKey, np.ndarray]]:
+        for key in list(self.keys()):
+            yield key, self.get_chunk(key)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The number of bytes taken up by the chunks that are currently loaded
+        """
+        return sum(chunk.nbytes for chunk in self._chunks.values())
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "loaded": len(self._chunks),
+            "spilled": len(self._spilled),
+            "spilled_bytes": self._spilled_bytes,
+        }
+
+    def set_memory_budget(self, max_bytes: Optional[int], spill_dir: Optional[str] = None):
+        """
+        Limits the loaded chunks to max_bytes, spilling the rest into an anonymous file in spill_dir. A budget of None removes the limit.
+        """
+        chunk_bytes = CHUNK_SIZE ** 3 * self.dtype.itemsize
+        self._max_chunks = None if max_bytes is None else max(1, max_bytes // chunk_bytes)
+        self._spill_dir = spill_dir
+        self._evict()
+
+    def set_pinned(self, keys: Set[ChunkKey]):
+        """
+        Sets the chunks that are never evicted
+        """
+        self._pinned = keys
+        self._evict()
+
+    def add_eviction_listener(self, listener: Callable[[List[ChunkKey]], None]):
+        """
+        Calls listener with the keys of every batch of chunks that is evicted from memory
+        """
+        self._eviction_listeners.append(listener)
+
+    def get_chunk(self, key: ChunkKey) -> Optional[np.ndarray]:
+        """
+        Returns the chunk array without allocating it. The returned array should be treated as read only.
+        """
+        chunk = self._chunks.get(key)
+        if chunk is not None:
+            self.hits += 1
+            if self._max_chunks is not None:
+                self._chunks[key] = self._chunks.pop(key)  # Move it to the most recently used end
+            return chunk
+        chunk = self._load_chunk(key)
+        if chunk is not None:
+            self.misses += 1
+            self._chunks[key] = chunk
+            self._evict(keep=key)
+        return chunk
+
+    def _load_chunk(self, key: ChunkKey) -> Optional[np.ndarray]:
+        """
+        Loads a chunk that is not in memory from wherever it is kept, or returns None if it does not exist
+        """
+        entry = self._spilled.pop(key, None)
+        if entry is not None:
+            spill_file, offset, length = entry
+            if spill_file is self._spill:
+                self._spilled_bytes -= length
+            return spill_file.read(offset, length, self.dtype, (CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE))
+        if key in self._fallback_keys:
+            self._fallback_keys.discard(key)
+            return self._fallback_store._read_chunk_file(key)
+        return None
+
+    def _evict(self, keep: Optional[ChunkKey] = None):
+        """
+        Evicts the least recently used chunks that are not pinned until we are back under budget
+        """
+        if self._max_chunks is None or len(self._chunks) <= self._max_chunks:
+            return
+        num_to_evict = len(self._chunks) - int(self._max_chunks * EVICT_FRACTION)
+        victims: List[ChunkKey] = []
+        for key in self._chunks:
+            if len(victims) == num_to_evict:
+                break
+            if key != keep and key not in self._pinned:
+                victims.append(key)
+        for key in victims:
+            self._evict_chunk(key, self._chunks.pop(key))
+            self._shared.discard(key)
+            self.evictions += 1
+        self._compact_spill()
+        for listener in self._eviction_listeners:
+            listener(victims)
+
+    def _evict_chunk(self, key: ChunkKey, chunk: np.ndarray):
+        """
+        Called with every chunk that is evicted. In memory stores have nowhere else to keep chunks so they always spill them.
+        """
+        if self._spill is None:
+            self._spill = SpillFile(self._spill_dir)
+        self._spilled[key] = self._spill.write(chunk)
+        self._spilled_bytes += self._spilled[key][2]
+
+    def _compact_spill(self):
+        """
+        Reloaded chunks leave garbage behind in the spill file, so once most of it is garbage the live entries are moved into a fresh file.
+        The old file stays around for as long as a snapshot still reads from it.
+        """
+        if self._spill is None:
+            return
+        garbage = self._spill.size - self._spilled_bytes
+        if garbage < SPILL_COMPACT_BYTES or garbage < self._spilled_bytes:
+            return
+        spill = SpillFile(self._spill_dir)
+        for key, entry in self._spilled.items():
+            self._spilled[key] = spill.copy_entry(entry)
+        self._spill = spill
+        self._spilled_bytes = spill.size
+
+    def _writable_chunk(self, key: ChunkKey) -> np.ndarray:
+        chunk = self.get_chunk(key)
+        if chunk is None:
+            chunk = np.zeros((CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE), dtype=self.dtype)
+            self._chunks[key] = chunk
+            self._evict(keep=key)
+        elif key in self._shared or not chunk.flags.writeable:
+            chunk = np.array(chunk, dtype=self.dtype)
+            self._chunks[key] = chunk
+            self._shared.discard(key)
+        return chunk
+
+    def get(self, x: int, y: int, z: int) -> int:
+        chunk = self.get_chunk(chunk_key(x, y, z))
+        if chunk is None:
+            return 0
+        return int(chunk[x & CHUNK_MASK, y & CHUNK_MASK, z & CHUNK_MASK])
+
+    def set(self, x: int, y: int, z: int, value: int) -> int:
+        """
+        Sets the value of a single voxel and returns the value it had before
+        """
+        chunk = self._writable_chunk(chunk_key(x, y, z))
+        local = (x & CHUNK_MASK, y & CHUNK_MASK, z & CHUNK_MASK)
+        old = int(chunk[local])
+        chunk[local] = value
+        return old
+
+    def get_many(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Returns the values of an (N, 3) array of voxels
+        """
+        coords = as_coords(coords)
+        values = np.zeros(len(coords), dtype=self.dtype)
+        for key, index, local in group_by_chunk(coords):
+            chunk = self.get_chunk(key)
+            if chunk is not None:
+                values[index] = chunk[local[:, 0], local[:, 1], local[:, 2]]
+        return values
+
+    def set_many(self, coords: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        Sets the values of an (N, 3) array of voxels and returns the values they had before.
+        Coordinates should not repeat within a batch.
+        """
+        coords = as_coords(coords)
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), (len(coords),))
+        old = np.zeros(len(coords), dtype=self.dtype)
+        for key, index, local in group_by_chunk(coords):
+            chunk = self._writable_chunk(key)
+            old[index] = chunk[local[:, 0], local[:, 1], local[:, 2]]
+            chunk[local[:, 0], local[:, 1], local[:, 2]] = values[index]
+        return old
+
+    def set_box(self, min_corner: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        Writes a dense 3D array of values into the box starting at min_corner and returns the values the box had before.
+        Chunks that end up holding a single value are stored as a read only broadcast of that value, so large uniform volumes such as scanned air take almost no memory.
+        """
+        min_corner = np.asarray(min_corner, dtype=np.int64)
+        values = np.asarray(values, dtype=self.dtype)
+        max_corner = min_corner + values.shape - 1
+        old = np.zeros(values.shape, dtype=self.dtype)
+        min_key, max_key = min_corner >> CHUNK_SHIFT, max_corner >> CHUNK_SHIFT
+        for x in range(min_key[0], max_key[0] + 1):
+            for y in range(min_key[1], max_key[1] + 1):
+                for z in range(min_key[2], max_key[2] + 1):
+                    key = (x, y, z)
+                    chunk_min = np.array(key, dtype=np.int64) << CHUNK_SHIFT
+                    low = np.maximum(min_corner, chunk_min)
+                    high = np.minimum(max_corner, chunk_min + CHUNK_MASK)
+                    box_slice = tuple(slice(low[i] - min_corner[i], high[i] - min_corner[i] + 1) for i in range(3))
+                    chunk_slice = tuple(slice(low[i] - chunk_min[i], high[i] - chunk_min[i] + 1) for i in range(3))
+                    block = values[box_slice]
+                    chunk = self.get_chunk(key)
+                    if chunk is None:
+                        if not block.any():
+                            continue  # Writing unknown voxels into a chunk we do not have changes nothing
+                    else:
+                        old[box_slice] = chunk[chunk_slice]
+                        if (old[box_slice] == block).all():
+                            continue
+                    chunk = self._writable_chunk(key)
+                    chunk[chunk_slice] = block
+                    first = chunk.flat[0]
+                    if (chunk == first).all():
+                        self._chunks[key] = np.broadcast_to(np.array(first, dtype=self.dtype), chunk.shape)
+        return old
+
+    def bounds(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns the inclusive minimum and maximum voxel coordinates covered by allocated chunks
+        """
+        if len(self) == 0:
+            return None
+        keys = np.array(list(self.keys()), dtype=np.int64)
+        return keys.min(axis=0) << CHUNK_SHIFT, ((keys.max(axis=0) + 1) << CHUNK_SHIFT) - 1
+
+    def snapshot(self) -> 'ChunkStore':
+        """
+        Returns an in memory store with the same contents that can be read and written independently of this one.
+        This only costs a dictionary copy since chunk arrays are shared until one side writes to them.
+        """
+        snapshot = ChunkStore(self.dtype)
+        snapshot._chunks = dict(self._chunks)
+        snapshot._shared = set(self._chunks.keys())
+        self._shared.update(self._chunks.keys())
+        # Spill entries are never overwritten so the snapshot reads the chunks we spilled straight from our spill file
+        snapshot._spilled = dict(self._spilled)
+        if self._fallback_store is not None:
+            snapshot._fallback_store = self._fallback_store
+            snapshot._fallback_keys = set(self._fallback_keys)
+            self._fallback_store._register_snapshot(snapshot)
+        return snapshot
+
+    def _read_chunk_file(self, key: ChunkKey) -> np.ndarray:
+        raise NotImplementedError("Only persistent stores have chunk files")
+
+    def _register_snapshot(self, snapshot: 'ChunkStore'):
+        raise NotImplementedError("Only persistent stores have chunk files")
+
+    def flush(self):
+        """
+        Writes any unsaved changes to wherever the store is persisted. In memory stores have nothing to do.
+        """
+        pass
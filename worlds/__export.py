@@ -0,0 +1,156 @@
+"""
+Headless exporters for SubWorlds.
+Everything here streams the world one chunk at a time so that exporting never builds a dense array of the whole bounding box.
+The async variants export a snapshot from a worker thread so that the event loop keeps serving agents.
+Tiles are a compact binary encoding of a single chunk for viewers outside of the process.
+"""
+
+import asyncio
+import json
+import os
+import struct
+import zipfile
+import zlib
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from models.__world_models import BlockData
+from .__chunk_store import CHUNK_SHIFT, CHUNK_SIZE, ChunkKey
+from .__palette import BlockPalette
+from .__world import SubWorld
+
+def export_npz(world: SubWorld, path: str):
+    """
+    Writes every chunk as a compressed .npy entry named chunk_{x}_{y}_{z} plus the palette as palette.json.
+    The result can be opened with np.load, or turned back into a world with load_npz.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with zipfile.ZipFile(path + ".tmp", "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for (x, y, z), chunk in world._store.items():
+            with archive.open(f"chunk_{x}_{y}_{z}.npy", "w", force_zip64=True) as f:
+                np.lib.format.write_array(f, np.ascontiguousarray(chunk), allow_pickle=False)
+        palette = [world.palette.get(block_id) for block_id in range(len(world.palette))]
+        archive.writestr("palette.json", json.dumps([block.dict(exclude={"occupied"}) if block is not None else None for block in palette]))
+    os.replace(path + ".tmp", path)
+
+def load_npz(path: str) -> SubWorld:
+    """
+    Loads a world written by export_npz
+    """
+    palette = BlockPalette()
+    world = SubWorld(palette=palette)
+    with zipfile.ZipFile(path) as archive:
+        for block_id, block in enumerate(json.loads(archive.read("palette.json"))):
+            if block is not None:
+                palette.restore(block_id, BlockData.parse_obj(block))
+        for name in archive.namelist():
+            if not name.startswith("chunk_"):
+                continue
+            x, y, z = (int(part) for part in name[len("chunk_"):-len(".npy")].split("_"))
+            with archive.open(name) as f:
+                chunk = np.lib.format.read_array(f)
+            local = np.argwhere(chunk != BlockPalette.UNKNOWN)
+            world.set_block_id_batch(local + (np.array([x, y, z]) << CHUNK_SHIFT), chunk[tuple(local.T)])
+    return world
+
+def _block_color(block: BlockData) -> Tuple[int, int, int, int]:
+    if not block.occupied:
+        return (255, 255, 255, 32)
+    # A stable color per block name so the same block looks the same in every layer and export
+    rgb = zlib.crc32(block.name.encode()).to_bytes(4, "little")[:3]
+    return (rgb[0], rgb[1], rgb[2], 255)
+
+def _palette_colors(palette: BlockPalette) -> np.ndarray:
+    colors = np.zeros((len(palette), 4), dtype=np.uint8)
+    colors[BlockPalette.UNKNOWN_OCCUPIED] = (64, 64, 64, 255)
+    for block_id in range(BlockPalette.UNKNOWN_OCCUPIED + 1, len(palette)):
+        colors[block_id] = _block_color(palette.get(block_id))
+    return colors
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+def export_layer_pngs(world: SubWorld, directory: str):
+    """
+    Writes one RGBA png per up level, with forward along the image rows and side along the columns.
+    Unknown voxels are transparent, air is faint white and every other block gets a color derived from its name.
+    Images are compressed one strip of chunks at a time so only a single row of chunks is ever in memory.
+    """
+    bounds = world._store.bounds()
+    if bounds is None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    (min_forward, min_side, min_up), (max_forward, max_side, max_up) = bounds
+    width = max_side - min_side + 1
+    height = max_forward - min_forward + 1
+    colors = _palette_colors(world.palette)
+
+    # Group chunks by their up and forward chunk coordinates so that each strip of image rows can be built on its own
+    strips: Dict[Tuple[int, int], Dict[int, ChunkKey]] = {}
+    for key in world._store.keys():
+        strips.setdefault((key[2], key[0]), {})[key[1]] = key
+
+    for up in range(min_up, max_up + 1):
+        chunk_up = up >> CHUNK_SHIFT
+        local_up = up & (CHUNK_SIZE - 1)
+        compressor = zlib.compressobj()
+        data = []
+        for chunk_forward in range(min_forward >> CHUNK_SHIFT, (max_forward >> CHUNK_SHIFT) + 1):
+            strip = np.zeros((CHUNK_SIZE, width, 4), dtype=np.uint8)
+            for chunk_side, key in strips.get((chunk_up, chunk_forward), {}).items():
+                chunk = world._store.get_chunk(key)
+                column = (chunk_side << CHUNK_SHIFT) - min_side
+                strip[:, column:column + CHUNK_SIZE] = colors[chunk[:, :, local_up]]
+            # Every png row starts with a filter type byte, 0 meaning no filter
+            rows = np.concatenate((np.zeros((CHUNK_SIZE, 1), dtype=np.uint8), strip.reshape(CHUNK_SIZE, -1)), axis=1)
+            data.append(compressor.compress(rows.tobytes()))
+        data.append(compressor.flush())
+        header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)  # 8 bit RGBA
+        with open(os.path.join(directory, f"up_{up}.png"), "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+            f.write(_png_chunk(b"IHDR", header))
+            f.write(_png_chunk(b"IDAT", b"".join(data)))
+            f.write(_png_chunk(b"IEND", b""))
+
+TILE_MAGIC = b"WTIL"
+TILE_FORMAT_VERSION = 1
+TILE_HEADER = struct.Struct("<4sBBiii")  # Magic, format version, chunk shift and the chunk key
+
+def encode_tile(world: SubWorld, key: ChunkKey) -> Optional[bytes]:
+    """
+    Encodes a chunk as a tile, or returns None if the world has no such chunk.
+    After the header comes a zlib stream holding the packed known bits, the packed occupied bits and then the little endian uint16 palette id of every voxel, all in (forward, side, up) order.
+    """
+    chunk = world._store.get_chunk(key)
+    if chunk is None:
+        return None
+    known, occupied = world.occupancy.chunk_bits(key)
+    payload = known + occupied + np.ascontiguousarray(chunk, dtype="<u2").tobytes()
+    return TILE_HEADER.pack(TILE_MAGIC, TILE_FORMAT_VERSION, CHUNK_SHIFT, *key) + zlib.compress(payload)
+
+def decode_tile(data: bytes) -> Tuple[ChunkKey, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decodes a tile into its chunk key and its known, occupied and palette id arrays
+    """
+    magic, version, shift, x, y, z = TILE_HEADER.unpack_from(data)
+    if magic != TILE_MAGIC or version != TILE_FORMAT_VERSION:
+        raise ValueError("Not a tile or an unsupported tile version")
+    size = 1 << shift
+    shape = (size, size, size)
+    payload = zlib.decompress(data[TILE_HEADER.size:])
+    num_bits = size ** 3 // 8
+    known = np.unpackbits(np.frombuffer(payload, dtype=np.uint8, count=num_bits), bitorder="little").view(bool).reshape(shape)
+    occupied = np.unpackbits(np.frombuffer(payload, dtype=np.uint8, count=num_bits, offset=num_bits), bitorder="little").view(bool).reshape(shape)
+    block_ids = np.frombuffer(payload, dtype="<u2", offset=2 * num_bits).astype(np.uint16).reshape(shape)
+    return (x, y, z), known, occupied, block_ids
+
+async def export_npz_async(world: SubWorld, path: str):
+    """
+    Exports a snapshot of the world from a worker thread so that scans can keep arriving while it is written
+    """
+    snapshot = world.snapshot()
+    await asyncio.get_running_loop().run_in_executor(None, export_npz, snapshot, path)
+
+async def export_layer_pngs_async(world: SubWorld, directory: str):
+    snapshot = world.snapshot()
+    await asyncio.get_running_loop().run_in_executor(None, export_layer_pngs, snapshot, directory)
@@ -0,0 +1,225 @@
+"""
+Goals for the PathPlanner.
+A goal packs its test into a set lookup or a few comparisons and comes with one consistent heuristic, so a search toward hundreds of targets costs about the same as a search toward one.
+"""
+
+import numpy as np
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from models.__agent_models import AgentState, StateLocation
+from .__search import Heuristic, SearchBudget, orientation_index, pack_location, pack_state, state_from_agent_state, state_heuristic, unpack_state
+
+if TYPE_CHECKING:
+    from .__world import SubWorld
+
+MAX_LISTED_GOAL_STATES = 65536  # Goals with more states than this are only tested, so the planner searches from the start alone
+UNLISTED_GOAL_BUDGET = SearchBudget(max_expansions=1000000, max_seconds=10.0)  # What a search from the start alone gets when the caller gives it no budget
+EXACT_HEURISTIC_GOALS = 8  # Up to this many goals the heuristic checks every one of them, turns included
+LEAF_SIZE = 8
+ADJACENT_OFFSETS = np.array([(1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)], dtype=np.int64)
+
+Location = Tuple[int, int, int]
+
+def box_distance(forward: int, side: int, up: int, min_corner: Location, max_corner: Location) -> int:
+    """
+    Manhattan distance from a voxel to the closest voxel of an inclusive box
+    """
+    return (
+        max(min_corner[0] - forward, 0, forward - max_corner[0]) +
+        max(min_corner[1] - side, 0, side - max_corner[1]) +
+        max(min_corner[2] - up, 0, up - max_corner[2])
+    )
+
+class NearestLocation:
+    """
+    A bounding volume hierarchy over a fixed set of locations that answers the manhattan distance to the closest one.
+    Boxes farther away than the best distance so far are skipped, which makes a query cost about the log of the number of locations.
+    """
+    def __init__(self, locations: np.ndarray):
+        self._boxes: List[Tuple[Location, Location]] = []
+        self._children: List[Optional[Tuple[int, int]]] = []
+        self._leaves: List[Optional[List[Location]]] = []
+        self._build(np.asarray(locations, dtype=np.int64).reshape(-1, 3))
+
+    def _build(self, locations: np.ndarray) -> int:
+        node = len(self._boxes)
+        self._boxes.append((tuple(locations.min(axis=0).tolist()), tuple(locations.max(axis=0).tolist())))
+        self._children.append(None)
+        self._leaves.append(None)
+        if len(locations) <= LEAF_SIZE:
+            self._leaves[node] = [tuple(location) for location in locations.tolist()]
+            return node
+        # Split at the median of the longest side of the box
+        axis = int(np.argmax(locations.max(axis=0) - locations.min(axis=0)))
+        order = np.argsort(locations[:, axis], kind="stable")
+        half = len(order) // 2
+        left = self._build(locations[order[:half]])
+        right = self._build(locations[order[half:]])
+        self._children[node] = (left, right)
+        return node
+
+    def distance(self, forward: int, side: int, up: int) -> int:
+        best = None
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            min_corner, max_corner = self._boxes[node]
+            if best is not None and box_distance(forward, side, up, min_corner, max_corner) >= best:
+                continue
+            leaf = self._leaves[node]
+            if leaf is not None:
+                for leaf_forward, leaf_side, leaf_up in leaf:
+                    distance = abs(forward - leaf_forward) + abs(side - leaf_side) + abs(up - leaf_up)
+                    if best is None or distance < best:
+                        best = distance
+                continue
+            left, right = self._children[node]
+            # Visit the closer child first so that the farther one is more likely to be skipped
+            if box_distance(forward, side, up, *self._boxes[left]) <= box_distance(forward, side, up, *self._boxes[right]):
+                stack.extend((right, left))
+            else:
+                stack.extend((left, right))
+        return best
+
+class Goal:
+    """
+    A Goal tells a search when it is done and how far it has left to go.
+    is_goal and heuristic work on packed states. goal_states lists every goal state so that a search can also run backward from the goal, or returns None if there are too many of them.
+    """
+    def is_goal(self, state: int) -> bool:
+        raise NotImplementedError()
+
+    def heuristic(self) -> Heuristic:
+        """
+        Returns a consistent lower bound on the cost from a state to the goal
+        """
+        raise NotImplementedError()
+
+    def goal_states(self) -> Optional[List[int]]:
+        return None
+
+    def locations(self) -> Optional[List[StateLocation]]:
+        """
+        Returns the goal's locations for the reachability check, or None to skip it
+        """
+        return None
+
+    def cache_key(self) -> Optional[Hashable]:
+        """
+        Returns a key that is equal for goals that are reached at the same states, so that the PathPlanner can cache paths to them, or None to never cache
+        """
+        return None
+
+class StateGoal(Goal):
+    """
+    Reached at any of a list of AgentStates. States without an orientation are reached in any orientation.
+    """
+    def __init__(self, end_states: List[AgentState]):
+        self.end_states = end_states
+        self._states: Set[int] = {state_from_agent_state(end_state) for end_state in end_states if end_state.orientation is not None}
+        self._locations: Set[int] = {pack_location(end_state.location) for end_state in end_states if end_state.orientation is None}
+        self._nearest: Optional[NearestLocation] = None
+        if len(end_states) > EXACT_HEURISTIC_GOALS:
+            self._nearest = NearestLocation(np.array([(state.location.forward, state.location.side, state.location.up) for state in end_states]))
+
+    def __repr__(self) -> str:
+        if len(self.end_states) <= EXACT_HEURISTIC_GOALS:
+            return f"{type(self).__name__}({self.end_states})"
+        return f"{type(self).__name__}({len(self.end_states)} states)"
+
+    def is_goal(self, state: int) -> bool:
+        return state in self._states or state >> 2 in self._locations
+
+    def heuristic(self) -> Heuristic:
+        if self._nearest is None:
+            return state_heuristic([
+                (state.location.forward, state.location.side, state.location.up, None if state.orientation is None else orientation_index(state.orientation))
+                for state in self.end_states
+            ])
+        # With many goals we drop the turns, which keeps the heuristic consistent and lets it be answered by the hierarchy
+        nearest = self._nearest.distance
+        cache: Dict[Location, int] = {}
+        def heuristic(forward: int, side: int, up: int, orientation: int) -> int:
+            location = (forward, side, up)
+            distance = cache.get(location)
+            if distance is None:
+                distance = cache[location] = nearest(forward, side, up)
+            return distance
+        return heuristic
+
+    def goal_states(self) -> Optional[List[int]]:
+        return list(self._states) + [(location << 2) | orientation for location in self._locations for orientation in range(4)]
+
+    def locations(self) -> Optional[List[StateLocation]]:
+        return [end_state.location for end_state in self.end_states]
+
+    def cache_key(self) -> Optional[Hashable]:
+        return "states", frozenset(self._states), frozenset(self._locations)
+
+class LocationGoal(StateGoal):
+    """
+    Reached at any of a set of locations, in any orientation
+    """
+    def __init__(self, locations: Iterable[StateLocation]):
+        super().__init__([AgentState(location=location) for location in locations])
+
+    @classmethod
+    def from_coords(cls, coords: np.ndarray) -> 'LocationGoal':
+        return cls(StateLocation(forward=forward, side=side, up=up) for forward, side, up in np.asarray(coords).reshape(-1, 3).tolist())
+
+class BoxGoal(Goal):
+    """
+    Reached anywhere inside of an inclusive axis aligned box, in any orientation
+    """
+    def __init__(self, min_location: StateLocation, max_location: StateLocation):
+        self.min_corner = (min(min_location.forward, max_location.forward), min(min_location.side, max_location.side), min(min_location.up, max_location.up))
+        self.max_corner = (max(min_location.forward, max_location.forward), max(min_location.side, max_location.side), max(min_location.up, max_location.up))
+
+    def __repr__(self) -> str:
+        return f"BoxGoal({self.min_corner}, {self.max_corner})"
+
+    @property
+    def volume(self) -> int:
+        return int(np.prod([high - low + 1 for low, high in zip(self.min_corner, self.max_corner)]))
+
+    def is_goal(self, state: int) -> bool:
+        forward, side, up, _ = unpack_state(state)
+        return self.min_corner[0] <= forward <= self.max_corner[0] and self.min_corner[1] <= side <= self.max_corner[1] and self.min_corner[2] <= up <= self.max_corner[2]
+
+    def heuristic(self) -> Heuristic:
+        min_corner, max_corner = self.min_corner, self.max_corner
+        return lambda forward, side, up, orientation: box_distance(forward, side, up, min_corner, max_corner)
+
+    def _coords(self) -> Iterable[Location]:
+        for forward in range(self.min_corner[0], self.max_corner[0] + 1):
+            for side in range(self.min_corner[1], self.max_corner[1] + 1):
+                for up in range(self.min_corner[2], self.max_corner[2] + 1):
+                    yield forward, side, up
+
+    def goal_states(self) -> Optional[List[int]]:
+        if 4 * self.volume > MAX_LISTED_GOAL_STATES:
+            return None
+        return [pack_state(forward, side, up, orientation) for forward, side, up in self._coords() for orientation in range(4)]
+
+    def locations(self) -> Optional[List[StateLocation]]:
+        if 4 * self.volume > MAX_LISTED_GOAL_STATES:
+            return None
+        return [StateLocation(forward=forward, side=side, up=up) for forward, side, up in self._coords()]
+
+    def cache_key(self) -> Optional[Hashable]:
+        return "box", self.min_corner, self.max_corner
+
+class AdjacentBlockGoal(LocationGoal):
+    """
+    Reached next to any known block with the given name and tag, such as any ore or any chest, so that the agent can dig or use it.
+    The blocks are looked up once when the goal is made.
+    """
+    def __init__(self, world: 'SubWorld', name: Optional[str] = None, tag: Optional[str] = None):
+        self.name = name
+        self.tag = tag
+        blocks = world.find_block_coords(name, tag)
+        self.block_coords = blocks
+        # A block can not be stood in, so neighbors that are themselves one of the blocks are left out
+        block_set = set(map(tuple, blocks.tolist()))
+        neighbors = {tuple(neighbor) for neighbor in (blocks[:, None, :] + ADJACENT_OFFSETS[None, :, :]).reshape(-1, 3).tolist()} - block_set
+        super().__init__(StateLocation(forward=forward, side=side, up=up) for forward, side, up in sorted(neighbors))
@@ -0,0 +1,280 @@
+"""
+Hierarchical path planning over chunks, in the style of HPA*.
+The ChunkGraph is a small graph of the world's known free space. Its nodes are the voxels on either side of the openings between neighboring chunks, and its edges are the crossings between them and the walking distances between the openings of one chunk.
+A long trip is planned on this graph first, which picks the chunks the path goes through, and is then refined one chunk at a time by the PathPlanner's regular search.
+"""
+
+import heapq
+import numpy as np
+from typing import Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from models.__agent_models import AgentState
+from .__chunk_store import ChunkKey, CHUNK_SHIFT, CHUNK_SIZE, CHUNK_MASK
+from .__goals import EXACT_HEURISTIC_GOALS, NearestLocation
+from .__reachability import AXES, label_free_space
+from .__search import unpack_state
+
+if TYPE_CHECKING:
+    from .__world import SubWorld
+
+Location = Tuple[int, int, int]
+Edges = List[Tuple[Optional[Location], int]]  # (node, cost) pairs, where a None node is the goal
+
+OPENING_SPLIT = CHUNK_SIZE // 2  # Openings are split into squares of this size on their face so that wide openings get a node near every part of them
+MAX_SOURCES = 64  # Sources of one pass of chunk_distances, one per bit
+MIN_DISTANCE = 3 * CHUNK_SIZE  # Trips shorter than this are planned directly
+MAX_GOALS = 4096
+REFINE_CHUNKS = 1  # Chunks each refining search crosses. More make paths closer to the shortest but searches bigger
+
+def chunk_of(location: Location) -> ChunkKey:
+    return (location[0] >> CHUNK_SHIFT, location[1] >> CHUNK_SHIFT, location[2] >> CHUNK_SHIFT)
+
+def _chunk_origin(key: ChunkKey) -> np.ndarray:
+    return np.array(key, dtype=np.int64) << CHUNK_SHIFT
+
+def chunk_distances(free: np.ndarray, sources: List[List[Location]], targets: List[Location]) -> np.ndarray:
+    """
+    Returns the number of moves between every source and every target inside a chunk, or -1 if a target can not be reached without leaving the chunk.
+    A source is a list of voxels and its distance is to the closest of them. Voxels are in the chunk's local coordinates.
+    Up to MAX_SOURCES breadth first searches run at once, with one bit of every voxel for each of them.
+    """
+    distances = np.full((len(sources), len(targets)), -1, dtype=np.int64)
+    if len(targets) == 0:
+        return distances
+    target_index = tuple(np.array(targets, dtype=np.int64).T)
+    free_bits = np.where(free, np.uint64(0xFFFFFFFFFFFFFFFF), np.uint64(0))
+    for first in range(0, len(sources), MAX_SOURCES):
+        batch = sources[first:first + MAX_SOURCES]
+        reached = np.zeros(free.shape, dtype=np.uint64)
+        for bit, voxels in enumerate(batch):
+            for voxel in voxels:
+                reached[voxel] |= np.uint64(1 << bit)
+        reached &= free_bits
+        found = np.zeros(len(targets), dtype=np.uint64)
+        distance = 0
+        while True:
+            new = reached[target_index] & ~found
+            for target in np.flatnonzero(new).tolist():
+                bits = int(new[target])
+                while bits:
+                    bit = (bits & -bits).bit_length() - 1
+                    distances[first + bit, target] = distance
+                    bits &= bits - 1
+            found |= new
+            grown = reached.copy()
+            for axis in range(3):
+                lower = [slice(None)] * 3
+                upper = [slice(None)] * 3
+                lower[axis], upper[axis] = slice(None, -1), slice(1, None)
+                lower, upper = tuple(lower), tuple(upper)
+                grown[lower] |= reached[upper]
+                grown[upper] |= reached[lower]
+            grown &= free_bits
+            if (grown == reached).all():
+                break
+            reached = grown
+            distance += 1
+    return distances
+
+class ChunkFilter:
+    """
+    Rejects states outside of a set of chunks, which keeps the refinement of a hierarchical plan inside the chunks the plan picked
+    """
+    def __init__(self, keys: Set[ChunkKey]):
+        self.keys = keys
+
+    def __call__(self, state: AgentState) -> bool:
+        return chunk_of((state.location.forward, state.location.side, state.location.up)) not in self.keys
+
+    def reject_packed(self, state: int) -> bool:
+        forward, side, up, _ = unpack_state(state)
+        return (forward >> CHUNK_SHIFT, side >> CHUNK_SHIFT, up >> CHUNK_SHIFT) not in self.keys
+
+class ChunkGraph:
+    """
+    The ChunkGraph holds the openings between chunks and the walking distances between the openings of each chunk.
+    Only known free voxels count as free, as if unknown space were occupied. Chunks are added the first time a search reaches them and dropped when the world says they changed, along with their neighbors whose openings they share.
+    """
+    def __init__(self, world: 'SubWorld'):
+        self.world = world
+        self._version = world.version
+        self._faces: Dict[Tuple[ChunkKey, int], List[Tuple[Location, Location]]] = {}  # Crossings from a chunk to its positive neighbor along an axis
+        self._links: Dict[ChunkKey, Dict[Location, List[Location]]] = {}  # The nodes of a chunk and the nodes across the face from them
+        self._edges: Dict[ChunkKey, Dict[Location, Edges]] = {}
+        self.chunks_built = 0
+
+    def __len__(self) -> int:
+        return len(self._edges)
+
+    def _refresh(self):
+        if self.world.version == self._version:
+            return
+        changed = self.world.changes_since(self._version)
+        self._version = self.world.version
+        for key in changed:
+            self._links.pop(key, None)
+            self._edges.pop(key, None)
+            for axis, offset in enumerate(AXES):
+                below = (key[0] - offset[0], key[1] - offset[1], key[2] - offset[2])
+                above = (key[0] + offset[0], key[1] + offset[1], key[2] + offset[2])
+                self._faces.pop((key, axis), None)
+                self._faces.pop((below, axis), None)
+                for neighbor in (below, above):
+                    self._links.pop(neighbor, None)
+                    self._edges.pop(neighbor, None)
+
+    def _free(self, key: ChunkKey) -> Optional[np.ndarray]:
+        masks = self.world.occupancy.chunk_masks(key)
+        if masks is None:
+            return None
+        known, occupied = masks
+        return known & ~occupied
+
+    def _face(self, key: ChunkKey, axis: int) -> List[Tuple[Location, Location]]:
+        """
+        Returns a crossing for every part of every opening between key and its positive neighbor along axis
+        """
+        face = self._faces.get((key, axis))
+        if face is not None:
+            return face
+        offset = AXES[axis]
+        free, neighbor_free = self._free(key), self._free((key[0] + offset[0], key[1] + offset[1], key[2] + offset[2]))
+        face = []
+        if free is not None and neighbor_free is not None:
+            open_cells = np.take(free, CHUNK_MASK, axis=axis) & np.take(neighbor_free, 0, axis=axis)
+            if open_cells.any():
+                labels, num_labels = label_free_space(open_cells[:, :, None])
+                labels = labels[:, :, 0]
+                origin = _chunk_origin(key)
+                for row in range(0, CHUNK_SIZE, OPENING_SPLIT):
+                    for column in range(0, CHUNK_SIZE, OPENING_SPLIT):
+                        square = labels[row:row + OPENING_SPLIT, column:column + OPENING_SPLIT]
+                        for label in np.unique(square[square > 0]).tolist():
+                            # The cell of this part of the opening that is closest to its middle
+                            cells = np.argwhere(square == label)
+                            cell = cells[np.abs(cells - cells.mean(axis=0)).sum(axis=1).argmin()] + (row, column)
+                            local = np.insert(cell, axis, CHUNK_MASK)
+                            inside = tuple((origin + local).tolist())
+                            face.append((inside, (inside[0] + offset[0], inside[1] + offset[1], inside[2] + offset[2])))
+        self._faces[(key, axis)] = face
+        return face
+
+    def _chunk(self, key: ChunkKey) -> Tuple[Dict[Location, List[Location]], Dict[Location, Edges]]:
+        """
+        Returns the nodes of a chunk with the nodes they cross to, and the walking distances between them
+        """
+        edges = self._edges.get(key)
+        if edges is not None:
+            return self._links[key], edges
+        links: Dict[Location, List[Location]] = {}
+        for axis, offset in enumerate(AXES):
+            for inside, outside in self._face(key, axis):
+                links.setdefault(inside, []).append(outside)
+            for outside, inside in self._face((key[0] - offset[0], key[1] - offset[1], key[2] - offset[2]), axis):
+                links.setdefault(inside, []).append(outside)
+        nodes = list(links)
+        edges = {node: [] for node in nodes}
+        free = self._free(key)
+        if free is not None and len(nodes) > 1:
+            origin = _chunk_origin(key)
+            local = [tuple((np.array(node) - origin).tolist()) for node in nodes]
+            distances = chunk_distances(free, [[voxel] for voxel in local], local)
+            for i, node in enumerate(nodes):
+                edges[node] = [(nodes[j], int(distances[i, j])) for j in np.flatnonzero(distances[i] > 0).tolist()]
+        self._links[key] = links
+        self._edges[key] = edges
+        self.chunks_built += 1
+        return links, edges
+
+    def _distances_from(self, key: ChunkKey, sources: List[List[Location]]) -> Tuple[List[Location], np.ndarray]:
+        """
+        Returns the nodes of a chunk and the distances from each source to them. Sources are in world coordinates.
+        """
+        links, _ = self._chunk(key)
+        nodes = list(links)
+        free = self._free(key)
+        if free is None:
+            return nodes, np.full((len(sources), len(nodes)), -1, dtype=np.int64)
+        origin = _chunk_origin(key)
+        to_local = lambda location: tuple((np.array(location) - origin).tolist())
+        return nodes, chunk_distances(free, [[to_local(voxel) for voxel in source] for source in sources], [to_local(node) for node in nodes])
+
+    def abstract_path(self, start: Location, goals: List[Location]) -> Tuple[Optional[List[Location]], int]:
+        """
+        Runs A* on the graph from start to the closest of goals. Returns the nodes the path goes through, starting with start, and the number of expansions.
+        The returned path is None if no goal can be reached through known free space or start is not free.
+        """
+        self._refresh()
+        goals_by_chunk: Dict[ChunkKey, List[Location]] = {}
+        for goal in goals:
+            goals_by_chunk.setdefault(chunk_of(goal), []).append(goal)
+        if len(goals) > EXACT_HEURISTIC_GOALS:
+            nearest = NearestLocation(np.array(goals)).distance
+            heuristic = lambda location: nearest(*location)
+        else:
+            heuristic = lambda location: min(abs(location[0] - goal[0]) + abs(location[1] - goal[1]) + abs(location[2] - goal[2]) for goal in goals)
+        to_goal: Dict[ChunkKey, Dict[Location, int]] = {}  # Distances from the nodes of a chunk with goals in it to the closest of them
+
+        def goal_edges(key: ChunkKey, node: Location) -> Edges:
+            chunk_goals = goals_by_chunk.get(key)
+            if chunk_goals is None:
+                return []
+            costs = to_goal.get(key)
+            if costs is None:
+                nodes, distances = self._distances_from(key, [chunk_goals])
+                costs = to_goal[key] = {node: int(distance) for node, distance in zip(nodes, distances[0].tolist()) if distance >= 0}
+            cost = costs.get(node)
+            return [] if cost is None else [(None, cost)]
+
+        # The start is not a node, so its edges come from a search of its chunk of their own
+        start_key = chunk_of(start)
+        free = self._free(start_key)
+        if free is None or not free[tuple(np.array(start) & CHUNK_MASK)]:
+            return None, 0
+        links, _ = self._chunk(start_key)
+        nodes, distances = self._distances_from(start_key, [[start]])
+        start_edges: Edges = [(node, int(distance)) for node, distance in zip(nodes, distances[0].tolist()) if distance > 0]
+        start_edges.extend((outside, 1) for outside in links.get(start, []))
+        if start_key in goals_by_chunk:
+            origin = _chunk_origin(start_key)
+            reach = chunk_distances(free, [[tuple((np.array(start) - origin).tolist())]], [tuple((np.array(goal) - origin).tolist()) for goal in goals_by_chunk[start_key]])[0]
+            if (reach >= 0).any():
+                start_edges.append((None, int(reach[reach >= 0].min())))
+
+        g_scores: Dict[Optional[Location], int] = {start: 0}
+        parents: Dict[Optional[Location], Optional[Location]] = {start: None}
+        closed = set()
+        heap = [(heuristic(start), 0, 0, start)]
+        pushed = 1
+        expansions = 0
+        while heap:
+            _, _, _, node = heapq.heappop(heap)
+            if node is None:
+                path = []
+                node = parents[None]
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                path.reverse()
+                return path, expansions
+            if node in closed:
+                continue
+            closed.add(node)
+            expansions += 1
+            if node == start:
+                edges = start_edges
+            else:
+                key = chunk_of(node)
+                links, chunk_edges = self._chunk(key)
+                edges = chunk_edges.get(node, []) + [(outside, 1) for outside in links.get(node, [])] + goal_edges(key, node)
+            g = g_scores[node]
+            for neighbor, cost in edges:
+                neighbor_g = g + cost
+                if neighbor in closed or neighbor_g >= g_scores.get(neighbor, neighbor_g + 1):
+                    continue
+                g_scores[neighbor] = neighbor_g
+                parents[neighbor] = node
+                h = 0 if neighbor is None else heuristic(neighbor)
+                heapq.heappush(heap, (neighbor_g + h, h, pushed, neighbor))
+                pushed += 1
+        return None, expansions
@@ -0,0 +1,210 @@
+"""
+Importers that fill a SubWorld from maps saved by Minecraft or its tools, so agents can plan across areas we already know without scanning them first.
+Everything is given in minecraft world coordinates and written into the world's shared frame, where forward is +x, side is -z and up is +y.
+Voxels are written one box at a time, so a region file only ever has a single chunk decompressed and a schematic only a single slab of ids.
+"""
+
+import os
+import struct
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from models.__world_models import BlockData
+from .__chunk_store import CHUNK_SIZE
+from .__nbt import NBTError, NBTReader, TAG_COMPOUND, open_nbt, read_nbt, read_nbt_bytes
+from .__world import SubWorld
+
+AIR_NAMES = {"minecraft:air", "minecraft:cave_air", "minecraft:void_air"}
+REGION_SECTOR_SIZE = 4096
+NON_SPANNING_DATA_VERSION = 2527  # 20w17a, the first version where block state indices stopped spanning two longs
+
+def _parse_block_string(block: str) -> Tuple[str, Optional[Dict[str, str]]]:
+    """
+    Splits a block state string like minecraft:oak_stairs[facing=north,half=bottom] into its name and properties
+    """
+    if not block.endswith("]") or "[" not in block:
+        return block, None
+    name, properties = block[:-1].split("[", 1)
+    return name, dict(prop.split("=", 1) for prop in properties.split(",") if "=" in prop)
+
+def _palette_ids(world: SubWorld, entries: Sequence[Tuple[str, Optional[Dict[str, Any]]]]) -> np.ndarray:
+    """
+    Interns (name, properties) palette entries into the world's palette. All kinds of air become plain air so that they are not occupied.
+    """
+    block_ids = np.empty(len(entries), dtype=np.uint16)
+    for i, (name, properties) in enumerate(entries):
+        if name in AIR_NAMES:
+            block_ids[i] = world.palette.intern_name("minecraft:air")
+        else:
+            block_ids[i] = world.palette.intern(BlockData(name=name, state=properties or None))
+    return block_ids
+
+def _write_world_box(world: SubWorld, min_world: Tuple[int, int, int], block_ids: np.ndarray) -> int:
+    """
+    Writes a dense array of palette ids indexed [x, y, z] in minecraft world coordinates with min_world at its [0, 0, 0]
+    """
+    x, y, z = min_world
+    depth = block_ids.shape[2]
+    # Shared coordinates are (x, -z, y) so the z axis becomes the side axis, reversed
+    shared_ids = np.ascontiguousarray(np.flip(np.transpose(block_ids, (0, 2, 1)), axis=1))
+    world._write_box(np.array([x, -(z + depth - 1), y], dtype=np.int64), shared_ids)
+    return block_ids.size
+
+def _decode_varints(data: np.ndarray) -> np.ndarray:
+    """
+    Decodes the varint encoded block data of a sponge schematic
+    """
+    data = data.view(np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    values = np.zeros(len(ends), dtype=np.int64)
+    for i in range(5):
+        positions = starts + i
+        valid = positions <= ends
+        if not valid.any():
+            break
+        values[valid] |= (data[positions[valid]].astype(np.int64) & 0x7F) << (7 * i)
+    return values
+
+def import_schematic(world: SubWorld, path: str, origin: Tuple[int, int, int] = (0, 0, 0)) -> int:
+    """
+    Imports a Sponge schematic (.schem, versions 2 and 3) with its minimum corner at the world coordinates origin.
+    Returns the number of voxels written.
+    """
+    with open_nbt(path) as f:
+        root = read_nbt(f)
+    schematic = root.get("Schematic", root)
+    if "Width" not in schematic:
+        raise NBTError(f"{path} is not a sponge schematic")
+    width, height, length = (schematic[key] & 0xFFFF for key in ("Width", "Height", "Length"))
+    blocks = schematic.get("Blocks", schematic)  # Version 3 moved the palette and data into a Blocks compound
+    palette: Dict[str, int] = blocks["Palette"]
+    data = blocks["Data"] if "Data" in blocks else blocks["BlockData"]
+
+    entries: List[Tuple[str, Optional[Dict[str, str]]]] = [("minecraft:air", None)] * (max(palette.values()) + 1)
+    for block, index in palette.items():
+        entries[index] = _parse_block_string(block)
+    lookup = _palette_ids(world, entries)
+    # Indices are ordered by y, then z, then x
+    indices = _decode_varints(data)[:width * height * length].reshape(height, length, width)
+
+    count = 0
+    for y in range(0, height, CHUNK_SIZE):
+        slab = lookup[indices[y:y + CHUNK_SIZE]].transpose(2, 0, 1)
+        count += _write_world_box(world, (origin[0], origin[1] + y, origin[2]), slab)
+    return count
+
+def import_structure(world: SubWorld, path: str, origin: Tuple[int, int, int] = (0, 0, 0)) -> int:
+    """
+    Imports a vanilla structure block file (.nbt) with its minimum corner at the world coordinates origin.
+    The block list is streamed rather than read as a whole. Locations the structure leaves out, such as structure voids, stay unknown.
+    Returns the number of voxels written.
+    """
+    size = None
+    palette = None
+    positions: List[np.ndarray] = []
+    states: List[int] = []
+    with open_nbt(path) as f:
+        reader = NBTReader(f)
+        _, tag_type = reader.read_root()
+        if tag_type != TAG_COMPOUND:
+            raise NBTError(f"{path} is not a structure file")
+        for name, tag_type in reader.iter_compound():
+            if name == "size":
+                size = reader.read_value(tag_type)
+            elif name == "palette":
+                palette = reader.read_value(tag_type)
+            elif name == "palettes":
+                palettes = reader.read_value(tag_type)
+                palette = palettes[0] if len(palettes) > 0 else []
+            elif name == "blocks":
+                for item_type in reader.iter_list():
+                    entry = {}
+                    for key, value_type in reader.iter_compound():
+                        if key in ("pos", "state"):
+                            entry[key] = reader.read_value(value_type)
+                        else:
+                            reader.skip_value(value_type)  # Block entity data can be large and we do not use it
+                    positions.append(entry["pos"])
+                    states.append(entry["state"])
+            else:
+                reader.skip_value(tag_type)
+    if size is None or palette is None:
+        raise NBTError(f"{path} is missing its size or palette")
+
+    lookup = _palette_ids(world, [(entry["Name"], entry.get("Properties")) for entry in palette])
+    block_ids = np.zeros(tuple(size), dtype=np.uint16)
+    if len(positions) > 0:
+        block_ids[tuple(np.array(positions, dtype=np.int64).T)] = lookup[np.array(states, dtype=np.int64)]
+    return _write_world_box(world, origin, block_ids)
+
+def _unpack_block_states(data: np.ndarray, palette_size: int, data_version: int) -> np.ndarray:
+    """
+    Unpacks the 4096 palette indices of a chunk section from its array of longs
+    """
+    bits = max(4, (palette_size - 1).bit_length())
+    # Work with the bits of every long from least to most significant
+    long_bits = np.unpackbits(data.astype("<i8").view(np.uint8), bitorder="little").reshape(-1, 64)
+    if data_version >= NON_SPANNING_DATA_VERSION:
+        per_long = 64 // bits
+        long_bits = long_bits[:, :per_long * bits]
+    values = long_bits.reshape(-1)[:CHUNK_SIZE ** 3 * bits].reshape(-1, bits)
+    return values.astype(np.int64) @ (1 << np.arange(bits, dtype=np.int64))
+
+def _import_region_chunk(world: SubWorld, chunk: Dict[str, Any], min_y: Optional[int], max_y: Optional[int]) -> int:
+    data_version = chunk.get("DataVersion", 0)
+    level = chunk.get("Level", chunk)  # Versions before 1.18 keep everything inside of a Level compound
+    chunk_x, chunk_z = level["xPos"], level["zPos"]
+    count = 0
+    for section in level.get("sections", level.get("Sections", [])):
+        if "block_states" in section:
+            palette, data = section["block_states"]["palette"], section["block_states"].get("data")
+        elif "Palette" in section:
+            palette, data = section["Palette"], section.get("BlockStates")
+        else:
+            continue  # Empty sections and pre 1.13 numeric ids
+        y = section["Y"] * CHUNK_SIZE
+        if (min_y is not None and y + CHUNK_SIZE - 1 < min_y) or (max_y is not None and y > max_y):
+            continue
+        lookup = _palette_ids(world, [(entry["Name"], entry.get("Properties")) for entry in palette])
+        if data is None:
+            block_ids = np.full((CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE), lookup[0], dtype=np.uint16)
+        else:
+            # Indices are ordered by y, then z, then x
+            indices = _unpack_block_states(data, len(palette), data_version).reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)
+            block_ids = lookup[indices].transpose(2, 0, 1)
+        count += _write_world_box(world, (chunk_x * CHUNK_SIZE, y, chunk_z * CHUNK_SIZE), block_ids)
+    return count
+
+def import_region(world: SubWorld, path: str, min_y: Optional[int] = None, max_y: Optional[int] = None) -> int:
+    """
+    Imports an anvil region file (.mca) from 1.13 or later. Region files already use world coordinates so there is no origin.
+    Chunks are decompressed and written one at a time. min_y and max_y limit which chunk sections are imported.
+    Returns the number of voxels written.
+    """
+    count = 0
+    with open(path, "rb") as f:
+        locations = np.frombuffer(f.read(REGION_SECTOR_SIZE), dtype=">u4")
+        for location in locations.tolist():
+            if location == 0:
+                continue  # The chunk has not been generated
+            f.seek((location >> 8) * REGION_SECTOR_SIZE)
+            length, compression = struct.unpack(">iB", f.read(5))
+            if compression & 0x80:
+                continue  # Stored in a separate .mcc file, which only happens for enormous chunks
+            chunk = read_nbt_bytes(f.read(length - 1), compression)
+            count += _import_region_chunk(world, chunk, min_y, max_y)
+    return count
+
+def import_map(world: SubWorld, path: str, origin: Tuple[int, int, int] = (0, 0, 0)) -> int:
+    """
+    Imports a schematic, structure or region file based on its extension
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".schem":
+        return import_schematic(world, path, origin)
+    if extension == ".nbt":
+        return import_structure(world, path, origin)
+    if extension == ".mca":
+        return import_region(world, path)
+    raise ValueError(f"Unknown map format {extension}. Expected one of .schem, .nbt or .mca")
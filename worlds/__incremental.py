@@ -0,0 +1,237 @@
+"""
+D* Lite over the packed state space, for tasks that scan and replan over and over as they learn more about the world.
+The search runs backward from the goals and is kept between calls, so after a scan only the states whose cost to the goal changed are searched again.
+"""
+
+import heapq
+import time
+import numpy as np
+from typing import Callable, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from models.__agent_models import AgentState
+from .__goals import Goal
+from .__palette import BlockPalette
+from .__search import (
+    FORWARD_STEPS, UP_STEP, BUDGET_CHECK_INTERVAL, IsFree, PlanResult, PlanStatus, SearchBudget,
+    free_space, pack_state, packed_filter, state_from_agent_state, state_heuristic, state_to_agent_state, unpack_state,
+)
+
+if TYPE_CHECKING:
+    from .__world import SubWorld
+
+INFINITY = float("inf")
+Key = Tuple[float, float]
+
+class IncrementalPlanner:
+    """
+    The IncrementalPlanner finds paths from a moving start to a fixed goal with D* Lite. The search starts from every goal state, so the goal must be able to list them.
+    It listens to the world's writes and remembers every voxel whose freedom changed. The next call to plan repairs the search around those voxels instead of starting over.
+    If may_reach is given, plan first asks it whether the goal can be reached from the start at all, so an unreachable goal fails at once instead of searching everything the agent could get to.
+    Call close once the planner is no longer needed so the world stops notifying it.
+    """
+    def __init__(self, world: 'SubWorld', goal: Goal, assume_occupied: bool = True, reject_neighbors: Optional[Callable[[AgentState], bool]] = None, may_reach: Optional[Callable[[AgentState], bool]] = None):
+        goal_states = goal.goal_states()
+        if goal_states is None:
+            raise ValueError(f"{goal} has too many states to plan to incrementally")
+        self.world = world
+        self.goal = goal
+        self.assume_occupied = assume_occupied
+        self._reject = packed_filter(reject_neighbors)
+        self._may_reach = may_reach
+        self._goals: Set[int] = set(goal_states)
+        self._g: Dict[int, float] = {}
+        self._rhs: Dict[int, float] = {}
+        self._heap: List[Tuple[Key, int]] = []
+        self._km = 0
+        self._last_start: Optional[int] = None
+        self._heuristic = None
+        self._is_free: IsFree = free_space(world.occupancy, assume_occupied)
+        self._free_locations: Dict[int, bool] = {}  # Whether the voxel of a packed location is free, since every location is asked about many times
+        self._changed: Set[Tuple[int, int, int]] = set()
+        self.expansions = 0  # Total over every call to plan
+        for goal in self._goals:
+            if self._reject is None or not self._reject(goal):
+                self._rhs[goal] = 0
+        world.add_mutation_listener(self._on_write)
+
+    def close(self):
+        self.world.remove_mutation_listener(self._on_write)
+
+    def _on_write(self, coords: np.ndarray, old_ids: np.ndarray, new_ids: np.ndarray):
+        palette = self.world.palette
+        unknown_free = not self.assume_occupied
+        was_free = np.where(old_ids == BlockPalette.UNKNOWN, unknown_free, ~palette.occupied(old_ids))
+        is_free = np.where(new_ids == BlockPalette.UNKNOWN, unknown_free, ~palette.occupied(new_ids))
+        self._changed.update(map(tuple, coords[was_free != is_free].tolist()))
+
+    def notify_changed(self, locations: List[Tuple[int, int, int]]):
+        """
+        Marks voxels whose freedom changed without going through the world's write path
+        """
+        self._changed.update(locations)
+
+    def _key(self, state: int) -> Key:
+        best = min(self._g.get(state, INFINITY), self._rhs.get(state, INFINITY))
+        return (best + self._heuristic(*unpack_state(state)) + self._km, best)
+
+    def _is_free_state(self, state: int) -> bool:
+        """
+        Whether the voxel a packed state is in is free
+        """
+        location = state >> 2
+        free = self._free_locations.get(location)
+        if free is None:
+            forward, side, up, _ = unpack_state(state)
+            free = self._free_locations[location] = self._is_free(forward, side, up)
+        return free
+
+    def _successors(self, state: int) -> List[int]:
+        """
+        States the agent can move to from state. Every edge into a state needs the state's voxel to be free.
+        """
+        orientation = state & 3
+        successors = [
+            neighbor for neighbor in (state + FORWARD_STEPS[orientation], state + UP_STEP, state - UP_STEP)
+            if self._is_free_state(neighbor)
+        ]
+        if self._is_free_state(state):
+            location = state & ~3
+            successors.append(location | ((orientation + 1) & 3))
+            successors.append(location | ((orientation - 1) & 3))
+        if self._reject is not None:
+            successors = [successor for successor in successors if not self._reject(successor)]
+        return successors
+
+    @staticmethod
+    def _predecessors(state: int) -> List[int]:
+        """
+        Every state that has an edge into state when state's voxel is free
+        """
+        orientation = state & 3
+        location = state & ~3
+        return [
+            state - FORWARD_STEPS[orientation], state - UP_STEP, state + UP_STEP,
+            location | ((orientation + 1) & 3), location | ((orientation - 1) & 3),
+        ]
+
+    def _update_state(self, state: int):
+        if state not in self._goals:
+            rhs = min((self._g.get(successor, INFINITY) for successor in self._successors(state)), default=INFINITY) + 1
+            if rhs == INFINITY:
+                self._rhs.pop(state, None)
+            else:
+                self._rhs[state] = rhs
+        if self._g.get(state, INFINITY) != self._rhs.get(state, INFINITY):
+            heapq.heappush(self._heap, (self._key(state), state))
+
+    def _apply_changes(self):
+        """
+        Updates the predecessors of every state in a voxel whose freedom changed, since their edges into it appeared or disappeared
+        """
+        if len(self._changed) == 0:
+            return
+        self._is_free = free_space(self.world.occupancy, self.assume_occupied)  # Forget the chunk bits copied before the change
+        changed, self._changed = self._changed, set()
+        touched = set()
+        for forward, side, up in changed:
+            self._free_locations.pop(pack_state(forward, side, up, 0) >> 2, None)
+        for forward, side, up in changed:
+            for orientation in range(4):
+                touched.update(self._predecessors(pack_state(forward, side, up, orientation)))
+        for state in touched:
+            self._update_state(state)
+
+    def _compute_shortest_path(self, start: int, budget: SearchBudget) -> Optional[PlanStatus]:
+        """
+        Expands inconsistent states until start is consistent and nothing in the queue can improve it. Returns a status if a budget ran out.
+        """
+        expansions = 0
+        started = time.monotonic()
+        heap = self._heap
+        while heap:
+            start_key = self._key(start)
+            if heap[0][0] >= start_key and self._rhs.get(start, INFINITY) == self._g.get(start, INFINITY):
+                break
+            if budget.max_expansions is not None and expansions >= budget.max_expansions:
+                return PlanStatus.EXPANSION_BUDGET_EXCEEDED
+            if budget.max_states is not None and len(self._g) + len(self._rhs) >= budget.max_states:
+                return PlanStatus.MEMORY_BUDGET_EXCEEDED
+            if budget.max_seconds is not None and expansions % BUDGET_CHECK_INTERVAL == 0 and time.monotonic() - started >= budget.max_seconds:
+                return PlanStatus.TIME_BUDGET_EXCEEDED
+
+            old_key, state = heapq.heappop(heap)
+            g, rhs = self._g.get(state, INFINITY), self._rhs.get(state, INFINITY)
+            if g == rhs:
+                continue  # A stale entry of a state that is already consistent
+            new_key = self._key(state)
+            if old_key < new_key:
+                heapq.heappush(heap, (new_key, state))
+                continue
+            expansions += 1
+            self.expansions += 1
+            # Edges into a state need its voxel to be free, so nothing else depends on the g of a state that is not
+            has_edges = self._is_free_state(state) and (self._reject is None or not self._reject(state))
+            if g > rhs:
+                self._g[state] = rhs
+                if has_edges:
+                    # g only went down so a predecessor can only get better by going through this state
+                    for predecessor in self._predecessors(state):
+                        if rhs + 1 < self._rhs.get(predecessor, INFINITY) and predecessor not in self._goals:
+                            self._rhs[predecessor] = rhs + 1
+                            heapq.heappush(heap, (self._key(predecessor), predecessor))
+            else:
+                del self._g[state]
+                self._update_state(state)
+                if has_edges:
+                    # Only predecessors whose best successor was this state have to look for a new one
+                    for predecessor in self._predecessors(state):
+                        if self._rhs.get(predecessor) == g + 1:
+                            self._update_state(predecessor)
+        return None
+
+    def _extract_path(self, start: int) -> Optional[List[int]]:
+        cost = self._g.get(start, INFINITY)
+        if cost == INFINITY:
+            return None
+        path = [start]
+        state = start
+        while state not in self._goals:
+            state = min(self._successors(state), key=lambda successor: self._g.get(successor, INFINITY))
+            path.append(state)
+            if len(path) > cost + 1:
+                return None  # Only happens if the search was cut short
+        return path
+
+    def plan(self, start_state: AgentState, budget: Optional[SearchBudget] = None) -> PlanResult:
+        """
+        Finds the shortest path from start_state to any of the goals, reusing everything from the previous call that the world's changes did not touch
+        """
+        started = time.perf_counter()
+        if self._may_reach is not None and not self._may_reach(start_state):
+            print(f"{self.goal} can not be reached from {start_state}")
+            return PlanResult(PlanStatus.NO_PATH, None, 0, time.perf_counter() - started)
+        expansions = self.expansions
+        start = state_from_agent_state(start_state)
+        forward, side, up, orientation = unpack_state(start)
+        if self._last_start is None:
+            self._heuristic = state_heuristic([(forward, side, up, orientation)])
+            for goal in self._rhs:
+                heapq.heappush(self._heap, (self._key(goal), goal))
+        elif start != self._last_start:
+            # Every key is off by the distance the start moved, which is cheaper to add to new keys than to fix in old ones
+            self._km += self._heuristic(forward, side, up, orientation)
+            self._heuristic = state_heuristic([(forward, side, up, orientation)])
+        self._last_start = start
+        self._apply_changes()
+
+        status = self._compute_shortest_path(start, budget if budget is not None else SearchBudget())
+        path = None
+        if status is None:
+            path = self._extract_path(start)
+            status = PlanStatus.FOUND if path is not None else PlanStatus.NO_PATH
+        return PlanResult(
+            status,
+            None if path is None else [state_to_agent_state(state) for state in path],
+            self.expansions - expansions,
+            time.perf_counter() - started
+        )
@@ -1 +1,18 @@
-from .__world import *
\ No newline at end of file
+from .__chunk_store import ChunkStore, CHUNK_SIZE, chunk_key
+from .__persistent_store import PersistentChunkStore
+from .__palette import BlockPalette
+from .__mutation_log import MutationLog, BatchRecord, PaletteRecord, read_log, follow_log
+from .__spatial_index import SpatialHash
+from .__occupancy import OccupancyGrid
+from .__reachability import ReachabilityIndex
+from .__search import PlanResult, PlanStatus, SearchBudget, SearchEngine
+from .__goals import Goal, StateGoal, LocationGoal, BoxGoal, AdjacentBlockGoal
+from .__hierarchy import ChunkGraph
+from .__path_cache import PathCache
+from .__incremental import IncrementalPlanner
+from .__resources import ChunkResourceIndex, column_key, column_center
+from .__world import SubWorld, PathPlanner, WorldInventory, FuelInventory, Inventory, Filter
+from .__export import export_npz, load_npz, export_layer_pngs, export_npz_async, export_layer_pngs_async, encode_tile, decode_tile
+from .__importers import import_schematic, import_structure, import_region, import_map
+from .__registry import AgentFrame, WorldRegistry, world_to_shared, shared_to_world
+from .__changes import WorldChange, WorldSubscription
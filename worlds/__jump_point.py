@@ -0,0 +1,223 @@
+"""
+Jump point search for the PathPlanner's action model.
+Many shortest paths in open caves are the same moves in a different order, for example climbing three blocks before, during or after walking five. Plain A* expands every one of these orderings.
+This search only follows moves that some canonical shortest path could make next given the move that led to a state, and skips along the states where that leaves a single move.
+
+The canonical path is the shortest path whose up and down moves come as late as possible, whose half turns are two positive turns and which never undoes a move:
+    Moving forward or turning after moving up or down is only allowed if it could not have been done one voxel earlier, because that voxel or state is not open. These are the forced neighbors of jump point search.
+    After a turn the agent keeps turning the same way at most once more.
+    After moving up the agent never moves down and the other way around.
+Each of these swaps only trades a move for one that is open and costs the same, so at least one shortest path survives and the search stays optimal.
+Without forced neighbors, moving up or down leaves only one move, so a whole climb is taken in one jump and a climb that ends in a ceiling is never added to the open set.
+Turns cost as much as moves, so unlike grid jump point search the place where the agent turns along a straight line matters and horizontal lines are still walked one state at a time.
+When unknown space is free a climb would never end, so climbs also stop at every unknown voxel and every voxel a climb passes counts as an expansion against the budget.
+"""
+
+import heapq
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .__search import (
+    BUDGET_CHECK_INTERVAL, FORWARD_STEPS, ORIENTATIONS, UP_STEP, Heuristic, IsFree, PlanStatus, SearchBudget, unpack_state,
+)
+
+MOVE_FORWARD = 1
+MOVE_UP = 2
+MOVE_DOWN = 4
+TURN_POSITIVE = 8
+TURN_NEGATIVE = 16
+TURNS = TURN_POSITIVE | TURN_NEGATIVE
+ALL_MOVES = MOVE_FORWARD | MOVE_UP | MOVE_DOWN | TURNS
+
+def _reconstruct_jumped_path(parents: Dict[int, Optional[int]], climbs: Dict[int, int], state: int) -> List[int]:
+    """
+    Follows parents back to the start, filling in the states a climb jumped over
+    """
+    path = [state]
+    parent = parents[state]
+    while parent is not None:
+        step = climbs.get(state)
+        if step is not None:
+            state -= step
+            while state != parent:
+                path.append(state)
+                state -= step
+        path.append(parent)
+        state = parent
+        parent = parents[state]
+    path.reverse()
+    return path
+
+def jump_point_search(
+    start: int,
+    is_goal: Callable[[int], bool],
+    heuristic: Heuristic,
+    is_free: IsFree,
+    reject: Optional[Callable[[int], bool]] = None,
+    budget: Optional[SearchBudget] = None,
+    is_known: Optional[IsFree] = None,
+) -> Tuple[PlanStatus, Optional[List[int]], int]:
+    """
+    Runs A* over packed states with the pruning described above. Takes and returns the same things as a_star.
+    is_known tells whether a voxel is known and is needed whenever unknown voxels count as free, since climbs stop at unknown voxels.
+    Every state holds the moves that are still allowed from it. A state reached again at the same cost along a different move gains that move's allowed moves and is expanded again for only those.
+    """
+    budget = budget if budget is not None else SearchBudget()
+    heap = [(heuristic(*unpack_state(start)), 0, 0, start)]
+    g_scores = {start: 0}
+    parents: Dict[int, Optional[int]] = {start: None}
+    climbs: Dict[int, int] = {}  # The step of the climb that reached a state, since the states in between are not stored
+    allowed = {start: ALL_MOVES}
+    expanded: Dict[int, int] = {}  # The moves each state was already expanded with
+    pushed = 1
+    expansions = 0
+    next_time_check = 0
+    out_of_budget: Optional[PlanStatus] = None  # Set when a climb runs out of budget partway
+    started = time.monotonic()
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    # Where a climb that moved into a state from a free voxel stops and what it allows there, by the state and the direction of the climb.
+    # Climbs along the same column share everything past their first step.
+    climb_stops: Dict[int, Optional[int]] = {}
+    climb_moves: Dict[int, int] = {}
+
+    def climb(state: int, g: int, step: int, move: int) -> Optional[Tuple[int, int, int]]:
+        """
+        Moves up or down from state until a forced neighbor, a goal or an unknown voxel. Returns the state it stopped at with its g and allowed moves, or None if the climb ran into something or out of budget first.
+        """
+        nonlocal expansions, next_time_check, out_of_budget
+        forward, side, up, orientation = unpack_state(state)
+        step_forward, step_side = ORIENTATIONS[orientation]
+        direction = 1 if step > 0 else -1
+        forward_step = FORWARD_STEPS[orientation]
+        positive = (orientation + 1) & 3
+        negative = (orientation - 1) & 3
+        # Whatever could have been done from the voxel the climb came from is not needed in the next one
+        previous_free = is_free(forward, side, up)
+        start_up = up
+        climbed = []
+        stop = None
+        while True:
+            if budget.max_expansions is not None and expansions >= budget.max_expansions:
+                out_of_budget = PlanStatus.EXPANSION_BUDGET_EXCEEDED
+                return None
+            if budget.max_seconds is not None and expansions >= next_time_check:
+                next_time_check = expansions + BUDGET_CHECK_INTERVAL
+                if time.monotonic() - started >= budget.max_seconds:
+                    out_of_budget = PlanStatus.TIME_BUDGET_EXCEEDED
+                    return None
+            expansions += 1
+            up += direction
+            state += step
+            if previous_free:
+                key = (state << 1) | (step > 0)
+                if key in climb_stops:
+                    stop = climb_stops[key]
+                    break
+                climbed.append(key)
+            if not is_free(forward, side, up) or (reject is not None and reject(state)):
+                break
+            previous = state - step
+            moves = move
+            # A forward move is forced if it opens up here but was not open from the voxel before
+            if is_free(forward + step_forward, side + step_side, up) and (reject is None or not reject(state + forward_step)):
+                if not is_free(forward + step_forward, side + step_side, up - direction) or (reject is not None and reject(previous + forward_step)):
+                    moves |= MOVE_FORWARD
+            if not previous_free:
+                moves |= TURNS
+            elif reject is not None:
+                location = previous & ~3
+                if reject(location | positive):
+                    moves |= TURN_POSITIVE
+                if reject(location | negative):
+                    moves |= TURN_NEGATIVE
+            if moves != move or is_goal(state) or (is_known is not None and not is_known(forward, side, up)):
+                stop = state
+                if previous_free:
+                    climb_moves[(state << 1) | (step > 0)] = moves
+                else:
+                    return state, g + 1, moves
+                break
+            previous_free = True
+        for key in climbed:
+            climb_stops[key] = stop
+        if stop is None:
+            return None
+        return stop, g + abs(unpack_state(stop)[2] - start_up), climb_moves[(stop << 1) | (step > 0)]
+
+    while heap:
+        _, _, _, state = heappop(heap)
+        moves = allowed[state] & ~expanded.get(state, 0)
+        if moves == 0:
+            continue
+        if is_goal(state):
+            return PlanStatus.FOUND, _reconstruct_jumped_path(parents, climbs, state), expansions
+        if budget.max_expansions is not None and expansions >= budget.max_expansions:
+            return PlanStatus.EXPANSION_BUDGET_EXCEEDED, None, expansions
+        if budget.max_states is not None and len(g_scores) >= budget.max_states:
+            return PlanStatus.MEMORY_BUDGET_EXCEEDED, None, expansions
+        if budget.max_seconds is not None and expansions >= next_time_check:
+            # Climbs add many expansions at once, so the next check is scheduled rather than found by a remainder
+            next_time_check = expansions + BUDGET_CHECK_INTERVAL
+            if time.monotonic() - started >= budget.max_seconds:
+                return PlanStatus.TIME_BUDGET_EXCEEDED, None, expansions
+        expansions += 1
+        expanded[state] = expanded.get(state, 0) | moves
+
+        forward, side, up, orientation = unpack_state(state)
+        g = g_scores[state]
+        successors = []  # (state, g, moves allowed from it, climb step)
+        if moves & MOVE_FORWARD:
+            step_forward, step_side = ORIENTATIONS[orientation]
+            neighbor = state + FORWARD_STEPS[orientation]
+            if is_free(forward + step_forward, side + step_side, up) and (reject is None or not reject(neighbor)):
+                successors.append((neighbor, g + 1, ALL_MOVES, None))
+        if moves & MOVE_UP:
+            jump = climb(state, g, UP_STEP, MOVE_UP)
+            if jump is not None:
+                successors.append((*jump, UP_STEP))
+        if moves & MOVE_DOWN:
+            jump = climb(state, g, -UP_STEP, MOVE_DOWN)
+            if jump is not None:
+                successors.append((*jump, -UP_STEP))
+        if out_of_budget is not None:
+            return out_of_budget, None, expansions
+        if moves & TURNS and is_free(forward, side, up):
+            location = state & ~3
+            # A state that allows both turns was not reached by turning, so its successors may turn once more
+            first_turn = allowed[state] & TURNS == TURNS
+            turn_moves = MOVE_FORWARD | MOVE_UP | MOVE_DOWN
+            if moves & TURN_POSITIVE:
+                neighbor = location | ((orientation + 1) & 3)
+                if reject is None or not reject(neighbor):
+                    successors.append((neighbor, g + 1, turn_moves | (TURN_POSITIVE if first_turn else 0), None))
+            if moves & TURN_NEGATIVE:
+                neighbor = location | ((orientation - 1) & 3)
+                # Half turns go through the positive turn unless that state is rejected
+                half_turn = first_turn and reject is not None and reject(location | ((orientation + 1) & 3))
+                if reject is None or not reject(neighbor):
+                    successors.append((neighbor, g + 1, turn_moves | (TURN_NEGATIVE if half_turn else 0), None))
+
+        for neighbor, neighbor_g, neighbor_moves, step in successors:
+            best_g = g_scores.get(neighbor, neighbor_g + 1)
+            if neighbor_g > best_g:
+                continue
+            if neighbor_g == best_g:
+                if neighbor_moves & ~allowed[neighbor] == 0:
+                    continue
+                allowed[neighbor] |= neighbor_moves
+                if neighbor not in expanded:
+                    continue  # Still waiting in the heap, where it will be expanded with the new moves too
+            else:
+                g_scores[neighbor] = neighbor_g
+                parents[neighbor] = state
+                allowed[neighbor] = neighbor_moves
+                expanded.pop(neighbor, None)
+                if step is None:
+                    climbs.pop(neighbor, None)
+                else:
+                    climbs[neighbor] = step
+            h = heuristic(*unpack_state(neighbor))
+            heappush(heap, (neighbor_g + h, h, pushed, neighbor))
+            pushed += 1
+    return PlanStatus.NO_PATH, None, expansions
@@ -0,0 +1,217 @@
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+from models.__world_models import BlockData
+from .__palette import BlockPalette
+
+@dataclass
+class BatchRecord:
+    """
+    A batch of voxels that were set to new palette ids. An id of 0 means the voxel was deleted.
+    """
+    sequence: int
+    coords: np.ndarray
+    block_ids: np.ndarray
+
+@dataclass
+class PaletteRecord:
+    """
+    A block that was added to the palette. Always comes before the first batch that uses it.
+    """
+    sequence: int
+    block_id: int
+    block: BlockData
+
+LogRecord = Union[BatchRecord, PaletteRecord]
+
+HEADER = struct.Struct("<IBQ")  # Payload length, record type, sequence number
+FOOTER = struct.Struct("<I")  # crc32 of the header and payload so that torn writes can be detected
+BATCH_RECORD = 1
+PALETTE_RECORD = 2
+SEGMENT_SUFFIX = ".log"
+
+def _segment_path(path: str, first_sequence: int) -> str:
+    return os.path.join(path, f"{first_sequence:020d}{SEGMENT_SUFFIX}")
+
+def _list_segments(path: str) -> List[int]:
+    """
+    Returns the first sequence number of every segment in the log directory, in order
+    """
+    if not os.path.isdir(path):
+        return []
+    return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+
+def _encode(record_type: int, sequence: int, payload: bytes) -> bytes:
+    header = HEADER.pack(len(payload), record_type, sequence)
+    return header + payload + FOOTER.pack(zlib.crc32(header + payload))
+
+def _read_record(f: BinaryIO) -> Optional[LogRecord]:
+    """
+    Reads the next record from f. Returns None and leaves f where it was if the next record is missing or incomplete.
+    """
+    start = f.tell()
+    header = f.read(HEADER.size)
+    if len(header) == HEADER.size:
+        length, record_type, sequence = HEADER.unpack(header)
+        payload = f.read(length)
+        footer = f.read(FOOTER.size)
+        if len(payload) == length and len(footer) == FOOTER.size and FOOTER.unpack(footer)[0] == zlib.crc32(header + payload):
+            if record_type == BATCH_RECORD:
+                count = len(payload) // 14
+                coords = np.frombuffer(payload, dtype="<i4", count=count * 3).reshape(count, 3).astype(np.int64)
+                block_ids = np.frombuffer(payload, dtype="<u2", offset=count * 12).astype(np.uint16)
+                return BatchRecord(sequence, coords, block_ids)
+            entry = json.loads(payload)
+            return PaletteRecord(sequence, entry["id"], BlockData.parse_obj(entry["block"]))
+    f.seek(start)
+    return None
+
+def read_log(path: str, from_sequence: int = 0) -> Iterator[LogRecord]:
+    """
+    Yields every complete record in the log directory with a sequence number of at least from_sequence
+    """
+    segments = _list_segments(path)
+    for i, first_sequence in enumerate(segments):
+        if i + 1 < len(segments) and segments[i + 1] <= from_sequence:
+            continue  # Everything in this segment is older than what we want
+        with open(_segment_path(path, first_sequence), "rb") as f:
+            while True:
+                record = _read_record(f)
+                if record is None:
+                    break
+                if record.sequence >= from_sequence:
+                    yield record
+
+def follow_log(path: str, from_sequence: int = 0, poll_interval: float = 0.1) -> Iterator[LogRecord]:
+    """
+    Tails the log directory forever, yielding records as they are written.
+    This only reads the files so it can be used as a change feed from another process.
+    """
+    sequence = from_sequence
+    current_segment = None
+    f = None
+    while True:
+        segments = _list_segments(path)
+        if f is None:
+            candidates = [first for first in segments if first <= sequence]
+            if len(candidates) == 0 and len(segments) > 0:
+                candidates = segments[:1]  # What we wanted was compacted away so we start from the oldest record we have
+            if len(candidates) > 0:
+                current_segment = candidates[-1]
+                f = open(_segment_path(path, current_segment), "rb")
+        record = _read_record(f) if f is not None else None
+        if record is not None:
+            if record.sequence >= sequence:
+                sequence = record.sequence + 1
+                yield record
+            continue
+        newer = [first for first in segments if current_segment is not None and first > current_segment]
+        if f is not None and (len(newer) > 0 or not os.path.exists(_segment_path(path, current_segment))):
+            # The writer has moved on to a new segment so there is nothing more to read from this one
+            f.close()
+            f = None
+            continue
+        time.sleep(poll_interval)
+
+class MutationLog:
+    """
+    A MutationLog records every change to a SubWorld in an append only binary log so that it can be replayed after a crash.
+    Every batch of writes becomes one record. Records are encoded on the caller's thread and written and fsynced by a background thread so that logging never blocks the event loop on disk.
+    The log is split into segments. Taking a snapshot of the world starts a new segment and deletes the ones the snapshot covers.
+    """
+    def __init__(self, path: str, palette: BlockPalette, next_sequence: int = 0):
+        self.path = path
+        self.palette = palette
+        os.makedirs(path, exist_ok=True)
+        self._sequence = next_sequence
+        self._logged_palette_size = len(palette)
+        self._file = open(_segment_path(path, next_sequence), "ab")
+        self._queue: "queue.Queue[Optional[Union[bytes, int]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def next_sequence(self) -> int:
+        return self._sequence
+
+    def _next(self) -> int:
+        sequence = self._sequence
+        self._sequence += 1
+        return sequence
+
+    def record(self, coords: np.ndarray, old_ids: np.ndarray, new_ids: np.ndarray):
+        """
+        Mutation listener that logs the voxels that actually changed
+        """
+        changed = old_ids != new_ids
+        if not changed.any():
+            return
+        records = []
+        while self._logged_palette_size < len(self.palette):
+            block_id = self._logged_palette_size
+            entry = {"id": block_id, "block": self.palette.get(block_id).dict(exclude={"occupied"})}
+            records.append(_encode(PALETTE_RECORD, self._next(), json.dumps(entry).encode()))
+            self._logged_palette_size += 1
+        payload = coords[changed].astype("<i4").tobytes() + new_ids[changed].astype("<u2").tobytes()
+        records.append(_encode(BATCH_RECORD, self._next(), payload))
+        self._queue.put(b"".join(records))
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            items = [item]
+            # Drain everything that is waiting so that a burst of writes only costs one fsync
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            for item in items:
+                if isinstance(item, bytes):
+                    self._file.write(item)
+                elif isinstance(item, int):
+                    self._start_segment(item)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            for _ in items:
+                self._queue.task_done()
+            if None in items:
+                self._file.close()
+                return
+
+    def _start_segment(self, first_sequence: int):
+        self._file.close()
+        self._file = open(_segment_path(self.path, first_sequence), "ab")
+
+    def sync(self):
+        """
+        Blocks until everything logged so far is on disk
+        """
+        self._queue.join()
+
+    def start_segment(self) -> int:
+        """
+        Called when a snapshot of every record logged so far is taken. Records from here on go into a new segment, so that compact can later delete whole segments.
+        Returns the sequence the snapshot covers everything before.
+        """
+        self._queue.put(self._sequence)
+        return self._sequence
+
+    def compact(self, snapshot_sequence: int):
+        """
+        Called once a snapshot covering every record before snapshot_sequence is safely on disk. Deletes the segments it covers.
+        Blocks until the log has caught up, so it can be called from a worker thread but should not be called on the event loop.
+        """
+        self.sync()
+        for segment in _list_segments(self.path):
+            if segment < snapshot_sequence:
+                os.remove(_segment_path(self.path, segment))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,144 @@
+"""
+A minimal streaming reader for Minecraft's NBT format.
+Tags can either be read into plain python values or walked one at a time so that huge lists, such as the blocks of a structure file, never have to be held in memory at once.
+Numeric arrays are returned as numpy arrays.
+"""
+
+import gzip
+import io
+import struct
+import zlib
+import numpy as np
+from typing import Any, BinaryIO, Dict, Iterator, Tuple
+
+TAG_END = 0
+TAG_BYTE = 1
+TAG_SHORT = 2
+TAG_INT = 3
+TAG_LONG = 4
+TAG_FLOAT = 5
+TAG_DOUBLE = 6
+TAG_BYTE_ARRAY = 7
+TAG_STRING = 8
+TAG_LIST = 9
+TAG_COMPOUND = 10
+TAG_INT_ARRAY = 11
+TAG_LONG_ARRAY = 12
+
+_SCALARS = {
+    TAG_BYTE: struct.Struct(">b"),
+    TAG_SHORT: struct.Struct(">h"),
+    TAG_INT: struct.Struct(">i"),
+    TAG_LONG: struct.Struct(">q"),
+    TAG_FLOAT: struct.Struct(">f"),
+    TAG_DOUBLE: struct.Struct(">d"),
+}
+_ARRAYS = {
+    TAG_BYTE_ARRAY: np.dtype(">i1"),
+    TAG_INT_ARRAY: np.dtype(">i4"),
+    TAG_LONG_ARRAY: np.dtype(">i8"),
+}
+
+class NBTError(ValueError):
+    pass
+
+def open_nbt(path: str) -> BinaryIO:
+    """
+    Opens an NBT file whether or not it is gzipped
+    """
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+class NBTReader:
+    """
+    Reads tags from a binary stream. The stream is only ever read forward so it can be a gzip or zlib stream.
+    """
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+
+    def _read(self, size: int) -> bytes:
+        data = self._stream.read(size)
+        if len(data) != size:
+            raise NBTError("Unexpected end of NBT data")
+        return data
+
+    def _read_string(self) -> str:
+        length, = struct.unpack(">H", self._read(2))
+        return self._read(length).decode("utf-8", errors="replace")
+
+    def read_root(self) -> Tuple[str, int]:
+        """
+        Reads the header of the root tag and returns its name and type. The value is read next.
+        """
+        tag_type = self._read(1)[0]
+        if tag_type == TAG_END:
+            raise NBTError("Empty NBT data")
+        return self._read_string(), tag_type
+
+    def read_value(self, tag_type: int) -> Any:
+        if tag_type in _SCALARS:
+            scalar = _SCALARS[tag_type]
+            return scalar.unpack(self._read(scalar.size))[0]
+        if tag_type in _ARRAYS:
+            dtype = _ARRAYS[tag_type]
+            length, = struct.unpack(">i", self._read(4))
+            return np.frombuffer(self._read(length * dtype.itemsize), dtype=dtype)
+        if tag_type == TAG_STRING:
+            return self._read_string()
+        if tag_type == TAG_LIST:
+            return [self.read_value(item_type) for item_type in self.iter_list()]
+        if tag_type == TAG_COMPOUND:
+            return {name: self.read_value(item_type) for name, item_type in self.iter_compound()}
+        raise NBTError(f"Unknown tag type {tag_type}")
+
+    def skip_value(self, tag_type: int):
+        if tag_type in (TAG_LIST, TAG_COMPOUND):
+            iterator = self.iter_list() if tag_type == TAG_LIST else (item_type for _, item_type in self.iter_compound())
+            for item_type in iterator:
+                self.skip_value(item_type)
+        else:
+            self.read_value(tag_type)
+
+    def iter_compound(self) -> Iterator[Tuple[str, int]]:
+        """
+        Walks the entries of a compound. Yields the name and type of each entry, and the caller must read or skip its value before asking for the next one.
+        """
+        while True:
+            tag_type = self._read(1)[0]
+            if tag_type == TAG_END:
+                return
+            yield self._read_string(), tag_type
+
+    def iter_list(self) -> Iterator[int]:
+        """
+        Walks the items of a list. Yields the type of each item, and the caller must read or skip it before asking for the next one.
+        """
+        item_type = self._read(1)[0]
+        length, = struct.unpack(">i", self._read(4))
+        for _ in range(length):
+            yield item_type
+
+def read_nbt(stream: BinaryIO) -> Dict[str, Any]:
+    """
+    Reads a whole NBT document and returns its root compound
+    """
+    reader = NBTReader(stream)
+    _, tag_type = reader.read_root()
+    if tag_type != TAG_COMPOUND:
+        raise NBTError("The root tag must be a compound")
+    return reader.read_value(tag_type)
+
+def read_nbt_bytes(data: bytes, compression: int = 0) -> Dict[str, Any]:
+    """
+    Reads an NBT document from memory. compression is the region file compression type: 1 for gzip, 2 for zlib and 3 for none.
+    """
+    if compression == 1:
+        data = gzip.decompress(data)
+    elif compression == 2:
+        data = zlib.decompress(data)
+    elif compression not in (0, 3):
+        raise NBTError(f"Unsupported compression type {compression}")
+    return read_nbt(io.BytesIO(data))
@@ -0,0 +1,134 @@
+import numpy as np
+from typing import Dict, Iterable, Optional, Tuple
+
+from .__chunk_store import ChunkStore, ChunkKey, CHUNK_SHIFT, CHUNK_MASK, as_coords, group_by_chunk
+from .__palette import BlockPalette
+
+ChunkBits = Tuple[bytearray, bytearray]  # Known bits and occupied bits of one chunk
+
+def _local_index(x: int, y: int, z: int) -> int:
+    return ((x & CHUNK_MASK) << (2 * CHUNK_SHIFT)) | ((y & CHUNK_MASK) << CHUNK_SHIFT) | (z & CHUNK_MASK)
+
+class OccupancyGrid:
+    """
+    The OccupancyGrid holds two bits per voxel, whether it is known and whether it is occupied, packed into one bytearray per chunk and bit.
+    This is all the planner needs, so it never has to touch block ids or the palette, and a chunk of bits is an eighth of the size of a chunk of ids.
+    Bits are built lazily from the ChunkStore the first time a chunk is queried and are kept in sync by the world's write path after that.
+    They are dropped when the store evicts their chunk and built again if it is queried later, so they never outgrow the store's memory budget.
+    """
+    def __init__(self, store: ChunkStore, palette: BlockPalette):
+        self._store = store
+        self.palette = palette
+        self._chunks: Dict[ChunkKey, ChunkBits] = {}
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(known) + len(occupied) for known, occupied in self._chunks.values())
+
+    def drop_chunks(self, keys: Iterable[ChunkKey]):
+        for key in keys:
+            self._chunks.pop(key, None)
+
+    def _build(self, chunk: np.ndarray) -> ChunkBits:
+        block_ids = chunk.reshape(-1)
+        known = np.packbits(block_ids != BlockPalette.UNKNOWN, bitorder="little")
+        occupied = np.packbits(self.palette.occupied(block_ids), bitorder="little")
+        return bytearray(known.tobytes()), bytearray(occupied.tobytes())
+
+    def _bits(self, key: ChunkKey) -> Optional[ChunkBits]:
+        bits = self._chunks.get(key)
+        if bits is None:
+            chunk = self._store.get_chunk(key)
+            if chunk is None:
+                return None
+            bits = self._build(chunk)
+            self._chunks[key] = bits
+        return bits
+
+    def chunk_bits(self, key: ChunkKey) -> Optional[Tuple[bytes, bytes]]:
+        """
+        Returns copies of the packed known and occupied bits of a chunk. Bit i of the chunk is bit i % 8 of byte i // 8, where i indexes the chunk in (forward, side, up) order.
+        """
+        bits = self._bits(key)
+        if bits is None:
+            return None
+        return bytes(bits[0]), bytes(bits[1])
+
+    def chunk_masks(self, key: ChunkKey) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns the known and occupied bits of a chunk unpacked into boolean arrays, or None if we know nothing about the chunk
+        """
+        bits = self._bits(key)
+        if bits is None:
+            return None
+        shape = (CHUNK_MASK + 1,) * 3
+        return tuple(np.unpackbits(np.frombuffer(packed, dtype=np.uint8), bitorder="little").view(bool).reshape(shape) for packed in bits)
+
+    def is_known(self, x: int, y: int, z: int) -> bool:
+        bits = self._bits((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT))
+        if bits is None:
+            return False
+        index = _local_index(x, y, z)
+        return bool(bits[0][index >> 3] & (1 << (index & 7)))
+
+    def is_occupied(self, x: int, y: int, z: int, assume_occupied: bool = True) -> bool:
+        """
+        Returns whether the voxel is occupied, or assume_occupied if we know nothing about it
+        """
+        bits = self._bits((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT))
+        if bits is None:
+            return assume_occupied
+        index = _local_index(x, y, z)
+        byte, mask = index >> 3, 1 << (index & 7)
+        if not bits[0][byte] & mask:
+            return assume_occupied
+        return bool(bits[1][byte] & mask)
+
+    def _lookup_batch(self, coords: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        coords = as_coords(coords)
+        known = np.zeros(len(coords), dtype=bool)
+        occupied = np.zeros(len(coords), dtype=bool)
+        for key, index, local in group_by_chunk(coords):
+            bits = self._bits(key)
+            if bits is None:
+                continue
+            flat = (local[:, 0] << (2 * CHUNK_SHIFT)) | (local[:, 1] << CHUNK_SHIFT) | local[:, 2]
+            byte, shift = flat >> 3, (flat & 7).astype(np.uint8)
+            known[index] = (np.frombuffer(bits[0], dtype=np.uint8)[byte] >> shift) & 1
+            occupied[index] = (np.frombuffer(bits[1], dtype=np.uint8)[byte] >> shift) & 1
+        return known, occupied
+
+    def known_batch(self, coords: np.ndarray) -> np.ndarray:
+        return self._lookup_batch(coords)[0]
+
+    def occupied_batch(self, coords: np.ndarray, assume_occupied: bool = True) -> np.ndarray:
+        known, occupied = self._lookup_batch(coords)
+        return np.where(known, occupied, assume_occupied)
+
+    def update_voxel(self, x: int, y: int, z: int, block_id: int):
+        bits = self._chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT))
+        if bits is None:
+            return  # Built from the store when it is first queried
+        index = _local_index(x, y, z)
+        byte, mask = index >> 3, 1 << (index & 7)
+        known, occupied = bits
+        known[byte] = known[byte] | mask if block_id != BlockPalette.UNKNOWN else known[byte] & ~mask
+        occupied[byte] = occupied[byte] | mask if self.palette.is_occupied(block_id) else occupied[byte] & ~mask
+
+    def update(self, coords: np.ndarray, block_ids: np.ndarray):
+        """
+        Called with every batch of writes to the world. Chunks that have not been built yet are skipped.
+        """
+        for key, index, local in group_by_chunk(coords):
+            bits = self._chunks.get(key)
+            if bits is None:
+                continue
+            flat = (local[:, 0] << (2 * CHUNK_SHIFT)) | (local[:, 1] << CHUNK_SHIFT) | local[:, 2]
+            for packed, values in zip(bits, (block_ids[index] != BlockPalette.UNKNOWN, self.palette.occupied(block_ids[index]))):
+                # Neighboring voxels share bytes so it is simplest to unpack the chunk, write and pack it again
+                unpacked = np.unpackbits(np.frombuffer(packed, dtype=np.uint8), bitorder="little")
+                unpacked[flat] = values
+                packed[:] = np.packbits(unpacked, bitorder="little").tobytes()
@@ -0,0 +1,152 @@
+import json
+import os
+import numpy as np
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+from models.__world_models import BlockData
+
+def _freeze(value: Any) -> Hashable:
+    """
+    Converts nested dicts and lists into tuples so that block tags and state can be used as a dictionary key
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+class BlockPalette:
+    """
+    A BlockPalette interns every distinct (name, tags, state) into a small integer id so that worlds only have to store the id of each voxel.
+    Id 0 is reserved for voxels we know nothing about and id 1 for voxels that are occupied by a block we do not know.
+    Every other id maps to a single shared BlockData instance which must not be mutated.
+    """
+    UNKNOWN = 0
+    UNKNOWN_OCCUPIED = 1
+
+    def __init__(self) -> None:
+        self._blocks: List[Optional[BlockData]] = [None, None]
+        self._ids: Dict[Hashable, int] = {}
+        self._occupied = np.array([False, True])
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    @staticmethod
+    def block_key(block: BlockData) -> Hashable:
+        return (block.name, _freeze(block.tags), _freeze(block.state))
+
+    def _add(self, key: Hashable, block: BlockData) -> int:
+        block_id = len(self._blocks)
+        if block_id > np.iinfo(np.uint16).max:
+            raise OverflowError("Block palette is full")
+        self._blocks.append(block)
+        self._ids[key] = block_id
+        self._occupied = np.append(self._occupied, block.occupied)
+        return block_id
+
+    def intern(self, block: Optional[BlockData]) -> int:
+        """
+        Returns the id of the block, adding it to the palette if it has not been seen before
+        """
+        if block is None:
+            return self.UNKNOWN_OCCUPIED
+        key = self.block_key(block)
+        block_id = self._ids.get(key)
+        if block_id is None:
+            block_id = self._add(key, block.copy(deep=True))
+        return block_id
+
+    def intern_name(self, name: str) -> int:
+        """
+        Fast path for blocks that are only known by name, as is the case for scan results
+        """
+        key = (name, None, None)
+        block_id = self._ids.get(key)
+        if block_id is None:
+            block_id = self._add(key, BlockData(name=name))
+        return block_id
+
+    def intern_names(self, names: Sequence[str]) -> np.ndarray:
+        """
+        Interns a batch of block names. Only the distinct names in the batch touch the palette.
+        """
+        if len(names) == 0:
+            return np.zeros(0, dtype=np.uint16)
+        unique_names, inverse = np.unique(np.asarray(names, dtype=object).astype(str), return_inverse=True)
+        unique_ids = np.array([self.intern_name(str(name)) for name in unique_names], dtype=np.uint16)
+        return unique_ids[inverse.reshape(-1)]
+
+    def restore(self, block_id: int, block: BlockData):
+        """
+        Re-adds a block under the id it was originally given, for example when replaying a log
+        """
+        if block_id < len(self._blocks):
+            if self.block_key(self._blocks[block_id]) != self.block_key(block):
+                raise ValueError(f"Palette id {block_id} is already used by {self._blocks[block_id].name}")
+            return
+        if block_id != len(self._blocks):
+            raise ValueError(f"Cannot restore palette id {block_id} into a palette of size {len(self._blocks)}")
+        self._add(self.block_key(block), block)
+
+    def get(self, block_id: int) -> Optional[BlockData]:
+        return self._blocks[block_id]
+
+    def is_occupied(self, block_id: int) -> bool:
+        return bool(self._occupied[block_id])
+
+    def occupied(self, block_ids: np.ndarray) -> np.ndarray:
+        """
+        Looks up whether each id in an array of ids is occupied
+        """
+        return self._occupied[block_ids]
+
+    def find_ids(self, name: Optional[str] = None, tag: Optional[str] = None) -> List[int]:
+        """
+        Returns the ids of every palette entry with the given name and tag. Leaving both as None matches every known block.
+        """
+        block_ids = []
+        for block_id, block in enumerate(self._blocks):
+            if block is None:
+                continue
+            if name is not None and block.name != name:
+                continue
+            if tag is not None and not (block.tags or {}).get(tag, False):
+                continue
+            block_ids.append(block_id)
+        return block_ids
+
+    def copy(self) -> 'BlockPalette':
+        palette = BlockPalette()
+        palette._blocks = list(self._blocks)
+        palette._ids = dict(self._ids)
+        palette._occupied = self._occupied.copy()
+        return palette
+
+    def save(self, path: str):
+        """
+        Saves the palette as json. Ids are positions in the saved list so they stay the same when the palette is loaded again.
+        """
+        self.write_dump(path, self.dump())
+
+    def dump(self) -> List[Dict[str, Any]]:
+        return [block.dict(exclude={"occupied"}) for block in self._blocks[2:]]
+
+    @staticmethod
+    def write_dump(path: str, dump: List[Dict[str, Any]]):
+        """
+        Writes what dump returned. Only touches the file, so it can run on a worker thread while the palette keeps growing.
+        """
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(dump, f)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'BlockPalette':
+        palette = cls()
+        with open(path) as f:
+            for block in json.load(f):
+                block = BlockData.parse_obj(block)
+                palette._add(cls.block_key(block), block)
+        return palette
@@ -0,0 +1,129 @@
+"""
+A cache of planned paths for the PathPlanner.
+Tasks that shuttle between the same places, such as a dig site and a deposit chest, ask for the same routes over and over, and most world changes in between are nowhere near them.
+"""
+
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from models.__agent_models import AgentState
+from .__chunk_store import ChunkKey, CHUNK_SHIFT
+from .__search import state_from_agent_state, state_to_agent_state
+
+if TYPE_CHECKING:
+    from .__world import SubWorld
+
+DEFAULT_MAX_PATHS = 128
+# A path and the six neighbors of each of its voxels
+WATCHED_OFFSETS = np.array([(0, 0, 0), (1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)], dtype=np.int64)
+
+PathOptions = Tuple[Hashable, bool, Any]  # (goal key, assume_occupied, reject_neighbors)
+PathKey = Tuple[int, Hashable, bool, Any]  # The packed start state followed by the options
+
+@dataclass
+class CachedPath:
+    states: List[int]  # Packed, so that callers can not change a cached path through the AgentStates they are given
+    index: Dict[int, int]  # Where each packed state lies on the path
+    options: PathOptions
+    version: int  # The world version the path was last known to be valid at
+    coords: np.ndarray  # Every voxel on or next to the path
+    free: np.ndarray  # Which of those were free when the path was planned
+    chunks: Set[ChunkKey]
+
+class PathCache:
+    """
+    Keeps the latest max_paths paths that were found, keyed by start state, goal, planner options and the world version they were checked at.
+    A path stays valid after the world changes as long as no voxel on or next to it changed between free and occupied, so only changes that could block it or open a shortcut past it throw it away.
+    Any state along a cached path is served too, since the rest of a shortest path is the shortest path from there to the same goal.
+    """
+    def __init__(self, world: 'SubWorld', max_paths: int = DEFAULT_MAX_PATHS):
+        self.world = world
+        self.max_paths = max_paths
+        self._paths: 'OrderedDict[PathKey, CachedPath]' = OrderedDict()
+        self._on_path: Dict[PathOptions, Dict[int, PathKey]] = {}  # The path each state lies on, by options
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations, "evictions": self.evictions, "cached": len(self._paths)}
+
+    def clear(self):
+        self._paths.clear()
+        self._on_path.clear()
+
+    def get(self, start_state: AgentState, goal_key: Hashable, assume_occupied: bool, reject_neighbors: Any) -> Optional[List[AgentState]]:
+        """
+        Returns the cached path from start_state to the goal, or None if there is no valid one
+        """
+        options = (goal_key, assume_occupied, reject_neighbors)
+        start = state_from_agent_state(start_state)
+        key = self._on_path.get(options, {}).get(start)
+        if key is None:
+            self.misses += 1
+            return None
+        entry = self._paths[key]
+        if not self._still_valid(entry):
+            self._remove(key)
+            self.invalidations += 1
+            self.misses += 1
+            return None
+        self._paths.move_to_end(key)
+        self.hits += 1
+        return [state_to_agent_state(state) for state in entry.states[entry.index[start]:]]
+
+    def put(self, start_state: AgentState, goal_key: Hashable, assume_occupied: bool, reject_neighbors: Any, path: List[AgentState]):
+        options = (goal_key, assume_occupied, reject_neighbors)
+        key = (state_from_agent_state(start_state), *options)
+        if key in self._paths:
+            self._remove(key)
+        locations = np.array([(state.location.forward, state.location.side, state.location.up) for state in path], dtype=np.int64).reshape(-1, 3)
+        coords = np.unique((locations[:, None, :] + WATCHED_OFFSETS[None, :, :]).reshape(-1, 3), axis=0)
+        states = [state_from_agent_state(state) for state in path]
+        index: Dict[int, int] = {}
+        for i, state in enumerate(states):
+            index.setdefault(state, i)
+        self._paths[key] = CachedPath(
+            states=states,
+            index=index,
+            options=options,
+            version=self.world.version,
+            coords=coords,
+            free=~self.world.is_occupied_batch(coords, assume_occupied),
+            chunks=set(map(tuple, np.unique(coords >> CHUNK_SHIFT, axis=0).tolist())),
+        )
+        on_path = self._on_path.setdefault(options, {})
+        for state in index:
+            on_path[state] = key
+        while len(self._paths) > self.max_paths:
+            self._remove(next(iter(self._paths)))
+            self.evictions += 1
+
+    def _still_valid(self, entry: CachedPath) -> bool:
+        version = self.world.version
+        if entry.version == version:
+            return True
+        # The chunk versions rule out most changes cheaply, only a path through a changed chunk has its voxels compared
+        if not entry.chunks.isdisjoint(self.world.changes_since(entry.version)):
+            if not np.array_equal(~self.world.is_occupied_batch(entry.coords, entry.options[1]), entry.free):
+                return False
+        entry.version = version
+        return True
+
+    def _remove(self, key: PathKey):
+        entry = self._paths.pop(key)
+        on_path = self._on_path.get(entry.options)
+        if on_path is None:
+            return
+        for state in entry.index:
+            if on_path.get(state) == key:
+                del on_path[state]
+        if not on_path:
+            del self._on_path[entry.options]
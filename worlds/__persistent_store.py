@@ -0,0 +1,130 @@
+import os
+import weakref
+import numpy as np
+from typing import Dict, Optional, Set, Tuple
+
+from .__chunk_store import ChunkStore, ChunkKey
+
+class PersistentChunkStore(ChunkStore):
+    """
+    A PersistentChunkStore keeps every chunk in its own .npy file inside of a directory.
+    Opening a store only lists the directory. Chunks are memory mapped the first time they are read and copied into memory the first time they are written.
+    Changed chunks are written back to disk by flush.
+    With a memory budget, chunks that have not changed since the last flush are evicted by simply dropping them since they can be mapped from their file again.
+    """
+    CHUNK_DIR = "chunks"
+
+    def __init__(self, path: str, dtype=np.uint16):
+        super().__init__(dtype)
+        self.path = path
+        self._chunk_dir = os.path.join(path, self.CHUNK_DIR)
+        os.makedirs(self._chunk_dir, exist_ok=True)
+        self._on_disk: Set[ChunkKey] = set()
+        self._dirty: Set[ChunkKey] = set()
+        self._write_counts: Dict[ChunkKey, int] = {}  # Writes to each dirty chunk, so that a flush can tell if a chunk changed while it was being written
+        self._snapshots: "weakref.WeakSet[ChunkStore]" = weakref.WeakSet()
+        for file_name in os.listdir(self._chunk_dir):
+            key = self._parse_chunk_file_name(file_name)
+            if key is not None:
+                self._on_disk.add(key)
+
+    @staticmethod
+    def _parse_chunk_file_name(file_name: str) -> Optional[ChunkKey]:
+        if not file_name.endswith(".npy"):
+            return None
+        try:
+            x, y, z = (int(part) for part in file_name[:-len(".npy")].split("_"))
+        except ValueError:
+            return None
+        return (x, y, z)
+
+    def _chunk_path(self, key: ChunkKey) -> str:
+        return os.path.join(self._chunk_dir, f"{key[0]}_{key[1]}_{key[2]}.npy")
+
+    def __contains__(self, key: ChunkKey) -> bool:
+        return super().__contains__(key) or key in self._on_disk
+
+    def keys(self) -> Set[ChunkKey]:
+        return super().keys() | self._on_disk
+
+    @property
+    def num_loaded(self) -> int:
+        return len(self._chunks)
+
+    @property
+    def num_dirty(self) -> int:
+        return len(self._dirty)
+
+    def _read_chunk_file(self, key: ChunkKey) -> np.ndarray:
+        return np.load(self._chunk_path(key), mmap_mode="r")
+
+    def _load_chunk(self, key: ChunkKey) -> Optional[np.ndarray]:
+        chunk = super()._load_chunk(key)
+        if chunk is None and key in self._on_disk:
+            chunk = self._read_chunk_file(key)
+        return chunk
+
+    def _evict_chunk(self, key: ChunkKey, chunk: np.ndarray):
+        if key in self._dirty:
+            super()._evict_chunk(key, chunk)
+
+    def _writable_chunk(self, key: ChunkKey) -> np.ndarray:
+        # Memory mapped chunks are read only so the base class pages them into memory, which means writes do not touch the file until we flush
+        if key not in self._dirty and len(self._snapshots) > 0:
+            # The file is about to go stale, so snapshots that have not read this chunk yet get the version they were taken with
+            for snapshot in self._snapshots:
+                if key in snapshot._fallback_keys:
+                    snapshot._chunks[key] = self.get_chunk(key)
+                    snapshot._fallback_keys.discard(key)
+        self._dirty.add(key)
+        self._write_counts[key] = self._write_counts.get(key, 0) + 1
+        return super()._writable_chunk(key)
+
+    def snapshot(self) -> ChunkStore:
+        """
+        Snapshots share the chunks we have loaded and read the rest from our files when they need them
+        """
+        snapshot = super().snapshot()
+        snapshot._fallback_store = self
+        snapshot._fallback_keys = self._on_disk - self._chunks.keys() - self._spilled.keys()
+        self._register_snapshot(snapshot)
+        return snapshot
+
+    def _register_snapshot(self, snapshot: ChunkStore):
+        self._snapshots.add(snapshot)
+
+    def flush(self):
+        """
+        Writes every dirty chunk back to its file. Files are replaced atomically so a crash mid flush never leaves a partial chunk.
+        """
+        chunks = self.begin_flush()
+        self.write_chunk_files(chunks)
+        self.end_flush(chunks)
+
+    def begin_flush(self) -> Dict[ChunkKey, Tuple[np.ndarray, int]]:
+        """
+        Copies every dirty chunk so that write_chunk_files can write them from a worker thread while the store keeps changing.
+        The chunks stay dirty until end_flush, so they are never dropped in favor of their stale files in between.
+        """
+        return {key: (np.array(self.get_chunk(key)), self._write_counts.get(key, 0)) for key in self._dirty}
+
+    def write_chunk_files(self, chunks: Dict[ChunkKey, Tuple[np.ndarray, int]]):
+        """
+        Writes the chunks taken by begin_flush. Only touches files, so it can run on any thread.
+        """
+        for key, (chunk, _) in chunks.items():
+            path = self._chunk_path(key)
+            temp_path = path + ".tmp"
+            with open(temp_path, "wb") as f:
+                np.save(f, chunk)
+            os.replace(temp_path, path)
+
+    def end_flush(self, chunks: Dict[ChunkKey, Tuple[np.ndarray, int]]):
+        """
+        Marks the written chunks as clean unless they were written to again after begin_flush
+        """
+        for key, (_, write_count) in chunks.items():
+            self._on_disk.add(key)
+            if self._write_counts.get(key) == write_count:
+                self._dirty.discard(key)
+                del self._write_counts[key]
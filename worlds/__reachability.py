@@ -0,0 +1,285 @@
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from .__chunk_store import ChunkStore, ChunkKey, CHUNK_SHIFT, CHUNK_SIZE, CHUNK_MASK
+from .__occupancy import OccupancyGrid
+
+ChunkLabels = Union[np.ndarray, int]  # Label of every voxel in a chunk, or 1 when every free voxel is in the single component 1 and 0 when nothing is free
+Node = Tuple[ChunkKey, int]  # A component within a single chunk
+
+AXES = [(1, 0, 0), (0, 1, 0), (0, 0, 1)]
+MAX_LABELED_CHUNKS = 4096  # Label arrays kept in memory at once, on top of dropping them when the store evicts their chunk. Chunks whose arrays were dropped are labeled again when needed
+
+def label_free_space(free: np.ndarray) -> Tuple[np.ndarray, int]:
+    """
+    Labels the 6-connected components of a boolean array. Returns labels starting at 1, with 0 for voxels that are not free, and the number of components.
+    Labels spread as minimums between neighbors and then jump to the label of the voxel they point at, which converges in a handful of passes for most shapes.
+    """
+    size = free.size
+    labels = np.where(free, np.arange(size).reshape(free.shape), size)
+    while True:
+        spread = labels.copy()
+        for axis in range(3):
+            lower = [slice(None)] * 3
+            upper = [slice(None)] * 3
+            lower[axis], upper[axis] = slice(None, -1), slice(1, None)
+            lower, upper = tuple(lower), tuple(upper)
+            np.minimum(spread[lower], labels[upper], out=spread[lower])
+            np.minimum(spread[upper], labels[lower], out=spread[upper])
+        spread[~free] = size
+        flat = spread.reshape(-1)
+        # Every label is the index of a voxel in the same component, so following it is always safe
+        jumped = np.where(flat < size, np.append(flat, size)[np.minimum(flat, size)], size).reshape(free.shape)
+        if (jumped == labels).all():
+            break
+        labels = jumped
+    roots, compact = np.unique(labels, return_inverse=True)
+    compact = compact.reshape(free.shape) + 1
+    compact[~free] = 0
+    return compact.astype(np.uint16), len(roots) - (1 if (~free).any() else 0)
+
+class ReachabilityIndex:
+    """
+    The ReachabilityIndex knows which connected component of free, known space every free voxel belongs to.
+    Each chunk is labeled on its own and chunk components are joined across chunk faces. Nothing is labeled up front: a query floods outward over chunk components from the voxel it asks about, so only the chunks its component reaches and their neighbors are ever loaded and labeled.
+    Components found this way are remembered until a change touches one of their chunks or a chunk next to them. After an edit only those chunks are labeled again and only those components are flooded again.
+    A component is open if it touches unknown space. An agent that is allowed into unknown space can leave an open component, but never a closed one.
+    Work is deferred until the next query so a burst of scans only costs one update.
+    """
+    def __init__(self, store: ChunkStore, occupancy: OccupancyGrid):
+        self._store = store
+        self._occupancy = occupancy
+        self._labels: 'OrderedDict[ChunkKey, ChunkLabels]' = OrderedDict()  # The most recently used label arrays
+        self._num_labels: Dict[ChunkKey, int] = {}  # Every chunk labeled since it last changed, 0 if nothing in it is free
+        self._open_labels: Dict[ChunkKey, Set[int]] = {}
+        # Which labels touch which across the face between a chunk and its neighbor in the positive direction of an axis, looked up from either side
+        self._face_links: Dict[Tuple[ChunkKey, int], Tuple[Dict[int, List[int]], Dict[int, List[int]]]] = {}
+        self._dirty: Set[ChunkKey] = set()
+        self._components: Dict[Node, int] = {}
+        self._members: Dict[int, List[Node]] = {}
+        self._chunk_components: Dict[ChunkKey, Set[int]] = {}
+        self._open_components: Set[int] = set()
+        self._next_component = 0
+
+    def mark_dirty(self, keys: Iterable[ChunkKey]):
+        self._dirty.update(keys)
+
+    def _free_mask(self, key: ChunkKey) -> Optional[np.ndarray]:
+        masks = self._occupancy.chunk_masks(key)
+        if masks is None:
+            return None
+        known, occupied = masks
+        return known & ~occupied
+
+    def _label_chunk(self, key: ChunkKey):
+        free = self._free_mask(key)
+        if free is None or not free.any():
+            self._labels.pop(key, None)
+            self._num_labels[key] = 0
+            return
+        if free.all():
+            labels, num_labels = 1, 1
+        else:
+            labels, num_labels = label_free_space(free)
+            if num_labels == 1:
+                labels = 1  # Labels are just the free mask, which the occupancy grid already has
+        self._labels[key] = labels
+        self._labels.move_to_end(key)
+        self._num_labels[key] = num_labels
+        # Labeling is deterministic, so an evicted chunk gets the same labels back when it is next labeled
+        while len(self._labels) > MAX_LABELED_CHUNKS:
+            self._labels.popitem(last=False)
+
+    def drop_chunks(self, keys: Iterable[ChunkKey]):
+        for key in keys:
+            self._labels.pop(key, None)
+
+    def _chunk_labels(self, key: ChunkKey) -> Optional[ChunkLabels]:
+        """
+        Returns the labels of a chunk, labeling it if needed, or None if nothing in it is free
+        """
+        if self._num_labels.get(key) == 0:
+            return None
+        labels = self._labels.get(key)
+        if labels is None:
+            self._label_chunk(key)
+            labels = self._labels.get(key)
+        else:
+            self._labels.move_to_end(key)
+        return labels
+
+    def _label_array(self, key: ChunkKey) -> Optional[np.ndarray]:
+        labels = self._chunk_labels(key)
+        if labels is None:
+            return None
+        if isinstance(labels, np.ndarray):
+            return labels
+        return self._free_mask(key).astype(np.uint16)
+
+    def _links(self, key: ChunkKey, axis: int) -> Tuple[Dict[int, List[int]], Dict[int, List[int]]]:
+        """
+        Finds which labels of key touch which labels of its positive neighbor along axis
+        """
+        links = self._face_links.get((key, axis))
+        if links is not None:
+            return links
+        offset = AXES[axis]
+        neighbor = (key[0] + offset[0], key[1] + offset[1], key[2] + offset[2])
+        forward: Dict[int, List[int]] = {}
+        backward: Dict[int, List[int]] = {}
+        labels = self._label_array(key)
+        neighbor_labels = self._label_array(neighbor) if labels is not None else None
+        if labels is not None and neighbor_labels is not None:
+            face = np.take(labels, CHUNK_MASK, axis=axis).reshape(-1)
+            neighbor_face = np.take(neighbor_labels, 0, axis=axis).reshape(-1)
+            touching = (face > 0) & (neighbor_face > 0)
+            for label, neighbor_label in np.unique(np.column_stack((face[touching], neighbor_face[touching])), axis=0).tolist():
+                forward.setdefault(label, []).append(neighbor_label)
+                backward.setdefault(neighbor_label, []).append(label)
+        links = self._face_links[(key, axis)] = (forward, backward)
+        return links
+
+    def _open(self, key: ChunkKey) -> Set[int]:
+        """
+        Finds the labels of key that have a free voxel next to an unknown voxel, including unknown voxels in neighboring chunks
+        """
+        open_labels = self._open_labels.get(key)
+        if open_labels is not None:
+            return open_labels
+        labels = self._label_array(key)
+        if labels is None:
+            open_labels = self._open_labels[key] = set()
+            return open_labels
+        known = self._occupancy.chunk_masks(key)[0]
+        # Pad the known mask with the faces of the neighboring chunks so that every voxel has all six neighbors
+        padded = np.zeros((CHUNK_SIZE + 2,) * 3, dtype=bool)
+        padded[1:-1, 1:-1, 1:-1] = known
+        for axis, offset in enumerate(AXES):
+            for direction, (face_index, pad_index) in ((1, (0, -1)), (-1, (CHUNK_MASK, 0))):
+                neighbor = (key[0] + direction * offset[0], key[1] + direction * offset[1], key[2] + direction * offset[2])
+                neighbor_masks = self._occupancy.chunk_masks(neighbor)
+                if neighbor_masks is None:
+                    continue
+                target = [slice(1, -1)] * 3
+                target[axis] = pad_index
+                padded[tuple(target)] = np.take(neighbor_masks[0], face_index, axis=axis)
+        touches_unknown = np.zeros(known.shape, dtype=bool)
+        for axis in range(3):
+            for start in (0, 2):
+                window = [slice(1, -1)] * 3
+                window[axis] = slice(start, start + CHUNK_SIZE)
+                touches_unknown |= ~padded[tuple(window)]
+        open_labels = self._open_labels[key] = set(np.unique(labels[touches_unknown & (labels > 0)]).tolist())
+        return open_labels
+
+    def _flood(self, start: Node) -> int:
+        """
+        Finds every chunk component connected to start and remembers them as one component
+        """
+        component = self._next_component
+        self._next_component += 1
+        self._components[start] = component
+        members = [start]
+        is_open = False
+        for key, label in members:  # Grows while it is walked
+            if not is_open and label in self._open(key):
+                is_open = True
+            for axis, offset in enumerate(AXES):
+                above = (key[0] + offset[0], key[1] + offset[1], key[2] + offset[2])
+                below = (key[0] - offset[0], key[1] - offset[1], key[2] - offset[2])
+                for neighbor in [(above, neighbor_label) for neighbor_label in self._links(key, axis)[0].get(label, ())] + \
+                        [(below, neighbor_label) for neighbor_label in self._links(below, axis)[1].get(label, ())]:
+                    if neighbor not in self._components:
+                        self._components[neighbor] = component
+                        members.append(neighbor)
+        self._members[component] = members
+        for key, _ in members:
+            self._chunk_components.setdefault(key, set()).add(component)
+        if is_open:
+            self._open_components.add(component)
+        return component
+
+    def _forget(self, component: int):
+        for node in self._members.pop(component):
+            del self._components[node]
+            components = self._chunk_components.get(node[0])
+            if components is not None:
+                components.discard(component)
+                if not components:
+                    del self._chunk_components[node[0]]
+        self._open_components.discard(component)
+
+    def _refresh(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        stale: Set[int] = set()
+        for key in dirty:
+            self._labels.pop(key, None)
+            self._num_labels.pop(key, None)
+            stale.update(self._chunk_components.get(key, ()))
+            self._open_labels.pop(key, None)
+            # A changed chunk changes its own faces and which of its neighbors' labels can see unknown space.
+            # Components of its neighbors may join through it or split around it, so they are flooded again too
+            for axis, offset in enumerate(AXES):
+                below = (key[0] - offset[0], key[1] - offset[1], key[2] - offset[2])
+                above = (key[0] + offset[0], key[1] + offset[1], key[2] + offset[2])
+                self._face_links.pop((key, axis), None)
+                self._face_links.pop((below, axis), None)
+                for neighbor in (below, above):
+                    self._open_labels.pop(neighbor, None)
+                    stale.update(self._chunk_components.get(neighbor, ()))
+        for component in stale:
+            self._forget(component)
+
+    def _node(self, x: int, y: int, z: int) -> Optional[Node]:
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+        labels = self._chunk_labels(key)
+        if labels is None:
+            return None
+        if isinstance(labels, np.ndarray):
+            label = int(labels[x & CHUNK_MASK, y & CHUNK_MASK, z & CHUNK_MASK])
+        else:
+            label = 0 if self._occupancy.is_occupied(x, y, z) else 1
+        if label == 0:
+            return None
+        return key, label
+
+    def component(self, x: int, y: int, z: int) -> Optional[int]:
+        """
+        Returns an identifier of the component the voxel is in, or None if the voxel is not free and known.
+        Identifiers are only comparable until the world next changes.
+        """
+        self._refresh()
+        node = self._node(x, y, z)
+        if node is None:
+            return None
+        component = self._components.get(node)
+        return component if component is not None else self._flood(node)
+
+    def is_open(self, component: int) -> bool:
+        """
+        Returns whether the component touches unknown space
+        """
+        self._refresh()
+        return component in self._open_components
+
+    def same_component(self, a: Tuple[int, int, int], b: Tuple[int, int, int]) -> bool:
+        component = self.component(*a)
+        return component is not None and component == self.component(*b)
+
+    @property
+    def num_components(self) -> int:
+        """
+        Counts the components of the whole world, which labels every chunk in the store
+        """
+        self._refresh()
+        for key in self._store.keys():
+            labels = self._chunk_labels(key)
+            if labels is None:
+                continue
+            for label in range(1, self._num_labels[key] + 1):
+                if (key, label) not in self._components:
+                    self._flood((key, label))
+        return len(self._members)
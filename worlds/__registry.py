@@ -0,0 +1,163 @@
+import os
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from models.__agent_models import AgentState, StateLocation, StateOrientation
+from .__chunk_store import as_coords
+from .__world import SubWorld
+
+if TYPE_CHECKING:
+    from models.commands import ScanResData, AnalyzeChunkResData
+
+# Minecraft directions as (forward, side) orientations in the shared frame
+WORLD_FACINGS = {
+    "east": (1, 0),   # +x
+    "west": (-1, 0),  # -x
+    "north": (0, 1),  # -z
+    "south": (0, -1), # +z
+}
+
+def world_to_shared(x: int, y: int, z: int) -> Tuple[int, int, int]:
+    """
+    Converts minecraft world coordinates into the (forward, side, up) of the shared frame
+    """
+    return (x, -z, y)
+
+def shared_to_world(forward: int, side: int, up: int) -> Tuple[int, int, int]:
+    return (forward, up, -side)
+
+class AgentFrame:
+    """
+    An AgentFrame is the turtle relative (forward, side, up) frame an agent maps in, defined by where it started and which way it was facing.
+    The shared frame is the frame of an agent that started at the world origin facing east, so forward is +x, side is -z and up is +y.
+    Every frame is a rotation about the up axis plus a translation away from the shared frame, so whole batches of coordinates are converted with a single matrix multiply.
+    """
+    def __init__(self, origin: Tuple[int, int, int] = (0, 0, 0), facing: Tuple[int, int] = (1, 0)):
+        """
+        origin is the agent's starting location and facing is the (forward, side) direction it started in, both in the shared frame
+        """
+        forward, side = facing
+        if abs(forward) + abs(side) != 1:
+            raise ValueError(f"Facing must be a unit direction, got {facing}")
+        self.origin = np.array(origin, dtype=np.int64)
+        self.facing = (forward, side)
+        # Columns are the agent's forward, side and up axes written in the shared frame
+        self.rotation = np.array([
+            [forward, -side, 0],
+            [side, forward, 0],
+            [0, 0, 1],
+        ], dtype=np.int64)
+
+    @classmethod
+    def from_world(cls, x: int, y: int, z: int, facing: str = "east") -> 'AgentFrame':
+        """
+        Creates the frame of an agent that started at minecraft world coordinates (x, y, z) facing the given cardinal direction
+        """
+        if facing not in WORLD_FACINGS:
+            raise ValueError(f"Unknown facing {facing}. Expected one of {list(WORLD_FACINGS.keys())}")
+        return cls(world_to_shared(x, y, z), WORLD_FACINGS[facing])
+
+    def to_shared_coords(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Converts an (N, 3) array of agent frame coordinates into the shared frame
+        """
+        return as_coords(coords) @ self.rotation.T + self.origin
+
+    def from_shared_coords(self, coords: np.ndarray) -> np.ndarray:
+        return (as_coords(coords) - self.origin) @ self.rotation
+
+    def _rotate_orientation(self, orientation: Optional[StateOrientation], rotation: np.ndarray) -> Optional[StateOrientation]:
+        if orientation is None:
+            return None
+        forward, side, up = rotation @ np.array([orientation.forward, orientation.side, orientation.up])
+        return StateOrientation(forward=int(forward), side=int(side), up=int(up))
+
+    def to_shared_state(self, state: AgentState) -> AgentState:
+        forward, side, up = self.to_shared_coords([state.location.forward, state.location.side, state.location.up])[0]
+        return AgentState(
+            location=StateLocation(forward=int(forward), side=int(side), up=int(up)),
+            orientation=self._rotate_orientation(state.orientation, self.rotation)
+        )
+
+    def from_shared_state(self, state: AgentState) -> AgentState:
+        forward, side, up = self.from_shared_coords([state.location.forward, state.location.side, state.location.up])[0]
+        return AgentState(
+            location=StateLocation(forward=int(forward), side=int(side), up=int(up)),
+            orientation=self._rotate_orientation(state.orientation, self.rotation.T)
+        )
+
+class WorldRegistry:
+    """
+    The WorldRegistry holds a single shared SubWorld per dimension along with the frame of every agent mapping into it.
+    Scans from any agent are converted into the shared frame so that agents exploring the same area build one map instead of one each.
+    """
+    def __init__(self, data_dir: Optional[str] = None, memory_budget: Optional[int] = None):
+        """
+        If data_dir is given then every world is opened from a subdirectory of it so that maps survive restarts.
+        memory_budget is the number of bytes of voxels each world may keep in memory before spilling chunks to disk.
+        """
+        self.data_dir = data_dir
+        self.memory_budget = memory_budget
+        self._worlds: Dict[str, SubWorld] = {}
+        self._agents: Dict[Any, Tuple[str, AgentFrame]] = {}
+
+    def get_world(self, dimension: str) -> SubWorld:
+        if dimension not in self._worlds:
+            if self.data_dir is None:
+                self._worlds[dimension] = SubWorld()
+            else:
+                self._worlds[dimension] = SubWorld.open(os.path.join(self.data_dir, dimension))
+            if self.memory_budget is not None:
+                self._worlds[dimension].set_memory_budget(self.memory_budget)
+        return self._worlds[dimension]
+
+    def dimensions(self) -> List[str]:
+        """
+        Returns the dimensions that have a world open
+        """
+        return list(self._worlds.keys())
+
+    def register_agent(self, agent_id: Any, frame: AgentFrame, dimension: str = "overworld"):
+        self._agents[agent_id] = (dimension, frame)
+
+    def unregister_agent(self, agent_id: Any):
+        if agent_id in self._agents:
+            self.get_agent_world(agent_id).remove_agent_location(agent_id)
+        self._agents.pop(agent_id, None)
+
+    def get_agent_frame(self, agent_id: Any) -> AgentFrame:
+        if agent_id not in self._agents:
+            raise ValueError(f"Agent {agent_id} is not registered.")
+        return self._agents[agent_id][1]
+
+    def get_agent_world(self, agent_id: Any) -> SubWorld:
+        if agent_id not in self._agents:
+            raise ValueError(f"Agent {agent_id} is not registered.")
+        return self.get_world(self._agents[agent_id][0])
+
+    def ingest_scan(self, agent_id: Any, scan: 'ScanResData'):
+        """
+        Adds a ScanResData taken by the agent to its dimension's shared world
+        """
+        self.get_agent_world(agent_id).ingest_scan(scan, self.get_agent_frame(agent_id))
+
+    def ingest_chunk_analysis(self, agent_id: Any, analysis: 'AnalyzeChunkResData'):
+        """
+        Adds an AnalyzeChunkResData taken by the agent to its dimension's resource index
+        """
+        self.get_agent_world(agent_id).ingest_chunk_analysis(analysis, self.get_agent_frame(agent_id))
+
+    def convert_coords(self, from_agent_id: Any, to_agent_id: Any, coords: np.ndarray) -> np.ndarray:
+        """
+        Converts an (N, 3) array of coordinates from one agent's frame into another's
+        """
+        shared = self.get_agent_frame(from_agent_id).to_shared_coords(coords)
+        return self.get_agent_frame(to_agent_id).from_shared_coords(shared)
+
+    def flush(self):
+        for world in self._worlds.values():
+            world.flush()
+
+    def close(self):
+        for world in self._worlds.values():
+            world.close()
@@ -0,0 +1,135 @@
+import heapq
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from models.__agent_models import StateLocation
+from .__chunk_store import CHUNK_SHIFT, CHUNK_SIZE
+
+ColumnKey = Tuple[int, int]  # (x, z) of a minecraft chunk column in world coordinates
+
+def column_key(location: StateLocation) -> ColumnKey:
+    """
+    Returns the chunk column a location in the shared frame is in. The shared frame's side axis is minecraft's -z.
+    """
+    return (location.forward >> CHUNK_SHIFT, (-location.side) >> CHUNK_SHIFT)
+
+def column_center(key: ColumnKey, up: int = 0) -> StateLocation:
+    """
+    Returns the location in the shared frame at the middle of a chunk column
+    """
+    return StateLocation(forward=(key[0] << CHUNK_SHIFT) + CHUNK_SIZE // 2, side=-((key[1] << CHUNK_SHIFT) + CHUNK_SIZE // 2), up=up)
+
+def _column_distance(key: ColumnKey, location: StateLocation) -> int:
+    """
+    Horizontal manhattan distance from a location to the closest block of a chunk column
+    """
+    x, z = location.forward, -location.side
+    min_x, min_z = key[0] << CHUNK_SHIFT, key[1] << CHUNK_SHIFT
+    dx = max(min_x - x, 0, x - (min_x + CHUNK_SIZE - 1))
+    dz = max(min_z - z, 0, z - (min_z + CHUNK_SIZE - 1))
+    return dx + dz
+
+class ChunkResourceIndex:
+    """
+    The ChunkResourceIndex holds how many of each block a geoScanner chunk analysis counted in every chunk column.
+    A chunk analysis counts the whole column at once, so the newest analysis of a column replaces the older ones and counts go down as the column is mined out.
+    Counts are also kept per block name so that finding the richest columns for a block only looks at columns that have it.
+    """
+    def __init__(self) -> None:
+        self._counts: Dict[ColumnKey, Dict[str, int]] = {}
+        self._by_block: Dict[str, Dict[ColumnKey, int]] = {}
+        self._analyzed_at: Dict[ColumnKey, float] = {}
+        self._num_analyses: Dict[ColumnKey, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __contains__(self, key: ColumnKey) -> bool:
+        return key in self._counts
+
+    def copy(self) -> 'ChunkResourceIndex':
+        index = ChunkResourceIndex()
+        index._counts = dict(self._counts)  # Count dicts are replaced rather than modified so they can be shared
+        index._by_block = {name: dict(columns) for name, columns in self._by_block.items()}
+        index._analyzed_at = dict(self._analyzed_at)
+        index._num_analyses = dict(self._num_analyses)
+        return index
+
+    def record(self, key: ColumnKey, counts: Dict[str, int], analyzed_at: Optional[float] = None):
+        """
+        Records the result of analyzing a chunk column, replacing whatever was known about it
+        """
+        for name in self._counts.get(key, {}):
+            columns = self._by_block[name]
+            del columns[key]
+            if len(columns) == 0:
+                del self._by_block[name]
+        counts = {name: count for name, count in counts.items() if count > 0}
+        self._counts[key] = counts
+        for name, count in counts.items():
+            self._by_block.setdefault(name, {})[key] = count
+        self._analyzed_at[key] = analyzed_at if analyzed_at is not None else time.time()
+        self._num_analyses[key] = self._num_analyses.get(key, 0) + 1
+
+    def get_counts(self, key: ColumnKey) -> Optional[Dict[str, int]]:
+        """
+        Returns the counts of the newest analysis of a column, or None if it has not been analyzed
+        """
+        counts = self._counts.get(key)
+        return None if counts is None else dict(counts)
+
+    def analyzed_at(self, key: ColumnKey) -> Optional[float]:
+        return self._analyzed_at.get(key)
+
+    def totals(self) -> Dict[str, int]:
+        """
+        Returns how many of each block were counted across every analyzed column
+        """
+        return {name: sum(columns.values()) for name, columns in self._by_block.items()}
+
+    def top_chunks(self, names: Union[str, Iterable[str]], location: Optional[StateLocation] = None, max_distance: Optional[int] = None, n: int = 5) -> List[Tuple[ColumnKey, int]]:
+        """
+        Returns up to n (column, count) pairs with the highest counts of the given blocks, highest first. Counts of several names are added together, which is useful for ores that have deepslate variants.
+        If max_distance is given then only columns within that horizontal manhattan distance of location are considered.
+        """
+        if isinstance(names, str):
+            names = [names]
+        totals: Dict[ColumnKey, int] = {}
+        for name in names:
+            for key, count in self._by_block.get(name, {}).items():
+                totals[key] = totals.get(key, 0) + count
+        if max_distance is not None:
+            if location is None:
+                raise ValueError("A location is needed to limit the distance")
+            totals = {key: count for key, count in totals.items() if _column_distance(key, location) <= max_distance}
+        # Ties go to the closer column when we have a location
+        sort_key = (lambda item: (item[1], -_column_distance(item[0], location))) if location is not None else (lambda item: item[1])
+        return heapq.nlargest(n, totals.items(), key=sort_key)
+
+    def save(self, path: str):
+        self.write_dump(path, self.dump())
+
+    def dump(self) -> List[Dict[str, Any]]:
+        return [
+            {"key": list(key), "counts": dict(counts), "analyzed_at": self._analyzed_at[key], "num_analyses": self._num_analyses[key]}
+            for key, counts in self._counts.items()
+        ]
+
+    @staticmethod
+    def write_dump(path: str, dump: List[Dict[str, Any]]):
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(dump, f)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'ChunkResourceIndex':
+        index = cls()
+        with open(path) as f:
+            for entry in json.load(f):
+                key = tuple(entry["key"])
+                index.record(key, entry["counts"], entry["analyzed_at"])
+                index._num_analyses[key] = entry["num_analyses"]
+        return index
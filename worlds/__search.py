@@ -0,0 +1,398 @@
+"""
+The state space the PathPlanner searches, with every AgentState packed into a single int.
+A state is its location's fields packed next to each other followed by two bits for one of the four orientations, so moving is an addition and the location of a state is a shift.
+Searches only ever touch ints and the occupancy bits, and AgentStates are only built for the path that is returned.
+"""
+
+import heapq
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from models.__agent_models import AgentState, StateLocation, StateOrientation
+from .__chunk_store import CHUNK_SHIFT, CHUNK_MASK, ChunkKey
+from .__occupancy import OccupancyGrid
+
+ORIENTATIONS = [(1, 0), (0, -1), (-1, 0), (0, 1)]  # (forward, side) in the order that positive turns go through them
+TURN_COSTS = [0, 1, 2, 1]  # Turns between two orientations that are i positive turns apart, which is also 1 - their dot product
+
+COORD_BITS = 26  # Bits for forward and side, which covers the whole minecraft world
+UP_BITS = 12
+_COORD_BIAS = 1 << (COORD_BITS - 1)
+_UP_BIAS = 1 << (UP_BITS - 1)
+_COORD_MASK = (1 << COORD_BITS) - 1
+_UP_MASK = (1 << UP_BITS) - 1
+_UP_SHIFT = 2
+_SIDE_SHIFT = _UP_SHIFT + UP_BITS
+_FORWARD_SHIFT = _SIDE_SHIFT + COORD_BITS
+
+UP_STEP = 1 << _UP_SHIFT  # Added to a state to move it up by one
+FORWARD_STEPS = [(forward << _FORWARD_SHIFT) + (side << _SIDE_SHIFT) for forward, side in ORIENTATIONS]  # Added to a state to move it forward
+
+BUDGET_CHECK_INTERVAL = 256  # Expansions between checks of the clock
+BYTES_PER_STATE = 250  # Rough memory held per state a search has seen, across its g score, parent and heap entry
+
+Heuristic = Callable[[int, int, int, int], int]  # Takes the forward, side, up and orientation of a state
+IsFree = Callable[[int, int, int], bool]
+
+def pack_state(forward: int, side: int, up: int, orientation: int) -> int:
+    return ((forward + _COORD_BIAS) << _FORWARD_SHIFT) | ((side + _COORD_BIAS) << _SIDE_SHIFT) | ((up + _UP_BIAS) << _UP_SHIFT) | orientation
+
+def unpack_state(state: int) -> Tuple[int, int, int, int]:
+    """
+    Returns the forward, side, up and orientation index of a packed state
+    """
+    return (
+        ((state >> _FORWARD_SHIFT) & _COORD_MASK) - _COORD_BIAS,
+        ((state >> _SIDE_SHIFT) & _COORD_MASK) - _COORD_BIAS,
+        ((state >> _UP_SHIFT) & _UP_MASK) - _UP_BIAS,
+        state & 3,
+    )
+
+def pack_location(location: StateLocation) -> int:
+    """
+    Returns the location part of a packed state, which is the state shifted right by two
+    """
+    return pack_state(location.forward, location.side, location.up, 0) >> 2
+
+def orientation_index(orientation: StateOrientation) -> int:
+    return ORIENTATIONS.index((orientation.forward, orientation.side))
+
+def state_from_agent_state(state: AgentState) -> int:
+    location = state.location
+    return pack_state(location.forward, location.side, location.up, orientation_index(state.orientation))
+
+def state_to_agent_state(state: int) -> AgentState:
+    forward, side, up, orientation = unpack_state(state)
+    orientation_forward, orientation_side = ORIENTATIONS[orientation]
+    return AgentState(
+        location=StateLocation(forward=forward, side=side, up=up),
+        orientation=StateOrientation(forward=orientation_forward, side=orientation_side, up=0)
+    )
+
+def free_space(occupancy: OccupancyGrid, assume_occupied: bool = True) -> IsFree:
+    """
+    Returns a function that tells whether a voxel is free to move into.
+    The bits of every chunk are copied the first time the chunk is touched, so the answers stay consistent for as long as the function is used.
+    """
+    chunks: Dict[ChunkKey, Optional[Tuple[bytes, bytes]]] = {}
+    unknown_free = not assume_occupied
+    def is_free(forward: int, side: int, up: int) -> bool:
+        key = (forward >> CHUNK_SHIFT, side >> CHUNK_SHIFT, up >> CHUNK_SHIFT)
+        if key in chunks:
+            bits = chunks[key]
+        else:
+            bits = chunks[key] = occupancy.chunk_bits(key)
+        if bits is None:
+            return unknown_free
+        index = ((forward & CHUNK_MASK) << (2 * CHUNK_SHIFT)) | ((side & CHUNK_MASK) << CHUNK_SHIFT) | (up & CHUNK_MASK)
+        byte, mask = index >> 3, 1 << (index & 7)
+        if not bits[0][byte] & mask:
+            return unknown_free
+        return not bits[1][byte] & mask
+    return is_free
+
+def state_heuristic(goals: List[Tuple[int, int, int, Optional[int]]]) -> Heuristic:
+    """
+    Returns the PathPlanner's state distance to the closest of a list of (forward, side, up, orientation) goals. A None orientation means any orientation.
+    """
+    if len(goals) == 1:
+        goal_forward, goal_side, goal_up, goal_orientation = goals[0]
+        if goal_orientation is None:
+            return lambda forward, side, up, orientation: abs(forward - goal_forward) + abs(side - goal_side) + abs(up - goal_up)
+        return lambda forward, side, up, orientation: abs(forward - goal_forward) + abs(side - goal_side) + abs(up - goal_up) + TURN_COSTS[(orientation - goal_orientation) & 3]
+    def heuristic(forward: int, side: int, up: int, orientation: int) -> int:
+        return min(
+            abs(forward - goal_forward) + abs(side - goal_side) + abs(up - goal_up) + (0 if goal_orientation is None else TURN_COSTS[(orientation - goal_orientation) & 3])
+            for goal_forward, goal_side, goal_up, goal_orientation in goals
+        )
+    return heuristic
+
+class OutOfPlaneFilter:
+    """
+    Rejects states that are not at a given height. Works on both AgentStates and packed states so that searches do not have to build an AgentState for every neighbor.
+    """
+    def __init__(self, up: int):
+        self.up = up
+
+    # Filters for the same height are equal so that the PathPlanner's path cache can match them
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, OutOfPlaneFilter) and other.up == self.up
+
+    def __hash__(self) -> int:
+        return hash((OutOfPlaneFilter, self.up))
+
+    def __call__(self, state: AgentState) -> bool:
+        return state.location.up != self.up
+
+    def reject_packed(self, state: int) -> bool:
+        return ((state >> _UP_SHIFT) & _UP_MASK) - _UP_BIAS != self.up
+
+def packed_filter(reject_neighbors: Optional[Callable[[AgentState], bool]]) -> Optional[Callable[[int], bool]]:
+    """
+    Converts a filter on AgentStates into one on packed states
+    """
+    if reject_neighbors is None:
+        return None
+    if hasattr(reject_neighbors, "reject_packed"):
+        return reject_neighbors.reject_packed
+    return lambda state: reject_neighbors(state_to_agent_state(state))
+
+def reconstruct_path(parents: Dict[int, Optional[int]], state: int) -> List[int]:
+    path = [state]
+    while parents[state] is not None:
+        state = parents[state]
+        path.append(state)
+    path.reverse()
+    return path
+
+class PlanStatus(Enum):
+    FOUND = "found"
+    NO_PATH = "noPath"  # One side of the search ran out of states, so the start or every goal is enclosed
+    EXPANSION_BUDGET_EXCEEDED = "expansionBudgetExceeded"
+    TIME_BUDGET_EXCEEDED = "timeBudgetExceeded"
+    MEMORY_BUDGET_EXCEEDED = "memoryBudgetExceeded"
+
+class SearchEngine(Enum):
+    BIDIRECTIONAL = "bidirectional"  # Searches from the start and the goal at once. Goals too large to list fall back to A*
+    A_STAR = "aStar"
+    JUMP_POINT = "jumpPoint"  # A* that skips orderings of the same moves. See worlds.__jump_point
+
+@dataclass
+class SearchBudget:
+    """
+    Limits on a single search. None means unlimited.
+    max_states bounds memory: it is the number of states both sides of the search may hold, each of which costs about BYTES_PER_STATE bytes.
+    """
+    max_expansions: Optional[int] = None
+    max_seconds: Optional[float] = None
+    max_states: Optional[int] = None
+
+    @classmethod
+    def from_memory(cls, max_bytes: int, max_expansions: Optional[int] = None, max_seconds: Optional[float] = None) -> 'SearchBudget':
+        return cls(max_expansions, max_seconds, max(1, max_bytes // BYTES_PER_STATE))
+
+    def remaining(self, expansions: int, seconds: float) -> 'SearchBudget':
+        """
+        Returns what is left of this budget after some of it was spent, for plans that run several searches one after another.
+        max_states is not spent since each search frees its states before the next one starts.
+        """
+        return SearchBudget(
+            None if self.max_expansions is None else self.max_expansions - expansions,
+            None if self.max_seconds is None else self.max_seconds - seconds,
+            self.max_states,
+        )
+
+    @property
+    def exhausted(self) -> Optional['PlanStatus']:
+        """
+        The status of a search that would have to stop before its first expansion, or None if there is budget left
+        """
+        if self.max_expansions is not None and self.max_expansions <= 0:
+            return PlanStatus.EXPANSION_BUDGET_EXCEEDED
+        if self.max_seconds is not None and self.max_seconds <= 0:
+            return PlanStatus.TIME_BUDGET_EXCEEDED
+        return None
+
+@dataclass
+class PlanResult:
+    status: PlanStatus
+    path: Optional[List[AgentState]] = None
+    expansions: int = 0
+    seconds: float = 0.0
+
+    @property
+    def found(self) -> bool:
+        return self.status == PlanStatus.FOUND
+
+    @property
+    def budget_exceeded(self) -> bool:
+        return self.status not in (PlanStatus.FOUND, PlanStatus.NO_PATH)
+
+def _pop_closed(heap: list, closed: set):
+    """
+    Drops heap entries of states that were already expanded so that the top of the heap is a real bound
+    """
+    while heap and heap[0][3] in closed:
+        heapq.heappop(heap)
+
+def a_star(
+    start: int,
+    is_goal: Callable[[int], bool],
+    heuristic: Heuristic,
+    is_free: IsFree,
+    reject: Optional[Callable[[int], bool]] = None,
+    budget: Optional[SearchBudget] = None,
+) -> Tuple[PlanStatus, Optional[List[int]], int]:
+    """
+    Runs A* over packed states. Every action costs 1: moving forward, up or down into a free voxel, or turning left or right while standing in a free voxel.
+    The heuristic must be consistent, which lets every state be expanded at most once. Ties in f go to the state with the lower heuristic so that the search dives toward the goal.
+    This is for goals that can be tested but not listed, which bidirectional_search can not start from. Returns the status, the packed path if one was found and the number of expansions.
+    """
+    budget = budget if budget is not None else SearchBudget()
+    heap = [(heuristic(*unpack_state(start)), 0, 0, start)]
+    g_scores = {start: 0}
+    parents: Dict[int, Optional[int]] = {start: None}
+    closed = set()
+    pushed = 1
+    expansions = 0
+    started = time.monotonic()
+    heappush, heappop = heapq.heappush, heapq.heappop
+    while heap:
+        _, _, _, state = heappop(heap)
+        if state in closed:
+            continue
+        if is_goal(state):
+            return PlanStatus.FOUND, reconstruct_path(parents, state), expansions
+        if budget.max_expansions is not None and expansions >= budget.max_expansions:
+            return PlanStatus.EXPANSION_BUDGET_EXCEEDED, None, expansions
+        if budget.max_states is not None and len(g_scores) >= budget.max_states:
+            return PlanStatus.MEMORY_BUDGET_EXCEEDED, None, expansions
+        if budget.max_seconds is not None and expansions % BUDGET_CHECK_INTERVAL == 0 and time.monotonic() - started >= budget.max_seconds:
+            return PlanStatus.TIME_BUDGET_EXCEEDED, None, expansions
+        expansions += 1
+        closed.add(state)
+
+        forward, side, up, orientation = unpack_state(state)
+        g = g_scores[state] + 1
+        step_forward, step_side = ORIENTATIONS[orientation]
+        successors = []
+        if is_free(forward + step_forward, side + step_side, up):
+            successors.append((state + FORWARD_STEPS[orientation], forward + step_forward, side + step_side, up, orientation))
+        if is_free(forward, side, up + 1):
+            successors.append((state + UP_STEP, forward, side, up + 1, orientation))
+        if is_free(forward, side, up - 1):
+            successors.append((state - UP_STEP, forward, side, up - 1, orientation))
+        if is_free(forward, side, up):
+            location = state & ~3
+            successors.append((location | ((orientation + 1) & 3), forward, side, up, (orientation + 1) & 3))
+            successors.append((location | ((orientation - 1) & 3), forward, side, up, (orientation - 1) & 3))
+
+        for neighbor, neighbor_forward, neighbor_side, neighbor_up, neighbor_orientation in successors:
+            if neighbor in closed or g >= g_scores.get(neighbor, g + 1):
+                continue
+            if reject is not None and reject(neighbor):
+                continue
+            g_scores[neighbor] = g
+            parents[neighbor] = state
+            h = heuristic(neighbor_forward, neighbor_side, neighbor_up, neighbor_orientation)
+            heappush(heap, (g + h, h, pushed, neighbor))
+            pushed += 1
+    return PlanStatus.NO_PATH, None, expansions
+
+def bidirectional_search(
+    start: int,
+    goals: Iterable[int],
+    forward_heuristic: Heuristic,
+    is_free: IsFree,
+    reject: Optional[Callable[[int], bool]] = None,
+    budget: Optional[SearchBudget] = None,
+) -> Tuple[PlanStatus, Optional[List[int]], int]:
+    """
+    Runs A* from the start and from every goal at once and joins them where they meet. Returns the status, the packed path if one was found and the number of expansions.
+    The backward search walks edges in reverse. Every edge into a state requires the state's voxel to be free, so the predecessors of a state in a free voxel are the state behind it, above it, below it and its two turns.
+    Whichever side has the smaller frontier is expanded next. If either side runs out of states then there is no path, which ends the search even if the world is unbounded as long as the start or the goals are enclosed.
+    The search stops once the best meeting found is no longer than the lowest f of either frontier, which keeps paths optimal since both heuristics are consistent.
+    """
+    budget = budget if budget is not None else SearchBudget()
+    start_forward, start_side, start_up, start_orientation = unpack_state(start)
+    backward_heuristic = state_heuristic([(start_forward, start_side, start_up, start_orientation)])
+
+    forward_g = {start: 0}
+    forward_parents: Dict[int, Optional[int]] = {start: None}
+    forward_heap = [(forward_heuristic(start_forward, start_side, start_up, start_orientation), 0, 0, start)]
+    backward_g: Dict[int, int] = {}
+    backward_parents: Dict[int, Optional[int]] = {}  # The next state on the way to a goal
+    backward_heap = []
+    for goal in goals:
+        if goal in backward_g:
+            continue
+        # Like the other searches, a goal that the filter rejects can only be reached by starting there
+        if reject is not None and goal != start and reject(goal):
+            continue
+        backward_g[goal] = 0
+        backward_parents[goal] = None
+        h = backward_heuristic(*unpack_state(goal))
+        backward_heap.append((h, h, len(backward_heap), goal))
+    heapq.heapify(backward_heap)
+    forward_closed, backward_closed = set(), set()
+
+    best_cost = 0 if start in backward_g else None
+    meeting = start if best_cost is not None else None
+    pushed = len(backward_heap) + 1
+    expansions = 0
+    started = time.monotonic()
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    while True:
+        _pop_closed(forward_heap, forward_closed)
+        _pop_closed(backward_heap, backward_closed)
+        if not forward_heap or not backward_heap:
+            break
+        if best_cost is not None and best_cost <= max(forward_heap[0][0], backward_heap[0][0]):
+            break
+        if budget.max_expansions is not None and expansions >= budget.max_expansions:
+            return PlanStatus.EXPANSION_BUDGET_EXCEEDED, None, expansions
+        if budget.max_states is not None and len(forward_g) + len(backward_g) >= budget.max_states:
+            return PlanStatus.MEMORY_BUDGET_EXCEEDED, None, expansions
+        if budget.max_seconds is not None and expansions % BUDGET_CHECK_INTERVAL == 0 and time.monotonic() - started >= budget.max_seconds:
+            return PlanStatus.TIME_BUDGET_EXCEEDED, None, expansions
+        expansions += 1
+
+        is_forward = len(forward_heap) <= len(backward_heap)
+        if is_forward:
+            heap, closed, g_scores, parents, other_g, heuristic = forward_heap, forward_closed, forward_g, forward_parents, backward_g, forward_heuristic
+        else:
+            heap, closed, g_scores, parents, other_g, heuristic = backward_heap, backward_closed, backward_g, backward_parents, forward_g, backward_heuristic
+        _, _, _, state = heappop(heap)
+        closed.add(state)
+        forward, side, up, orientation = unpack_state(state)
+        g = g_scores[state] + 1
+
+        successors = []
+        if is_forward:
+            step_forward, step_side = ORIENTATIONS[orientation]
+            if is_free(forward + step_forward, side + step_side, up):
+                successors.append((state + FORWARD_STEPS[orientation], forward + step_forward, side + step_side, up, orientation))
+            if is_free(forward, side, up + 1):
+                successors.append((state + UP_STEP, forward, side, up + 1, orientation))
+            if is_free(forward, side, up - 1):
+                successors.append((state - UP_STEP, forward, side, up - 1, orientation))
+            if is_free(forward, side, up):
+                location = state & ~3
+                successors.append((location | ((orientation + 1) & 3), forward, side, up, (orientation + 1) & 3))
+                successors.append((location | ((orientation - 1) & 3), forward, side, up, (orientation - 1) & 3))
+        elif is_free(forward, side, up):
+            step_forward, step_side = ORIENTATIONS[orientation]
+            location = state & ~3
+            successors = [
+                (state - FORWARD_STEPS[orientation], forward - step_forward, side - step_side, up, orientation),
+                (state - UP_STEP, forward, side, up - 1, orientation),
+                (state + UP_STEP, forward, side, up + 1, orientation),
+                (location | ((orientation + 1) & 3), forward, side, up, (orientation + 1) & 3),
+                (location | ((orientation - 1) & 3), forward, side, up, (orientation - 1) & 3),
+            ]
+
+        for neighbor, neighbor_forward, neighbor_side, neighbor_up, neighbor_orientation in successors:
+            if neighbor in closed or g >= g_scores.get(neighbor, g + 1):
+                continue
+            if reject is not None and reject(neighbor):
+                continue
+            g_scores[neighbor] = g
+            parents[neighbor] = state
+            h = heuristic(neighbor_forward, neighbor_side, neighbor_up, neighbor_orientation)
+            heappush(heap, (g + h, h, pushed, neighbor))
+            pushed += 1
+            other = other_g.get(neighbor)
+            if other is not None and (best_cost is None or g + other < best_cost):
+                best_cost, meeting = g + other, neighbor
+
+    if meeting is None:
+        return PlanStatus.NO_PATH, None, expansions
+    path = reconstruct_path(forward_parents, meeting)
+    state = backward_parents[meeting]
+    while state is not None:
+        path.append(state)
+        state = backward_parents[state]
+    return PlanStatus.FOUND, path, expansions
@@ -0,0 +1,146 @@
+import heapq
+from typing import Dict, Generic, Iterator, List, Optional, Tuple, TypeVar
+
+from models.__agent_models import StateLocation
+
+T = TypeVar('T')
+Cell = Tuple[int, int, int]
+
+class SpatialHash(Generic[T]):
+    """
+    A SpatialHash buckets (StateLocation, item) pairs into a grid of cubic cells so that range and nearest neighbor queries only have to look at nearby cells.
+    All distances are manhattan distances to match StateLocation.distance.
+    """
+    def __init__(self, cell_size: int = 16) -> None:
+        self.cell_size = cell_size
+        self._cells: Dict[Cell, List[Tuple[StateLocation, T]]] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Tuple[StateLocation, T]]:
+        for entries in self._cells.values():
+            yield from entries
+
+    def copy(self) -> 'SpatialHash[T]':
+        spatial_hash = SpatialHash(self.cell_size)
+        spatial_hash._cells = {cell: list(entries) for cell, entries in self._cells.items()}
+        spatial_hash._count = self._count
+        return spatial_hash
+
+    def _cell(self, location: StateLocation) -> Cell:
+        return (location.forward // self.cell_size, location.side // self.cell_size, location.up // self.cell_size)
+
+    def insert(self, location: StateLocation, item: T):
+        self._cells.setdefault(self._cell(location), []).append((location, item))
+        self._count += 1
+
+    def remove(self, location: StateLocation, item: T) -> bool:
+        """
+        Removes a single matching entry. Returns whether or not anything was removed.
+        """
+        cell = self._cell(location)
+        entries = self._cells.get(cell, [])
+        for i, (entry_location, entry_item) in enumerate(entries):
+            if entry_location == location and entry_item is item:
+                del entries[i]
+                if len(entries) == 0:
+                    del self._cells[cell]
+                self._count -= 1
+                return True
+        return False
+
+    def _cells_in_box(self, min_cell: Cell, max_cell: Cell) -> Iterator[List[Tuple[StateLocation, T]]]:
+        num_cells = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1) * (max_cell[2] - min_cell[2] + 1)
+        if num_cells > len(self._cells):
+            # The box covers more cells than we have so it is cheaper to filter the occupied cells
+            for cell, entries in self._cells.items():
+                if all(min_cell[i] <= cell[i] <= max_cell[i] for i in range(3)):
+                    yield entries
+            return
+        for x in range(min_cell[0], max_cell[0] + 1):
+            for y in range(min_cell[1], max_cell[1] + 1):
+                for z in range(min_cell[2], max_cell[2] + 1):
+                    entries = self._cells.get((x, y, z))
+                    if entries is not None:
+                        yield entries
+
+    def query_box(self, min_location: StateLocation, max_location: StateLocation) -> List[Tuple[StateLocation, T]]:
+        """
+        Returns every entry inside of the inclusive axis aligned box between min_location and max_location
+        """
+        results = []
+        for entries in self._cells_in_box(self._cell(min_location), self._cell(max_location)):
+            for location, item in entries:
+                if min_location.forward <= location.forward <= max_location.forward and \
+                        min_location.side <= location.side <= max_location.side and \
+                        min_location.up <= location.up <= max_location.up:
+                    results.append((location, item))
+        return results
+
+    def query_radius(self, center: StateLocation, radius: int) -> List[Tuple[StateLocation, T]]:
+        """
+        Returns every entry within a manhattan distance of radius from center, sorted by distance
+        """
+        min_cell = self._cell(StateLocation(forward=center.forward - radius, side=center.side - radius, up=center.up - radius))
+        max_cell = self._cell(StateLocation(forward=center.forward + radius, side=center.side + radius, up=center.up + radius))
+        results = []
+        for entries in self._cells_in_box(min_cell, max_cell):
+            for location, item in entries:
+                distance = center.distance(location)
+                if distance <= radius:
+                    results.append((distance, location, item))
+        results.sort(key=lambda result: result[0])
+        return [(location, item) for _, location, item in results]
+
+    def nearest(self, center: StateLocation, k: int = 1, max_distance: Optional[int] = None) -> List[Tuple[StateLocation, T]]:
+        """
+        Returns up to k entries closest to center, sorted by distance.
+        Cells are visited in growing shells around the center cell and we stop once no unvisited cell can contain anything closer than what we have.
+        """
+        if k <= 0 or self._count == 0:
+            return []
+        center_cell = self._cell(center)
+        max_ring = max(max(abs(cell[i] - center_cell[i]) for i in range(3)) for cell in self._cells)
+        best: List[Tuple[int, int, StateLocation, T]] = []  # Max heap of the k best entries by negated distance
+        counter = 0
+        for ring in range(max_ring + 1):
+            # Every voxel in a cell that is ring cells away is at least this far away on one axis
+            ring_min_distance = max(0, (ring - 1) * self.cell_size + 1)
+            if max_distance is not None and ring_min_distance > max_distance:
+                break
+            if len(best) == k and -best[0][0] <= ring_min_distance:
+                break
+            for entries in self._ring_cells(center_cell, ring):
+                for location, item in entries:
+                    distance = center.distance(location)
+                    if max_distance is not None and distance > max_distance:
+                        continue
+                    counter += 1
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, counter, location, item))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, counter, location, item))
+        best.sort(key=lambda entry: (-entry[0], entry[1]))
+        return [(location, item) for _, _, location, item in best]
+
+    def _ring_cells(self, center_cell: Cell, ring: int) -> Iterator[List[Tuple[StateLocation, T]]]:
+        """
+        Yields the occupied cells whose chebyshev distance from center_cell is exactly ring
+        """
+        num_cells = (2 * ring + 1) ** 3 - max(0, 2 * ring - 1) ** 3
+        if num_cells > len(self._cells):
+            for cell, entries in self._cells.items():
+                if max(abs(cell[i] - center_cell[i]) for i in range(3)) == ring:
+                    yield entries
+            return
+        cx, cy, cz = center_cell
+        for x in range(cx - ring, cx + ring + 1):
+            for y in range(cy - ring, cy + ring + 1):
+                on_shell = abs(x - cx) == ring or abs(y - cy) == ring
+                z_values = range(cz - ring, cz + ring + 1) if on_shell else (cz - ring, cz + ring)
+                for z in z_values:
+                    entries = self._cells.get((x, y, z))
+                    if entries is not None:
+                        yield entries
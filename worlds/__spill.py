@@ -0,0 +1,44 @@
+import os
+import tempfile
+import zlib
+import numpy as np
+from typing import Optional, Tuple
+
+SpillEntry = Tuple['SpillFile', int, int]  # The file a chunk was spilled to, its offset and its compressed length
+
+class SpillFile:
+    """
+    An anonymous, append only file that evicted chunks are compressed into.
+    Entries are never overwritten, so a snapshot can keep reading the entries it was taken with while the store it came from keeps spilling.
+    Reads and writes use pread and pwrite so that exports running on another thread can read at the same time.
+    The file is deleted as soon as nothing references it any more.
+    """
+    def __init__(self, directory: Optional[str] = None):
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self.size = 0
+
+    def _append(self, data: bytes) -> SpillEntry:
+        offset = self.size
+        os.pwrite(self._file.fileno(), data, offset)
+        self.size += len(data)
+        return (self, offset, len(data))
+
+    def write(self, chunk: np.ndarray) -> SpillEntry:
+        # Chunks are mostly one or two values so even the fastest compression level shrinks them a lot
+        return self._append(zlib.compress(np.ascontiguousarray(chunk).tobytes(), 1))
+
+    def read_raw(self, offset: int, length: int) -> bytes:
+        return os.pread(self._file.fileno(), length, offset)
+
+    def read(self, offset: int, length: int, dtype, shape: Tuple[int, ...]) -> np.ndarray:
+        data = zlib.decompress(self.read_raw(offset, length))
+        return np.frombuffer(data, dtype=dtype).reshape(shape).copy()
+
+    def copy_entry(self, entry: SpillEntry) -> SpillEntry:
+        """
+        Copies an entry from another spill file into this one without decompressing it
+        """
+        spill_file, offset, length = entry
+        return self._append(spill_file.read_raw(offset, length))
@@ -1,13 +1,39 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections.abc import Hashable
 from dataclasses import dataclass
 from pydantic import BaseModel, Field
-from typing import Any, Callable, Optional, List, Dict, Tuple, TYPE_CHECKING
+from typing import Any, Callable, Iterable, Optional, List, Dict, Sequence, Set, Tuple, Union, TYPE_CHECKING
 
-from queue import PriorityQueue
+import numpy as np
 from models.__world_models import BlockData
 from models.__agent_models import AgentState, StateLocation
+from .__chunk_store import ChunkStore, ChunkKey, CHUNK_SHIFT, CHUNK_SIZE, as_coords, dedupe_coords
+from .__changes import WorldSubscription, changed_chunks
+from .__occupancy import OccupancyGrid
+from .__reachability import ReachabilityIndex
+from .__incremental import IncrementalPlanner
+from .__goals import UNLISTED_GOAL_BUDGET, Goal, LocationGoal, StateGoal
+from .__jump_point import jump_point_search
+from .__path_cache import DEFAULT_MAX_PATHS, PathCache
+from .__hierarchy import MAX_GOALS as MAX_HIERARCHICAL_GOALS, MIN_DISTANCE as MIN_HIERARCHICAL_DISTANCE, REFINE_CHUNKS, ChunkFilter, ChunkGraph, chunk_of
+from .__search import OutOfPlaneFilter, PlanResult, PlanStatus, SearchBudget, SearchEngine, a_star, bidirectional_search, free_space, packed_filter, state_from_agent_state, state_to_agent_state
+from .__resources import ChunkResourceIndex, ColumnKey, column_key
+from .__palette import BlockPalette
+from .__block_index import BlockIndex
+from .__spatial_index import SpatialHash
+from .__persistent_store import PersistentChunkStore
+from .__mutation_log import MutationLog, PaletteRecord, read_log
 
 if TYPE_CHECKING:
     from agents import AgentManager
+    from .__registry import AgentFrame
+    from models.commands import ScanResData, AnalyzeChunkResData
+
+MutationListener = Callable[[np.ndarray, np.ndarray, np.ndarray], None]
 
 # class Position(BaseModel):
 #     """
@@ -110,87 +136,549 @@ class FuelInventory(WorldInventory):
         inventory = Inventory(size=size, filter=Filter(stores=['minecraft:coal', 'minecraft:charcoal']))
         super().__init__(position, inventory, manager)
 
+@dataclass
+class _PendingFlush:
+    """
+    Everything a flush copied from the world, waiting to be written to disk
+    """
+    ticket: int
+    log: Optional[MutationLog]
+    snapshot_sequence: int  # The snapshot covers every logged record before this one
+    palette: List[Dict[str, Any]]
+    block_index: Dict[int, np.ndarray]
+    resources: List[Dict[str, Any]]
+    chunks: Dict[ChunkKey, Tuple[np.ndarray, int]]
+
 class SubWorld:
     """
     SubWorlds are the base element of the world. They all contain their own relative position grid.
     A SubWorld that where the coordinates align with the world grid is called a "RootWorld".
 
     The main purpose of a SubWorld is to allow for path planning and identifying places to store or retrieve items.
+
+    Voxels are stored in a ChunkStore indexed by (forward, side, up) so that large scans can be ingested as arrays instead of one model per voxel.
+    Each voxel holds the id of its block in the world's BlockPalette.
     """
-    def __init__(self) -> None:
-        self._world_inventories: List[WorldInventory] = {}
-        self._fuel_inventories: List[FuelInventory] = {}
-        self._occupation_grid: Dict[StateLocation, bool] = {}
-        self._detail_grid: Dict[StateLocation, Optional[BlockData]] = {}
-        self.key_location_groups: Dict[str, List[Tuple[StateLocation, Any]]]
+    PALETTE_FILE = "palette.json"
+    BLOCK_INDEX_DIR = "block_index"
+    SNAPSHOT_FILE = "snapshot.json"
+    RESOURCES_FILE = "chunk_resources.json"
+    LOG_DIR = "log"
+
+    def __init__(self, store: Optional[ChunkStore] = None, palette: Optional[BlockPalette] = None, block_index: Optional[BlockIndex] = None) -> None:
+        self._world_inventories: SpatialHash[WorldInventory] = SpatialHash()
+        self._fuel_inventories: SpatialHash[FuelInventory] = SpatialHash()
+        self._store = store if store is not None else ChunkStore(np.uint16)
+        self.palette = palette if palette is not None else BlockPalette()
+        self._block_index = block_index if block_index is not None else BlockIndex(self.palette)
+        self._block_index.store = self._store
+        self.occupancy = OccupancyGrid(self._store, self.palette)  # What the planner reads instead of the block ids
+        self.reachability = ReachabilityIndex(self._store, self.occupancy)
+        self._store.add_eviction_listener(self._drop_chunks)
+        self._mutation_listeners: List[MutationListener] = []
+        self._log: Optional[MutationLog] = None
+        # Flushes take a ticket when they copy the world and write to disk in ticket order, so an older flush never overwrites a newer one
+        self._flush_turn = threading.Condition()
+        self._next_flush_ticket = 0
+        self._flushing_ticket = 0
+        self.version = 0  # Incremented every time the world changes
+        self._chunk_versions: Dict[ChunkKey, int] = {}  # The version each chunk last changed at
+        self._subscriptions: List[WorldSubscription] = []
+        self._agent_locations: Dict[Any, StateLocation] = {}
+        self._keep_radius = 2
+        self.key_location_groups: Dict[str, SpatialHash[Any]] = {}
+        self.resources = ChunkResourceIndex()  # Block counts of every chunk column we have analyzed
+
+    @classmethod
+    def open(cls, path: str) -> 'SubWorld':
+        """
+        Opens the world saved in the directory at path, creating it if it does not exist.
+        Only the palette and the list of chunks are read up front. Chunks are loaded from disk as they are used and written back by flush.
+        Anything in the mutation log that is newer than the last snapshot is replayed, and every change from here on is logged.
+        """
+        store = PersistentChunkStore(path)
+        palette_path = os.path.join(path, cls.PALETTE_FILE)
+        palette = BlockPalette.load(palette_path) if os.path.exists(palette_path) else BlockPalette()
+        block_index = BlockIndex.load(palette, os.path.join(path, cls.BLOCK_INDEX_DIR))
+        world = cls(store, palette, block_index)
+        resources_path = os.path.join(path, cls.RESOURCES_FILE)
+        if os.path.exists(resources_path):
+            world.resources = ChunkResourceIndex.load(resources_path)
+
+        snapshot_sequence = 0
+        snapshot_path = os.path.join(path, cls.SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path) as f:
+                snapshot_sequence = json.load(f)["sequence"]
+        next_sequence = snapshot_sequence
+        for record in read_log(os.path.join(path, cls.LOG_DIR), snapshot_sequence):
+            if isinstance(record, PaletteRecord):
+                palette.restore(record.block_id, record.block)
+            else:
+                world._write(record.coords, record.block_ids)
+            next_sequence = record.sequence + 1
+        world._log = MutationLog(os.path.join(path, cls.LOG_DIR), palette, next_sequence)
+        world.add_mutation_listener(world._log.record)
+        return world
+
+    def flush(self):
+        """
+        Writes all changes to disk if the world was opened from a directory.
+        This takes a snapshot of the world so the mutation log is compacted afterwards.
+        Waiting for the log can take a while, so code on the event loop should await flush_async instead.
+        """
+        pending = self._begin_flush()
+        if pending is not None:
+            self._write_flush(pending)
+            self._end_flush(pending)
+
+    async def flush_async(self):
+        """
+        Like flush, but only copies what changed on the event loop and writes it to disk from a worker thread, so agents keep running in the meantime
+        """
+        pending = self._begin_flush()
+        if pending is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._write_flush, pending)
+            self._end_flush(pending)
+
+    def _begin_flush(self) -> Optional['_PendingFlush']:
+        if self._store.path is None:
+            return None
+        pending = _PendingFlush(
+            ticket=self._next_flush_ticket,
+            log=self._log,
+            snapshot_sequence=self._log.start_segment() if self._log is not None else 0,
+            palette=self.palette.dump(),
+            block_index=self._block_index.dump(),
+            resources=self.resources.dump(),
+            chunks=self._store.begin_flush(),
+        )
+        self._next_flush_ticket += 1
+        return pending
+
+    def _write_flush(self, pending: '_PendingFlush'):
+        """
+        Writes a flush to disk. Only touches files and the log, so it can run on any thread.
+        The palette and block index are written before the chunks. A crash in between then replays the log onto the old chunks, which brings the index along. The other way around, replay would find the chunks already changed and never fix the index.
+        """
+        path = self._store.path
+        with self._flush_turn:
+            self._flush_turn.wait_for(lambda: self._flushing_ticket == pending.ticket)
+        try:
+            BlockPalette.write_dump(os.path.join(path, self.PALETTE_FILE), pending.palette)
+            BlockIndex.write_dump(os.path.join(path, self.BLOCK_INDEX_DIR), pending.block_index)
+            ChunkResourceIndex.write_dump(os.path.join(path, self.RESOURCES_FILE), pending.resources)
+            self._store.write_chunk_files(pending.chunks)
+            if pending.log is not None:
+                snapshot_path = os.path.join(path, self.SNAPSHOT_FILE)
+                with open(snapshot_path + ".tmp", "w") as f:
+                    json.dump({"sequence": pending.snapshot_sequence}, f)
+                os.replace(snapshot_path + ".tmp", snapshot_path)
+                pending.log.compact(pending.snapshot_sequence)
+        finally:
+            with self._flush_turn:
+                self._flushing_ticket += 1
+                self._flush_turn.notify_all()
+
+    def _end_flush(self, pending: '_PendingFlush'):
+        self._store.end_flush(pending.chunks)
+
+    def close(self):
+        """
+        Stops logging after waiting for everything logged so far to reach the disk
+        """
+        if self._log is not None:
+            self._log.close()
+            self._mutation_listeners.remove(self._log.record)
+            self._log = None
+
+    def snapshot(self) -> 'SubWorld':
+        """
+        Returns an independent copy of the world as it is right now.
+        Chunks and index entries are shared with this world until one side writes to them, so a snapshot costs time proportional to the number of chunks rather than voxels.
+        This lets a planner work on a consistent view while scans keep arriving, or try out hypothetical edits without touching the real world.
+        Snapshots are kept in memory and do not log their changes.
+        """
+        palette = self.palette.copy()
+        world = SubWorld(self._store.snapshot(), palette, self._block_index.snapshot(palette))
+        world._world_inventories = self._world_inventories.copy()
+        world._fuel_inventories = self._fuel_inventories.copy()
+        world.key_location_groups = {key: group.copy() for key, group in self.key_location_groups.items()}
+        world.resources = self.resources.copy()
+        world.version = self.version
+        world._chunk_versions = dict(self._chunk_versions)
+        return world
+
+    def add_mutation_listener(self, listener: MutationListener):
+        """
+        Listeners are called with the coordinates, old palette ids and new palette ids of every batch of writes to the world
+        """
+        self._mutation_listeners.append(listener)
+
+    def remove_mutation_listener(self, listener: MutationListener):
+        self._mutation_listeners.remove(listener)
+
+    def set_memory_budget(self, max_bytes: Optional[int], keep_radius: int = 2, spill_dir: Optional[str] = None):
+        """
+        Limits how much memory the world's voxels can take up. Once the budget is full, the least recently used chunks are compressed into a spill file and reloaded when they are touched again.
+        Chunks within keep_radius chunks of an agent set with set_agent_location are never evicted.
+        Spill files go in the world's directory if it has one, or the system temporary directory otherwise.
+        """
+        self._keep_radius = keep_radius
+        self._store.set_memory_budget(max_bytes, spill_dir if spill_dir is not None else self._store.path)
+        self._update_pinned_chunks()
+
+    def set_agent_location(self, agent_id: Any, location: StateLocation):
+        """
+        Tells the world where an agent is so that the chunks around it stay in memory
+        """
+        self._agent_locations[agent_id] = location
+        self._update_pinned_chunks()
+
+    def remove_agent_location(self, agent_id: Any):
+        self._agent_locations.pop(agent_id, None)
+        self._update_pinned_chunks()
+
+    def _update_pinned_chunks(self):
+        pinned = set()
+        offsets = range(-self._keep_radius, self._keep_radius + 1)
+        for location in self._agent_locations.values():
+            x, y, z = location.forward >> CHUNK_SHIFT, location.side >> CHUNK_SHIFT, location.up >> CHUNK_SHIFT
+            pinned.update((x + dx, y + dy, z + dz) for dx in offsets for dy in offsets for dz in offsets)
+        self._store.set_pinned(pinned)
+
+    @property
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        Hit, miss and eviction counts of the chunk store along with how many chunks are loaded and spilled
+        """
+        return self._store.stats
+
+    def chunk_version(self, key: ChunkKey) -> int:
+        """
+        Returns the world version at which the chunk last changed, or 0 if it has not changed since the world was loaded
+        """
+        return self._chunk_versions.get(key, 0)
+
+    def changes_since(self, version: int) -> Set[ChunkKey]:
+        """
+        Returns the keys of every chunk that changed after the given world version.
+        Anything derived from the world at that version only needs to be recomputed inside these chunks.
+        """
+        if version >= self.version:
+            return set()
+        return {key for key, chunk_version in self._chunk_versions.items() if chunk_version > version}
+
+    def subscribe(self, coalesce_delay: float = 0.0) -> WorldSubscription:
+        """
+        Returns a subscription that hands out the changes to the world as coalesced WorldChange batches:
+            async for change in world.subscribe():
+                invalidate(change.chunks)
+        Close the subscription once it is no longer needed.
+        """
+        subscription = WorldSubscription(self.version, self._subscriptions.remove, coalesce_delay)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def _mark_dirty(self, chunks: Set[ChunkKey], min_corner: Tuple[int, int, int], max_corner: Tuple[int, int, int]):
+        for key in chunks:
+            self._chunk_versions[key] = self.version
+        self.reachability.mark_dirty(chunks)
+        for subscription in self._subscriptions:
+            subscription._notify(self.version, chunks, min_corner, max_corner)
+
+    @staticmethod
+    def locations_to_coords(positions: Iterable[StateLocation]) -> np.ndarray:
+        """
+        Converts StateLocations into an (N, 3) array of (forward, side, up) coordinates for use with the batch methods
+        """
+        return as_coords([(position.forward, position.side, position.up) for position in positions])
+
+    @staticmethod
+    def coords_to_locations(coords: np.ndarray) -> List[StateLocation]:
+        return [StateLocation(forward=int(x), side=int(y), up=int(z)) for x, y, z in as_coords(coords)]
 
     def add_world_inventory(self, world_inventory: WorldInventory):
-        self._world_inventories.append(world_inventory)
+        self._world_inventories.insert(world_inventory.position, world_inventory)
 
     def add_fuel_inventory(self, fuel_inventory: FuelInventory):
-        self._fuel_inventories.append(fuel_inventory)
+        self._fuel_inventories.insert(fuel_inventory.position, fuel_inventory)
+
+    def get_nearest_world_inventories(self, position: StateLocation, k: int = 1, max_distance: Optional[int] = None) -> List[WorldInventory]:
+        return [inventory for _, inventory in self._world_inventories.nearest(position, k, max_distance)]
+
+    def get_world_inventories_within(self, position: StateLocation, radius: int) -> List[WorldInventory]:
+        return [inventory for _, inventory in self._world_inventories.query_radius(position, radius)]
+
+    def get_nearest_fuel_inventories(self, position: StateLocation, k: int = 1, max_distance: Optional[int] = None) -> List[FuelInventory]:
+        return [inventory for _, inventory in self._fuel_inventories.nearest(position, k, max_distance)]
+
+    def get_fuel_inventories_within(self, position: StateLocation, radius: int) -> List[FuelInventory]:
+        return [inventory for _, inventory in self._fuel_inventories.query_radius(position, radius)]
+
+    def ingest_chunk_analysis(self, analysis: 'AnalyzeChunkResData', frame: Optional['AgentFrame'] = None):
+        """
+        Records the block counts of an AnalyzeChunkResData in the resource index under the chunk column the agent was in
+        """
+        forward, side, up = analysis.location
+        if frame is not None:
+            forward, side, up = frame.to_shared_coords([analysis.location])[0].tolist()
+        self.resources.record(column_key(StateLocation(forward=forward, side=side, up=up)), analysis.counts)
+
+    def find_resource_chunks(self, names: Union[str, Iterable[str]], position: Optional[StateLocation] = None, max_distance: Optional[int] = None, n: int = 5) -> List[Tuple[ColumnKey, int]]:
+        """
+        Returns up to n chunk columns with the most of the given blocks, optionally within max_distance of position. See ChunkResourceIndex.top_chunks.
+        """
+        return self.resources.top_chunks(names, position, max_distance, n)
 
     def set_block(self, position: StateLocation, block: Optional[BlockData] = None):
         """
         If BlockData is None, then we do not know what the block is, but we know that it is not air
         """
-        if block is None:
-            self._detail_grid[position] = None
-            self._occupation_grid[position] = True
+        self._write_voxel(position.forward, position.side, position.up, self.palette.intern(block))
+
+    def set_blocks(self, blocks: Iterable[Tuple[StateLocation, Optional[BlockData]]]):
+        blocks = list(blocks)
+        if len(blocks) == 0:
+            return
+        positions, block_data = zip(*blocks)
+        self.set_block_batch(self.locations_to_coords(positions), block_data)
+
+    def set_block_batch(self, coords: np.ndarray, blocks: Sequence[Optional[BlockData]]):
+        """
+        Sets an (N, 3) array of (forward, side, up) coordinates to the matching BlockData.
+        A block of None means that the voxel is occupied by something we do not know.
+        """
+        coords = as_coords(coords)
+        if len(coords) != len(blocks):
+            raise ValueError(f"Got {len(coords)} coordinates but {len(blocks)} blocks")
+        block_ids = np.array([self.palette.intern(block) for block in blocks], dtype=np.uint16)
+        self.set_block_id_batch(coords, block_ids)
+
+    def set_scanned_blocks(self, blocks: Sequence[Tuple[int, int, int, str]], frame: Optional['AgentFrame'] = None):
+        """
+        Ingests the raw [forward, side, up, name] entries of a ScanResData without building a model for every voxel.
+        If the scan was taken in a different frame than this world uses, frame converts it into ours.
+        """
+        if len(blocks) == 0:
+            return
+        forward, side, up, names = zip(*blocks)
+        coords = np.column_stack((forward, side, up))
+        if frame is not None:
+            coords = frame.to_shared_coords(coords)
+        self.set_block_id_batch(coords, self.palette.intern_names(names))
+
+    def set_scanned_volume(self, blocks: Sequence[Tuple[int, int, int, str]], center: Tuple[int, int, int], radius: int, frame: Optional['AgentFrame'] = None):
+        """
+        Ingests a scan that only reported solid blocks. Everything within radius of center on each axis that is not in blocks is air.
+        The whole cube is written as one dense box so the air never exists as individual entries, and chunks that end up entirely air cost almost no memory.
+        """
+        min_corner = np.array(center, dtype=np.int64) - radius
+        size = 2 * radius + 1
+        block_ids = np.full((size, size, size), self.palette.intern_name("minecraft:air"), dtype=np.uint16)
+        coords = np.empty((0, 3), dtype=np.int64)
+        if len(blocks) > 0:
+            forward, side, up, names = zip(*blocks)
+            coords = np.column_stack((forward, side, up)).astype(np.int64)
+            local = coords - min_corner
+            inside = ((local >= 0) & (local < size)).all(axis=1)
+            block_ids[tuple(local[inside].T)] = self.palette.intern_names(names)[inside]
+            coords = coords[~inside]
+            names = np.asarray(names)[~inside]
+        if frame is not None:
+            # Frames only rotate about the up axis by quarter turns, so the cube stays axis aligned and we can rotate the dense array instead of every coordinate
+            corners = frame.to_shared_coords([min_corner, min_corner + size - 1])
+            rotation = frame.rotation
+            block_ids = np.transpose(block_ids, np.argmax(np.abs(rotation), axis=1))
+            for axis in range(3):
+                if rotation[axis].sum() < 0:
+                    block_ids = np.flip(block_ids, axis)
+            min_corner = corners.min(axis=0)
+        self._write_box(min_corner, np.ascontiguousarray(block_ids))
+        if len(coords) > 0:
+            # Blocks reported outside of the cube are unusual but we still want them
+            self.set_scanned_blocks([(*coord, name) for coord, name in zip(coords.tolist(), names)], frame)
+
+    def ingest_scan(self, scan: 'ScanResData', frame: Optional['AgentFrame'] = None):
+        """
+        Adds a ScanResData to the world, treating the scanned cube as known air if the scan says where it is
+        """
+        if scan.radius is not None and scan.center is not None:
+            self.set_scanned_volume(scan.blocks, scan.center, scan.radius, frame)
         else:
-            self._detail_grid[position] = block
-            self._occupation_grid[position] = block.occupied
+            self.set_scanned_blocks(scan.blocks, frame)
 
-    def set_blocks(self, blocks: List[Tuple[StateLocation, Optional[BlockData]]]):
-        for position, block in blocks:
-            self.set_block(position, block)
+    def fill_box(self, min_position: StateLocation, max_position: StateLocation, block: Optional[BlockData] = None):
+        """
+        Sets every voxel in the inclusive box between min_position and max_position to block
+        """
+        min_corner = np.array([min_position.forward, min_position.side, min_position.up], dtype=np.int64)
+        max_corner = np.array([max_position.forward, max_position.side, max_position.up], dtype=np.int64)
+        if (max_corner < min_corner).any():
+            raise ValueError(f"Box from {min_position} to {max_position} is empty")
+        self._write_box(min_corner, np.full(max_corner - min_corner + 1, self.palette.intern(block), dtype=np.uint16))
+
+    def set_block_id_batch(self, coords: np.ndarray, block_ids: np.ndarray):
+        """
+        Sets an (N, 3) array of coordinates to the matching palette ids
+        """
+        self._write(*dedupe_coords(as_coords(coords), np.asarray(block_ids, dtype=np.uint16)))
 
     def delete_block(self, position: StateLocation):
-        if position not in self._detail_grid:
+        if not self.in_world(position):
             return # We didn't have this block in the first place
-        del self._detail_grid[position]
-        del self._occupation_grid[position]
+        self._write_voxel(position.forward, position.side, position.up, BlockPalette.UNKNOWN)
+
+    def _write_voxel(self, x: int, y: int, z: int, block_id: int):
+        """
+        Every single voxel change goes through here so that the indices stay in sync with the store
+        """
+        old_id = self._store.set(x, y, z, block_id)
+        if old_id == block_id:
+            return
+        self.version += 1
+        self._block_index.update_voxel(x, y, z, old_id, block_id)
+        self.occupancy.update_voxel(x, y, z, block_id)
+        self._mark_dirty({(x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT)}, (x, y, z), (x, y, z))
+        if len(self._mutation_listeners) > 0:
+            coords = np.array([[x, y, z]], dtype=np.int64)
+            old_ids, new_ids = np.array([old_id], dtype=np.uint16), np.array([block_id], dtype=np.uint16)
+            for listener in self._mutation_listeners:
+                listener(coords, old_ids, new_ids)
+
+    def _write(self, coords: np.ndarray, block_ids: np.ndarray):
+        """
+        Batch version of _write_voxel. Coordinates must already be deduplicated.
+        """
+        old_ids = self._store.set_many(coords, block_ids)
+        changed = old_ids != block_ids
+        if not changed.any():
+            return
+        if not changed.all():
+            coords, old_ids, block_ids = coords[changed], old_ids[changed], block_ids[changed]
+        self._after_write(coords, old_ids, block_ids)
+
+    def _write_box(self, min_corner: np.ndarray, block_ids: np.ndarray):
+        """
+        Box version of _write that writes a dense 3D array of palette ids with min_corner at its [0, 0, 0]
+        """
+        old_ids = self._store.set_box(min_corner, block_ids)
+        changed = old_ids != block_ids
+        if not changed.any():
+            return
+        self._after_write(np.argwhere(changed) + min_corner, old_ids[changed], block_ids[changed])
+
+    def _after_write(self, coords: np.ndarray, old_ids: np.ndarray, block_ids: np.ndarray):
+        """
+        Brings everything derived from the store up to date with a batch of voxels that changed
+        """
+        self.version += 1
+        self._block_index.update(coords, old_ids, block_ids)
+        self.occupancy.update(coords, block_ids)
+        self._mark_dirty(changed_chunks(coords), tuple(coords.min(axis=0).tolist()), tuple(coords.max(axis=0).tolist()))
+        for listener in self._mutation_listeners:
+            listener(coords, old_ids, block_ids)
+
+    def _drop_chunks(self, keys: List[ChunkKey]):
+        """
+        Drops what was derived from chunks the store evicted, so that the indices stay within the store's memory budget
+        """
+        self._block_index.drop_chunks(keys)
+        self.occupancy.drop_chunks(keys)
+        self.reachability.drop_chunks(keys)
 
     def in_world(self, position: StateLocation) -> bool:
-        return position in self._occupation_grid
+        return self.occupancy.is_known(position.forward, position.side, position.up)
+
+    def in_world_batch(self, coords: np.ndarray) -> np.ndarray:
+        return self.occupancy.known_batch(coords)
 
     def get_block(self, position: StateLocation) -> Optional[BlockData]:
-        if position in self._detail_grid:
-            return self._detail_grid[position]
-        return None
+        return self.palette.get(self._store.get(position.forward, position.side, position.up))
+
+    def get_block_batch(self, coords: np.ndarray) -> List[Optional[BlockData]]:
+        return [self.palette.get(block_id) for block_id in self._store.get_many(coords).tolist()]
+
+    def get_block_id_batch(self, coords: np.ndarray) -> np.ndarray:
+        return self._store.get_many(coords)
 
     def is_occupied(self, position: StateLocation, assume_occupied: bool = True) -> bool:
-        if position in self._occupation_grid:
-            return self._occupation_grid[position]
-        return assume_occupied  # We leave it up to the caller to decide what to do if we don't know
+        # We leave it up to the caller to decide what to do if we don't know
+        return self.occupancy.is_occupied(position.forward, position.side, position.up, assume_occupied)
+
+    def is_occupied_batch(self, coords: np.ndarray, assume_occupied: bool = True) -> np.ndarray:
+        return self.occupancy.occupied_batch(coords, assume_occupied)
+
+    def find_block_coords(self, name: Optional[str] = None, tag: Optional[str] = None) -> np.ndarray:
+        """
+        Returns an (N, 3) array with the location of every known block with the given name and tag
+        """
+        return self._block_index.find(self.palette.find_ids(name, tag))
+
+    def find_blocks(self, name: Optional[str] = None, tag: Optional[str] = None) -> List[StateLocation]:
+        """
+        Returns the location of every known block with the given name and tag
+        """
+        return self.coords_to_locations(self.find_block_coords(name, tag))
+
+    def find_blocks_in_box(self, min_position: StateLocation, max_position: StateLocation, name: Optional[str] = None, tag: Optional[str] = None) -> List[StateLocation]:
+        """
+        Returns the location of every known block with the given name and tag inside of the inclusive box between min_position and max_position
+        """
+        min_corner = (min_position.forward, min_position.side, min_position.up)
+        max_corner = (max_position.forward, max_position.side, max_position.up)
+        return self.coords_to_locations(self._block_index.find_in_box(self.palette.find_ids(name, tag), min_corner, max_corner))
+
+    def find_nearest_block(self, position: StateLocation, name: Optional[str] = None, tag: Optional[str] = None) -> Optional[StateLocation]:
+        """
+        Returns the location of the known block with the given name and tag that is closest to position by manhattan distance
+        """
+        nearest = self._block_index.find_nearest(self.palette.find_ids(name, tag), (position.forward, position.side, position.up))
+        if nearest is None:
+            return None
+        return StateLocation(forward=int(nearest[0]), side=int(nearest[1]), up=int(nearest[2]))
 
     def add_key_group(self, key: str):
-        self.key_location_groups[key] = []
+        self.key_location_groups[key] = SpatialHash()
 
-    def add_key_location(self, key: str, position: StateLocation, data: Any):
+    def _get_key_group(self, key: str) -> SpatialHash[Any]:
         if key not in self.key_location_groups:
             raise ValueError(f"Key group {key} does not exist.")
-        self.key_location_groups[key].append((position, data))
+        return self.key_location_groups[key]
+
+    def add_key_location(self, key: str, position: StateLocation, data: Any):
+        self._get_key_group(key).insert(position, data)
+
+    def remove_key_location(self, key: str, position: StateLocation, data: Any) -> bool:
+        return self._get_key_group(key).remove(position, data)
 
     def get_key_locations(self, key: str) -> List[Tuple[StateLocation, Any]]:
-        if key not in self.key_location_groups:
-            raise ValueError(f"Key group {key} does not exist.")
-        return self.key_location_groups[key]
+        return list(self._get_key_group(key))
+
+    def get_key_locations_within(self, key: str, position: StateLocation, radius: int) -> List[Tuple[StateLocation, Any]]:
+        """
+        Returns the key locations within a manhattan distance of radius from position, closest first
+        """
+        return self._get_key_group(key).query_radius(position, radius)
+
+    def get_key_locations_in_box(self, key: str, min_position: StateLocation, max_position: StateLocation) -> List[Tuple[StateLocation, Any]]:
+        return self._get_key_group(key).query_box(min_position, max_position)
+
+    def get_nearest_key_locations(self, key: str, position: StateLocation, k: int = 1, max_distance: Optional[int] = None) -> List[Tuple[StateLocation, Any]]:
+        return self._get_key_group(key).nearest(position, k, max_distance)
 
     def show(self):
         import matplotlib.pyplot as plt
         from mpl_toolkits.mplot3d import Axes3D
-        import numpy as np
         # Render the world as a voxel grid
-        max_x = max([loc.forward for loc in self._occupation_grid.keys()])
-        min_x = min([loc.forward for loc in self._occupation_grid.keys()])
-        max_y = max([loc.up for loc in self._occupation_grid.keys()])
-        min_y = min([loc.up for loc in self._occupation_grid.keys()])
-        max_z = max([loc.side for loc in self._occupation_grid.keys()])
-        min_z = min([loc.side for loc in self._occupation_grid.keys()])
+        bounds = self._store.bounds()
+        if bounds is None:
+            return
+        (min_x, min_z, min_y), (max_x, max_z, max_y) = bounds
         ma = np.zeros((max_x - min_x + 1, max_z - min_z + 1, max_y - min_y + 1))
-        for loc, occupied in self._occupation_grid.items():
-            ma[loc.forward - min_x, loc.side - min_z, loc.up - min_y] = 1 if occupied else 0
+        for (cx, cz, cy), chunk in self._store.items():
+            x, z, y = cx * CHUNK_SIZE - min_x, cz * CHUNK_SIZE - min_z, cy * CHUNK_SIZE - min_y
+            ma[x:x + CHUNK_SIZE, z:z + CHUNK_SIZE, y:y + CHUNK_SIZE] = self.palette.occupied(chunk)
         fig = plt.figure()
         ax = fig.add_subplot(111, projection='3d')
         ax.set_aspect('equal')
@@ -206,9 +694,17 @@ class SubWorld:
 class PathPlanner:
     """
     The PathPlanner is responsible for finding paths between two positions in the world.
+    The engine picks the search. JUMP_POINT expands far fewer states than A* in open caves, shafts and two high tunnels, but costs more per state in cluttered space.
+    Engines other than BIDIRECTIONAL only search from the start, so they should be given a budget when unknown space is free.
+    If hierarchical is true then long trips through known space are planned over the chunk graph first and only refined chunk by chunk. This is many times faster on long trips, but the paths are no longer the shortest: in cluttered caves they come out 10-20% longer, so it is off by default.
+    Found paths are kept in a PathCache of up to max_cached_paths paths, which are served again until a voxel on or next to them changes. Set it to 0 to always search.
     """
-    def __init__(self, world: SubWorld):
+    def __init__(self, world: SubWorld, engine: SearchEngine = SearchEngine.BIDIRECTIONAL, hierarchical: bool = False, max_cached_paths: int = DEFAULT_MAX_PATHS):
         self.world = world
+        self.engine = engine
+        self.hierarchical = hierarchical
+        self.chunk_graph = ChunkGraph(world)
+        self.path_cache = PathCache(world, max_cached_paths) if max_cached_paths > 0 else None
 
     def state_distance(self, start_state: AgentState, end_state: AgentState):
         """
@@ -223,80 +719,194 @@ class PathPlanner:
         """
         Free state neighbors are neighbors of state that are in and not occupied by the world
         """
-        return [neighbor for neighbor in state.neighbors() if not self.world.is_occupied(neighbor.location, assume_occupied=assume_occupied)]
+        occupancy = self.world.occupancy
+        return [
+            neighbor for neighbor in state.neighbors()
+            if not occupancy.is_occupied(neighbor.location.forward, neighbor.location.side, neighbor.location.up, assume_occupied)
+        ]
 
-    def reject_out_of_plane_factory(self, start_state: AgentState):
+    def may_reach(self, start_state: AgentState, goal_locations: List[StateLocation], assume_occupied: bool = True) -> bool:
+        """
+        Uses the world's reachability index to rule out searches that cannot succeed. Only returns False if no goal can possibly be reached.
+        Without this, an unreachable goal makes A* expand every free state it can find, which never ends if unknown space counts as free.
+        """
+        reachability = self.world.reachability
+        location = start_state.location
+        start = (location.forward, location.side, location.up)
+        if any(goal == location for goal in goal_locations):
+            return True
+        start_component = reachability.component(*start)
+        if start_component is not None:
+            start_components = {start_component}
+        else:
+            # The agent can be standing somewhere we think is occupied, in which case it can move into any free neighbor
+            start_components = set()
+            for offset in ((1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)):
+                neighbor = (start[0] + offset[0], start[1] + offset[1], start[2] + offset[2])
+                if not assume_occupied and not self.world.occupancy.is_known(*neighbor):
+                    return True
+                component = reachability.component(*neighbor)
+                if component is not None:
+                    start_components.add(component)
+        if not assume_occupied and any(reachability.is_open(component) for component in start_components):
+            return True  # The agent can leave through unknown space so we can not rule anything out
+        return any(reachability.component(goal.forward, goal.side, goal.up) in start_components for goal in goal_locations)
+
+    def reject_out_of_plane_factory(self, start_state: AgentState) -> OutOfPlaneFilter:
         """
         Returns a function that rejects states that are not in the same plane as start_state
         """
-        def reject_out_of_plane(state: AgentState):
-            return state.location.up != start_state.location.up
-        return reject_out_of_plane
+        return OutOfPlaneFilter(start_state.location.up)
 
-    def _run_state_A_star(self,
+    def _run_state_search(self,
         start_state: AgentState,
-        at_goal: Callable[[AgentState], bool],  # Returns true if the state is a goal state
-        heuristic: Callable[[AgentState], float],  # Returns the heuristic distance from the state to the goal. Should underestimate the distance
+        goal: Goal,
         assume_occupied: bool = True,  # If true, then we assume that any unknown blocks are occupied. This is good if we want to ensure the agent doesn't get stuck, but is restrictive if the agent is a scanner
-        reject_neighbors: Optional[Callable[[AgentState], bool]] = None  
-    ) -> Optional[List[AgentState]]:
+        reject_neighbors: Optional[Callable[[AgentState], bool]] = None,
+        budget: Optional[SearchBudget] = None
+    ) -> PlanResult:
         """
-        Runs A* on the state space graph
-        TODO: We are in an infinite world so this can cause an infinite loop.
-            To solve this, we need to run A* from both the start and end states and stop when we find a common state.
-            If one or the other runs out of states, then we know that there is no path.
-            This works since there are no infinite walls in the world so one or the other is enclosed if there is no path
+        Searches the state space graph from the start and the goal states at once, with every state packed into an int. See worlds.__search.
+        We are in an infinite world, so a search from the start alone never ends if the goal is enclosed and unknown space is free.
+        Searching from both ends stops as soon as either side runs out of states, and since there are no infinite walls in the world one side or the other is enclosed if there is no path.
+        Goals too large to list and the engines other than BIDIRECTIONAL search from the start alone, so those searches should be given a budget.
+        A goal too large to list gets UNLISTED_GOAL_BUDGET if it was not given one, since the bidirectional search it was meant for can not bound it.
         """
+        started = time.perf_counter()
         if not self.world.in_world(start_state.location):
             print(f"Start state {start_state} is not in the world")
-            return None
+            return PlanResult(PlanStatus.NO_PATH)
 
-        open = PriorityQueue()
-        closed = {}
-        open.put((0, (start_state, None, 0)))
-        while (not open.empty()):
-            _, (state, parent, path_cost) = open.get()
-            # print(f"Exploring {state} with parent {parent} and path cost {path_cost}")
-            if state in closed:
-                continue
-            if at_goal(state):
-                path = [state]
-                while parent is not None:
-                    path.append(parent)
-                    parent = closed[parent]
-                path.reverse()
-                return path
-            
-            closed[state] = parent
-            for neighbor in self.get_free_state_neighbors(state, assume_occupied):
-                # if at_goal(neighbor):
-                #     print("Found goal state as neighbor")
-                if reject_neighbors is not None and reject_neighbors(neighbor):
-                    # print(f"\tRejecting neighbor {neighbor}")
-                    continue
-                if neighbor not in closed:
-                    # print(f"\tAdding neighbor {neighbor}")
-                    open.put((path_cost + 1 + heuristic(neighbor), (neighbor, state, path_cost + 1)))
-
-        return None
+        is_free = free_space(self.world.occupancy, assume_occupied)
+        start = state_from_agent_state(start_state)
+        goal_states = goal.goal_states() if self.engine == SearchEngine.BIDIRECTIONAL else None
+        if goal_states is not None:
+            status, path, expansions = bidirectional_search(start, goal_states, goal.heuristic(), is_free, packed_filter(reject_neighbors), budget)
+        elif self.engine == SearchEngine.BIDIRECTIONAL:
+            status, path, expansions = a_star(start, goal.is_goal, goal.heuristic(), is_free, packed_filter(reject_neighbors), budget if budget is not None else UNLISTED_GOAL_BUDGET)
+        elif self.engine == SearchEngine.JUMP_POINT:
+            is_known = None if assume_occupied else self.world.occupancy.is_known
+            status, path, expansions = jump_point_search(start, goal.is_goal, goal.heuristic(), is_free, packed_filter(reject_neighbors), budget, is_known)
+        else:
+            status, path, expansions = a_star(start, goal.is_goal, goal.heuristic(), is_free, packed_filter(reject_neighbors), budget)
+        return PlanResult(
+            status,
+            None if path is None else [state_to_agent_state(state) for state in path],
+            expansions,
+            time.perf_counter() - started
+        )
 
-    def find_state_path(self, start_state: AgentState, end_state: AgentState, assume_occupied: bool = True, reject_neighbors: Optional[Callable[[AgentState], bool]] = None):
+    def _run_hierarchical_search(self, start_state: AgentState, goal: Goal, locations: List[StateLocation], budget: Optional[SearchBudget] = None) -> PlanResult:
         """
-        Finds the shortest path in time between two states by taking into account location and orientation changes in the graph search
+        Picks the chunks to go through on the chunk graph and then searches one chunk at a time, from where the last search ended to where the path enters the next chunk.
+        Returns NO_PATH along with what it spent if the chunk graph can not help, in which case the caller should search directly with what is left of the budget.
+        The budget covers the whole plan, so every segment only gets what the ones before it left over.
+        """
+        started = time.perf_counter()
+        start = (start_state.location.forward, start_state.location.side, start_state.location.up)
+        nodes, expansions = self.chunk_graph.abstract_path(start, [(location.forward, location.side, location.up) for location in locations])
+        if nodes is None:
+            return PlanResult(PlanStatus.NO_PATH, None, expansions, time.perf_counter() - started)
+        # Each search covers the next few chunks of the path and ends where the path enters the chunk after them
+        chunks = [chunk_of(node) for node in nodes]
+        entries = [index for index in range(1, len(nodes)) if chunks[index] != chunks[index - 1]]
+        path = [start_state]
+        first = 0
+        for entry in entries[REFINE_CHUNKS - 1::REFINE_CHUNKS] + [None]:
+            location = path[-1].location
+            keys = set(chunks[first:] if entry is None else chunks[first:entry + 1])
+            keys.add(chunk_of((location.forward, location.side, location.up)))
+            if entry is None:
+                segment_goal = goal
+            else:
+                target = nodes[entry]
+                segment_goal = LocationGoal([StateLocation(forward=target[0], side=target[1], up=target[2])])
+                first = entry
+            segment_budget = None if budget is None else budget.remaining(expansions, time.perf_counter() - started)
+            if segment_budget is not None and segment_budget.exhausted is not None:
+                return PlanResult(segment_budget.exhausted, None, expansions, time.perf_counter() - started)
+            segment = self._run_state_search(path[-1], segment_goal, True, ChunkFilter(keys), segment_budget)
+            expansions += segment.expansions
+            if segment.budget_exceeded:
+                return PlanResult(segment.status, None, expansions, time.perf_counter() - started)
+            if not segment.found:
+                return PlanResult(PlanStatus.NO_PATH, None, expansions, time.perf_counter() - started)
+            path.extend(segment.path[1:])
+        return PlanResult(PlanStatus.FOUND, path, expansions, time.perf_counter() - started)
+
+    def plan_to_goal(self, start_state: AgentState, goal: Goal, assume_occupied: bool = True, reject_neighbors: Optional[Callable[[AgentState], bool]] = None, budget: Optional[SearchBudget] = None) -> PlanResult:
+        """
+        Finds the shortest path in time from start_state to anywhere that reaches goal, giving up once the budget runs out
+        """
+        goal_states, locations = goal.goal_states(), goal.locations()
+        if (goal_states is not None and len(goal_states) == 0) or (locations is not None and len(locations) == 0):
+            print(f"{goal} has nowhere to reach")
+            return PlanResult(PlanStatus.NO_PATH)
+        goal_key = goal.cache_key() if self.path_cache is not None else None
+        if goal_key is None or not isinstance(reject_neighbors, Hashable):
+            return self._plan_uncached(start_state, goal, assume_occupied, reject_neighbors, budget)
+        started = time.monotonic()
+        path = self.path_cache.get(start_state, goal_key, assume_occupied, reject_neighbors)
+        if path is not None:
+            return PlanResult(PlanStatus.FOUND, path, seconds=time.monotonic() - started)
+        result = self._plan_uncached(start_state, goal, assume_occupied, reject_neighbors, budget)
+        if result.found:
+            self.path_cache.put(start_state, goal_key, assume_occupied, reject_neighbors, result.path)
+        return result
+
+    def _plan_uncached(self, start_state: AgentState, goal: Goal, assume_occupied: bool, reject_neighbors: Optional[Callable[[AgentState], bool]], budget: Optional[SearchBudget]) -> PlanResult:
+        locations = goal.locations()
+        if locations is not None and not self.may_reach(start_state, locations, assume_occupied):
+            print(f"{goal} can not be reached from {start_state}")
+            return PlanResult(PlanStatus.NO_PATH)
+        if self.hierarchical and assume_occupied and reject_neighbors is None and locations is not None and 0 < len(locations) <= MAX_HIERARCHICAL_GOALS:
+            location = start_state.location
+            if goal.heuristic()(location.forward, location.side, location.up, 0) >= MIN_HIERARCHICAL_DISTANCE:
+                refined = self._run_hierarchical_search(start_state, goal, locations, budget)
+                if refined.found or refined.budget_exceeded:
+                    return refined
+                # The direct search only gets what the failed refinement left over, so a plan never spends more than its budget
+                if budget is not None:
+                    budget = budget.remaining(refined.expansions, refined.seconds)
+                    if budget.exhausted is not None:
+                        return PlanResult(budget.exhausted, None, refined.expansions, refined.seconds)
+                result = self._run_state_search(start_state, goal, assume_occupied, reject_neighbors, budget)
+                result.expansions += refined.expansions
+                result.seconds += refined.seconds
+                return result
+        return self._run_state_search(start_state, goal, assume_occupied, reject_neighbors, budget)
+
+    def plan_state_path(self, start_state: AgentState, end_state: AgentState, assume_occupied: bool = True, reject_neighbors: Optional[Callable[[AgentState], bool]] = None, budget: Optional[SearchBudget] = None) -> PlanResult:
+        """
+        Like find_state_path but gives up once the budget runs out and says why there is no path in the PlanResult
         """
         if not self.world.in_world(end_state.location):
             print(f"End state {end_state} is not in world")
-            return None
+            return PlanResult(PlanStatus.NO_PATH)
+        return self.plan_to_goal(start_state, StateGoal([end_state]), assume_occupied, reject_neighbors, budget)
 
-        def at_goal(state: AgentState):
-            if end_state.orientation is not None:
-                return state == end_state
-            else:
-                return state.location == end_state.location
+    def plan_state_path_to_any(self, start_state: AgentState, end_states: List[AgentState], assume_occupied: bool = True, reject_neighbors: Optional[Callable[[AgentState], bool]] = None, budget: Optional[SearchBudget] = None) -> PlanResult:
+        """
+        Like find_state_path_to_any but gives up once the budget runs out and says why there is no path in the PlanResult
+        """
+        return self.plan_to_goal(start_state, StateGoal(end_states), assume_occupied, reject_neighbors, budget)
 
-        heuristic = lambda state: self.state_distance(state, end_state)
+    def incremental_planner(self, goal: Union[Goal, List[AgentState]], assume_occupied: bool = True, reject_neighbors: Optional[Callable[[AgentState], bool]] = None) -> IncrementalPlanner:
+        """
+        Returns a planner for repeatedly finding paths to a goal or to any of a list of end states from wherever the agent is, which only repairs its search after the world changes instead of starting over.
+        Close it once it is no longer needed.
+        """
+        if not isinstance(goal, Goal):
+            goal = StateGoal(goal)
+        locations = goal.locations()
+        may_reach = None if locations is None else lambda start_state: self.may_reach(start_state, locations, assume_occupied)
+        return IncrementalPlanner(self.world, goal, assume_occupied, reject_neighbors, may_reach)
 
-        return self._run_state_A_star(start_state, at_goal, heuristic, assume_occupied, reject_neighbors)
+    def find_state_path(self, start_state: AgentState, end_state: AgentState, assume_occupied: bool = True, reject_neighbors: Optional[Callable[[AgentState], bool]] = None):
+        """
+        Finds the shortest path in time between two states by taking into account location and orientation changes in the graph search
+        """
+        return self.plan_state_path(start_state, end_state, assume_occupied, reject_neighbors).path
 
     def find_state_path_to_any(self, start_state: AgentState, end_states: List[AgentState], assume_occupied: bool = True, reject_neighbors: Optional[Callable[[AgentState], bool]] = None):
         """
@@ -304,19 +914,13 @@ class PathPlanner:
         This task can be conceptualized as adding an edge of 0 weight between every end state and some imagined "goal". This immediately works with Dijkstra's algorithm, but we can also use A* by choosing a valid heuristic.
         One such valid heuristic is the minimum distance to any of the end states as that still underestimates the true minimum distance.
         """
-        def at_goal(state: AgentState):
-            for end_state in end_states:
-                if end_state.orientation is not None:
-                    if state == end_state:
-                        return True
-                else:
-                    if state.location == end_state.location:
-                        return True
-            return False
-
-        heuristic = lambda state: min([self.state_distance(state, end_state) for end_state in end_states])
+        return self.plan_state_path_to_any(start_state, end_states, assume_occupied, reject_neighbors).path
 
-        return self._run_state_A_star(start_state, at_goal, heuristic, assume_occupied, reject_neighbors)
+    def find_path_to_goal(self, start_state: AgentState, goal: Goal, assume_occupied: bool = True, reject_neighbors: Optional[Callable[[AgentState], bool]] = None, budget: Optional[SearchBudget] = None) -> Optional[List[AgentState]]:
+        """
+        Finds the shortest path in time to a goal such as a LocationGoal, BoxGoal or AdjacentBlockGoal. Goal tests are O(1) so a goal with many locations costs about as much to search for as one location.
+        """
+        return self.plan_to_goal(start_state, goal, assume_occupied, reject_neighbors, budget).path
 
 def test():
     from models.__agent_models import AgentState, StateLocation, StateOrientation
@@ -351,5 +955,72 @@ def test():
     for state in path:
         print(state)
 
+def test_rejected_goal():
+    """
+    A goal that reject_neighbors rules out is never reached, whichever engine plans the path
+    """
+    from models.__agent_models import AgentState, StateLocation, StateOrientation
+    test_world = SubWorld()
+    for forward in range(5):
+        for side in range(2):
+            test_world.set_block(StateLocation(forward=forward, side=side, up=0), BlockData(name="minecraft:air"))
+    test_world.set_block(StateLocation(forward=4, side=0, up=1), BlockData(name="minecraft:air"))
+    start_state = AgentState(location=StateLocation(forward=0, side=0, up=0), orientation=StateOrientation(forward=1, side=0, up=0))
+    end_state = AgentState(location=StateLocation(forward=4, side=0, up=1))
+
+    for engine in SearchEngine:
+        path_planner = PathPlanner(test_world, engine=engine)
+        reject_out_of_plane = path_planner.reject_out_of_plane_factory(start_state)
+        path = path_planner.find_state_path(start_state, end_state, reject_neighbors=reject_out_of_plane)
+        assert path is None, f"{engine.value} found {path}"
+        path = path_planner.find_state_path_to_any(start_state, [end_state], reject_neighbors=reject_out_of_plane)
+        assert path is None, f"{engine.value} found {path}"
+        assert path_planner.find_state_path(start_state, end_state) is not None
+    print("Rejected goals are not reached")
+
+def test_empty_goal():
+    """
+    A goal with nowhere to reach has no path, whichever engine plans the path and however unknown space is treated
+    """
+    from models.__agent_models import AgentState, StateLocation, StateOrientation
+    from .__goals import AdjacentBlockGoal
+    test_world = SubWorld()
+    for forward in range(3):
+        test_world.set_block(StateLocation(forward=forward, side=0, up=0), BlockData(name="minecraft:air"))
+    start_state = AgentState(location=StateLocation(forward=0, side=0, up=0), orientation=StateOrientation(forward=1, side=0, up=0))
+
+    for engine in SearchEngine:
+        path_planner = PathPlanner(test_world, engine=engine)
+        for goal in (LocationGoal([]), AdjacentBlockGoal(test_world, name="minecraft:diamond_ore")):
+            for assume_occupied in (True, False):
+                result = path_planner.plan_to_goal(start_state, goal, assume_occupied=assume_occupied)
+                assert result.status == PlanStatus.NO_PATH, f"{engine.value}: {result.status.value}"
+    print("Empty goals have no path")
+
+def test_unknown_space_is_free():
+    """
+    Searches that treat unknown space as free stay within their budget even though that space never ends
+    """
+    from models.__agent_models import AgentState, StateLocation, StateOrientation
+    test_world = SubWorld()
+    for forward in range(5):
+        test_world.set_block(StateLocation(forward=forward, side=0, up=0), BlockData(name="minecraft:stone" if forward == 2 else "minecraft:air"))
+    start_state = AgentState(location=StateLocation(forward=0, side=0, up=0), orientation=StateOrientation(forward=1, side=0, up=0))
+    enclosed_state = AgentState(location=StateLocation(forward=2, side=0, up=0))
+    reachable_state = AgentState(location=StateLocation(forward=4, side=0, up=0))
+    budget = SearchBudget(max_expansions=1000, max_seconds=1.0)
+
+    for engine in SearchEngine:
+        path_planner = PathPlanner(test_world, engine=engine)
+        started = time.perf_counter()
+        result = path_planner.plan_state_path(start_state, enclosed_state, assume_occupied=False, budget=budget)
+        assert not result.found and time.perf_counter() - started < 2 * budget.max_seconds, f"{engine.value}: {result.status.value}"
+        result = path_planner.plan_state_path(start_state, reachable_state, assume_occupied=False, budget=budget)
+        assert result.found, f"{engine.value}: {result.status.value}"
+    print("Searches through unknown space stay within their budget")
+
 if __name__ == "__main__":
-    test()
\ No newline at end of file
+    test()
+    test_rejected_goal()
+    test_empty_goal()
+    test_unknown_space_is_free()
\ No newline at end of file